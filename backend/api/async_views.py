@@ -0,0 +1,227 @@
+"""
+Async views for ASGI serving (backend_project/asgi.py).
+
+Under ASGI a plain sync view runs in Django's single thread for sync code, so
+one prediction being decoded holds up every other request in the process.
+The views here split the request instead:
+
+* the event loop receives the upload (Django reads the whole body before the
+  view runs), so slow mobile uploads cost a socket and a spooled file, not a
+  thread,
+* multipart parsing and PIL decode run on ``blocking_executor``, a bounded
+  thread pool (``ASYNC_SERVING['EXECUTOR_WORKERS']`` threads; beyond
+  ``MAX_PENDING`` queued calls requests get 503),
+* inference awaits the micro-batcher's future, so no thread waits on the
+  inference workers,
+* ORM work (Diagnosis and list queries, and authentication for tokens
+  without claims, see api/authentication.py) goes through
+  ``sync_to_async``, in one call per step. Django's ORM has no async driver,
+  so it runs in the same sync thread a sync view would use.
+
+api/urls.py routes ``/api/predict/``, ``/api/history/`` and ``/api/reviews/``
+here when ``ASYNC_SERVING['ENABLED']`` is set, which asgi.py does.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from PIL import UnidentifiedImageError
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .authentication import UserPrincipal
+from .batching import QueueFullError
+from .jobs import JobServerUnavailable
+from .metrics import timed
+from .model_registry import ModelNotReady, batcher, registry
+from .persistence import is_deferred
+from .prediction_cache import prediction_cache
+from .preprocessing import ImageTooLarge, load_image_array
+from .views import (
+    NO_DIAGNOSIS_MESSAGE, DiagnosisHistoryView, PredictionView, ReviewList, build_prediction_response,
+    get_skin_type, save_diagnosis, stored_result,
+)
+
+
+class BlockingExecutor:
+    """Thread pool for blocking calls from async views, with a cap on calls waiting or running."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._pending = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: the parent's threads do not exist here.
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_SERVING['EXECUTOR_WORKERS'], thread_name_prefix='async-blocking',
+                )
+                self._pid = os.getpid()
+                self._pending = 0
+            if self._pending >= settings.ASYNC_SERVING['MAX_PENDING']:
+                raise QueueFullError(f'Too many blocking calls pending ({self._pending}).')
+            self._pending += 1
+            return self._executor
+
+    async def run(self, fn, *args):
+        executor = self._get_executor()
+        try:
+            # The context is copied so timed() stages still reach the request's Server-Timing.
+            call = functools.partial(contextvars.copy_context().run, fn, *args)
+            return await asyncio.get_running_loop().run_in_executor(executor, call)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self):
+        return {
+            'workers': settings.ASYNC_SERVING['EXECUTOR_WORKERS'],
+            'pending': self._pending if self._pid == os.getpid() else 0,
+        }
+
+
+blocking_executor = BlockingExecutor()
+
+
+def cached_scores(img_array):
+    key = prediction_cache.make_key(img_array, registry.get_model_version())
+    return key, prediction_cache.get(key)
+
+
+async def apredict_scores(img_array):
+    """``predict_scores`` without holding a thread while the batch runs."""
+    # The model version may stat or hash the model file, and the shared cache tier may be on disk.
+    key, scores = await blocking_executor.run(cached_scores, img_array)
+    if scores is None:
+        future = batcher.submit(img_array)
+        # On timeout wait_for cancels the future, and the batcher then skips the row.
+        scores = await asyncio.wait_for(asyncio.wrap_future(future), batcher.timeout)
+        await blocking_executor.run(prediction_cache.set, key, scores)
+    return scores
+
+
+class AsyncAPIView(APIView):
+    """APIView whose handlers are coroutines; DRF's authentication and permission checks run in the sync thread."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncListMixin:
+    async def get(self, request, *args, **kwargs):
+        # Query, pagination and serialization in one trip to the sync thread.
+        return await sync_to_async(self.list)(request, *args, **kwargs)
+
+
+class AsyncPredictionView(AsyncAPIView, PredictionView):
+    __doc__ = PredictionView.__doc__
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            return await self.predict(request)
+        except QueueFullError:
+            return Response({"error": "The server is busy. Please try again shortly."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def parse(self, request):
+        with timed('upload'):
+            return (
+                request.FILES.get('image'),
+                request.POST.get('async', 'false').lower() == 'true',
+                request.POST.get('is_example', 'false').lower() == 'true',
+            )
+
+    async def predict(self, request):
+        image_file, is_async, is_example = await blocking_executor.run(self.parse, request)
+        labels = None
+        if not is_async:
+            try:
+                labels = await blocking_executor.run(registry.get_labels)
+            except ModelNotReady:
+                return Response({"error": "Model or labels not loaded properly."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if not image_file:
+            rejections = getattr(request, 'upload_rejections', None)
+            if rejections:
+                return Response({"error": rejections[0]['error']}, status=rejections[0]['status'])
+            return Response({"error": "No image provided."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            try:
+                with timed('decode'):
+                    img_array = await blocking_executor.run(load_image_array, image_file)
+            except ImageTooLarge as e:
+                return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            except UnidentifiedImageError:
+                return Response({"error": "The uploaded file is not a supported image."}, status=status.HTTP_400_BAD_REQUEST)
+
+            if is_async:
+                return await sync_to_async(self.submit_job)(request, image_file, img_array, is_example)
+
+            try:
+                with timed('inference'):
+                    scores = await apredict_scores(img_array)
+            except TimeoutError:
+                return Response({"error": "Prediction timed out. Please try again."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except JobServerUnavailable:
+                return Response({"error": "The inference service is unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except ModelNotReady:
+                return Response({"error": "Model or labels not loaded properly."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            if isinstance(request.user, UserPrincipal):
+                skin_type = get_skin_type(request.user)
+            else:
+                skin_type = await sync_to_async(get_skin_type)(request.user)
+            response_data = build_prediction_response(scores, labels, skin_type)
+            if response_data is None:
+                return Response({"prediction": NO_DIAGNOSIS_MESSAGE}, status=status.HTTP_200_OK)
+
+            if not is_example:
+                result = stored_result(response_data, skin_type)
+                if is_deferred():
+                    # Only files are written; keep it off the ORM thread.
+                    await blocking_executor.run(save_diagnosis, request.user.id, result, image_file)
+                else:
+                    await sync_to_async(save_diagnosis)(request.user.id, result, image_file)
+
+            return Response(response_data, status=status.HTTP_200_OK)
+
+        except QueueFullError:
+            raise
+        except Exception as e:
+            return Response({"error": f"An error occurred during prediction: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncDiagnosisHistoryView(AsyncListMixin, AsyncAPIView, DiagnosisHistoryView):
+    pass
+
+
+class AsyncReviewList(AsyncListMixin, AsyncAPIView, ReviewList):
+    pass
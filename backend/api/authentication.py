@@ -0,0 +1,134 @@
+"""
+JWT authentication without loading the User row.
+
+simplejwt's ``JWTAuthentication`` runs a ``SELECT`` on ``auth_user`` for every
+request, and ``get_skin_type`` then loads the profile. Access tokens issued by
+``MyTokenObtainPairSerializer`` already carry ``username``, ``is_staff`` and
+``skin_type`` claims, so ``ClaimsJWTAuthentication`` builds a ``UserPrincipal``
+from them instead and the request runs no authentication queries.
+
+Claims are fixed when the token is issued at login (the ``auth_time``
+claim), and refreshed access tokens copy them from the refresh token. The
+cache (``AUTH_PRINCIPAL['CACHE_ALIAS']``) holds the current values of users
+whose User or Profile changed since then (api/signals.py writes them on
+commit). Those entries outlive any token issued before the change, and they
+are always used instead of the claims.
+
+A cache may still lose an entry (culled when full), and the claims of a
+deleted or deactivated user must not be trusted again. So each change also
+stores the time of that user's latest change under a key of its own. A user
+whose entry is gone but whose change time is newer than the token's claims
+is loaded from the database: User and Profile in one query, cached for
+``AUTH_PRINCIPAL['TTL_SECONDS']``. Tokens without the claims (issued before
+they were added) are loaded the same way. Changes to one user never cost
+other users a query.
+
+A ``UserPrincipal`` is not a ``User``: views using this class refer to the
+user by ``request.user.id``.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+PRINCIPAL_CLAIMS = ('username', 'is_staff', 'skin_type')
+# When the claims were read from the database; set by MyTokenObtainPairSerializer.
+CLAIMS_TIME_CLAIM = 'auth_time'
+
+
+class UserPrincipal:
+    """The authenticated user, as known from the token claims or the cache."""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username, is_staff, skin_type, is_active=True):
+        self.id = id
+        self.username = username
+        self.is_staff = is_staff
+        self.skin_type = skin_type
+        self.is_active = is_active
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.username
+
+    def __eq__(self, other):
+        return isinstance(other, UserPrincipal) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def principal_cache():
+    return caches[settings.AUTH_PRINCIPAL['CACHE_ALIAS']]
+
+
+def principal_key(user_id):
+    return f'auth:principal:{user_id}'
+
+
+def last_change_key(user_id):
+    return f'auth:last_change:{user_id}'
+
+
+def principal_data(user, skin_type):
+    return {'username': user.username, 'is_staff': user.is_staff, 'is_active': user.is_active, 'skin_type': skin_type}
+
+
+def remember_principal(user_id, data):
+    """Store the current values of a changed user for as long as a token issued before the change is valid."""
+    timeout = (api_settings.REFRESH_TOKEN_LIFETIME + api_settings.ACCESS_TOKEN_LIFETIME).total_seconds()
+    # A second key, so a culled entry still leaves a record that the claims are stale.
+    principal_cache().set_many({principal_key(user_id): data, last_change_key(user_id): time.time()}, timeout)
+
+
+def claims_are_current(user_id, validated_token):
+    """Whether the token carries the claims and they were read after the user's latest change."""
+    if not all(claim in validated_token for claim in PRINCIPAL_CLAIMS):
+        return False
+    changed_at = principal_cache().get(last_change_key(user_id))
+    # auth_time is in whole seconds, so a token from the second of a change is not trusted.
+    return changed_at is None or validated_token.get(CLAIMS_TIME_CLAIM, 0) > changed_at
+
+
+def load_principal(user_id):
+    user = User.objects.select_related('profile').filter(pk=user_id).first()
+    if user is None:
+        return None
+    profile = getattr(user, 'profile', None)
+    data = principal_data(user, profile.skin_type if profile else None)
+    # add(), so a change stored meanwhile by remember_principal() is not overwritten.
+    principal_cache().add(principal_key(user_id), data, settings.AUTH_PRINCIPAL['TTL_SECONDS'])
+    return data
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            # The claim is a string; views compare it with integer ids.
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValidationError):
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        data = principal_cache().get(principal_key(user_id))
+        if data is None:
+            # The user's entry may have been culled; claims older than its change time are not trusted.
+            if claims_are_current(user_id, validated_token):
+                data = {claim: validated_token[claim] for claim in PRINCIPAL_CLAIMS}
+            else:
+                data = load_principal(user_id)
+                if data is None:
+                    raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if not data.get('is_active', True):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return UserPrincipal(user_id, data['username'], data['is_staff'], data['skin_type'])
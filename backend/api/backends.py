@@ -0,0 +1,192 @@
+"""
+Pluggable inference backends for the skin CNN.
+
+Every backend takes a (N, 100, 125, 3) batch of RGB pixels in the 0-255 range
+and returns (N, num_classes) softmax scores as float32. Backends import their
+runtime lazily in ``load()``, so a worker configured for ONNX Runtime or
+TFLite, or the pure-NumPy implementation, never imports TensorFlow.
+
+The backend is chosen with ``INFERENCE['BACKEND']`` in settings.py. ONNX and
+TFLite model files are produced from ``keras.h5`` by
+``python manage.py export_model``.
+
+``intra_op_threads`` and ``inter_op_threads`` size the runtime's thread
+pools (0 keeps the runtime's default of one thread per core). The NumPy
+backend runs on BLAS, whose pool is sized by ``OPENBLAS_NUM_THREADS`` /
+``OMP_NUM_THREADS`` when NumPy is imported.
+"""
+import os
+import threading
+
+import numpy as np
+
+IMAGE_HEIGHT = 100
+IMAGE_WIDTH = 125
+CHANNELS = 3
+
+
+class BackendUnavailable(Exception):
+    """Raised when a backend's runtime or model file is missing."""
+
+
+class InferenceBackend:
+    name = None
+    filename = None
+
+    def __init__(self, model_path, num_classes, intra_op_threads=0, inter_op_threads=0):
+        self.model_path = model_path
+        self.num_classes = num_classes
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    def load(self):
+        raise NotImplementedError
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+    def __call__(self, batch):
+        return self.predict(batch)
+
+    def warm_up(self, batch_size=1):
+        self.predict(np.zeros((batch_size, IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS), dtype=np.float32))
+
+    def _check_model_file(self):
+        if not os.path.exists(self.model_path):
+            raise BackendUnavailable(f'Model file not found for {self.name} backend: {self.model_path}')
+
+
+class KerasBackend(InferenceBackend):
+    name = 'keras'
+    filename = 'keras.h5'
+
+    def load(self):
+        self._check_model_file()
+        from .keras_model import CompiledPredictor, configure_threads, load_model
+
+        configure_threads(self.intra_op_threads, self.inter_op_threads)
+        self.predictor = CompiledPredictor(load_model(self.model_path, self.num_classes))
+        return self
+
+    def predict(self, batch):
+        return self.predictor(batch)
+
+
+class OnnxBackend(InferenceBackend):
+    name = 'onnx'
+    filename = 'model.onnx'
+
+    def load(self):
+        self._check_model_file()
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise BackendUnavailable('The onnx backend requires the onnxruntime package.') from e
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        self.session = onnxruntime.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        return self
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class TFLiteBackend(InferenceBackend):
+    name = 'tflite'
+    filename = 'model.tflite'
+
+    def load(self):
+        self._check_model_file()
+        self.interpreter = self._make_interpreter()
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.interpreter.allocate_tensors()
+        self._batch_size = None
+        # A TFLite interpreter must not be invoked from two threads at once.
+        self._lock = threading.Lock()
+        return self
+
+    def _make_interpreter(self):
+        return self._interpreter_class()(model_path=self.model_path, num_threads=self.intra_op_threads or None)
+
+    @staticmethod
+    def _interpreter_class():
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                try:
+                    import tensorflow as tf
+                except ImportError as e:
+                    raise BackendUnavailable(
+                        'The tflite backend requires ai-edge-litert, tflite-runtime or tensorflow.'
+                    ) from e
+                Interpreter = tf.lite.Interpreter
+        return Interpreter
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+
+class NumpyBackend(InferenceBackend):
+    """Reads keras.h5 with h5py and runs the forward pass in NumPy (see api/numpy_cnn.py)."""
+    name = 'numpy'
+    filename = 'keras.h5'
+
+    def load(self):
+        self._check_model_file()
+        try:
+            from .numpy_cnn import NumpySkinCNN
+            self.network = NumpySkinCNN.from_h5(self.model_path)
+        except ImportError as e:
+            raise BackendUnavailable('The numpy backend requires the h5py package.') from e
+        if self.network.num_classes != self.num_classes:
+            raise BackendUnavailable(
+                f'{self.model_path} has {self.network.num_classes} outputs but {self.num_classes} labels are configured.'
+            )
+        return self
+
+    def predict(self, batch):
+        return self.network.predict(batch)
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    OnnxBackend.name: OnnxBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    NumpyBackend.name: NumpyBackend,
+}
+
+
+def backend_class(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise BackendUnavailable(f"Unknown inference backend '{name}'. Choose one of: {', '.join(BACKENDS)}.")
+
+
+def model_file(name, model_dir):
+    """The model file the backend registered under ``name`` loads from ``model_dir``."""
+    return os.path.join(model_dir, backend_class(name).filename)
+
+
+def load_backend(name, model_dir, num_classes, model_path=None, intra_op_threads=0, inter_op_threads=0):
+    """Instantiate and load the backend registered under ``name``."""
+    if model_path is None:
+        model_path = model_file(name, model_dir)
+    return backend_class(name)(model_path, num_classes, intra_op_threads, inter_op_threads).load()
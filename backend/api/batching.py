@@ -0,0 +1,212 @@
+"""
+Dynamic micro-batching for model inference.
+
+Concurrent requests each submit one preprocessed image. A background
+thread collects them and runs them through the model as one batch as soon as
+either ``max_batch_size`` rows are waiting or the oldest row has waited
+``max_wait_ms``. The per-row scores are then handed back to the waiting
+requests through futures.
+
+With ``concurrency`` above 1, that many threads take turns collecting, so
+one batch can be collected while others are still running (e.g. one per
+worker process of the inference pool, see api/jobs.py).
+
+``shutdown()`` stops the threads once the rows queued before it have run; a
+later ``submit`` starts new ones.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from .metrics import record
+
+logger = logging.getLogger(__name__)
+
+# Queued by shutdown() to stop a worker thread, once per thread.
+_STOP = object()
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue already holds ``max_queue_size`` rows."""
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10, max_queue_size=64, timeout=30, concurrency=1):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.timeout = timeout
+        self.concurrency = max(1, int(concurrency))
+
+        self._lock = threading.Lock()
+        # One thread collects at a time, so rows are not spread over half-full batches.
+        self._collect_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._threads = []
+        self._pid = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'timed_out': 0,
+            'failed_batches': 0,
+            'batches': 0,
+            'rows': 0,
+            'max_queue_depth': 0,
+            'queue_wait_seconds': 0.0,
+            'inference_seconds': 0.0,
+            'batch_sizes': {},
+        }
+
+    # --- Public API ---
+
+    def submit(self, array):
+        """Queue one (H, W, C) array and return a Future resolving to its score row."""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((array, future, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise QueueFullError(f'Inference queue is full ({self.max_queue_size} pending).')
+
+        with self._lock:
+            self._stats['submitted'] += 1
+            depth = self._queue.qsize()
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+        return future
+
+    def predict(self, array, timeout=None):
+        """Submit one array and block until its scores are available."""
+        future = self.submit(array)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._stats['timed_out'] += 1
+            raise
+
+    def shutdown(self, timeout=None):
+        """Stop the worker threads after the rows already queued have run. Returns False if one is still running."""
+        with self._lock:
+            threads = [thread for thread in self._threads if thread.is_alive()] if self._pid == os.getpid() else []
+        for _ in threads:
+            # Blocks while the queue is full, i.e. until a thread has taken some rows.
+            self._queue.put(_STOP, timeout=timeout)
+        for thread in threads:
+            thread.join(timeout)
+        return not any(thread.is_alive() for thread in threads)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['batch_sizes'] = dict(sorted(self._stats['batch_sizes'].items()))
+        batches = stats['batches']
+        stats.update({
+            'queue_depth': self._queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'max_queue_size': self.max_queue_size,
+            'concurrency': self.concurrency,
+            'avg_batch_size': stats['rows'] / batches if batches else 0.0,
+            'avg_queue_wait_ms': stats['queue_wait_seconds'] * 1000.0 / stats['rows'] if stats['rows'] else 0.0,
+            'avg_inference_ms': stats['inference_seconds'] * 1000.0 / batches if batches else 0.0,
+        })
+        return stats
+
+    # --- Worker thread ---
+
+    def _running(self, pid):
+        return self._pid == pid and self._threads and all(thread.is_alive() for thread in self._threads)
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._running(pid):
+            return
+        with self._lock:
+            if self._running(pid):
+                return
+            if self._pid is not None and self._pid != pid:
+                # Forked child (e.g. a Gunicorn worker): the parent's threads do not
+                # exist here and its queue may have been copied mid-operation.
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                self._collect_lock = threading.Lock()
+                self._reset_stats()
+                self._threads = []
+            self._pid = pid
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for _ in range(self.concurrency - len(self._threads)):
+                thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _collect(self):
+        """Return ``(batch, stop)``; ``stop`` is set once shutdown() was called."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            with self._collect_lock:
+                batch, stop = self._collect()
+            # Requests that already gave up (timed out) are dropped here.
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        started = time.monotonic()
+        try:
+            scores = self.predict_fn(np.stack([array for array, _, _ in batch]))
+        except Exception as e:
+            logger.exception('Batched inference failed for %d rows', len(batch))
+            for _, future, _ in batch:
+                future.set_exception(e)
+            with self._lock:
+                self._stats['failed_batches'] += 1
+            return
+        finished = time.monotonic()
+
+        for row, (_, future, _) in zip(scores, batch):
+            future.set_result(row)
+
+        record('batch_model', finished - started)
+        for _, _, enqueued in batch:
+            record('batch_queue_wait', started - enqueued)
+
+        size = len(batch)
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['rows'] += size
+            self._stats['inference_seconds'] += finished - started
+            self._stats['queue_wait_seconds'] += sum(started - enqueued for _, _, enqueued in batch)
+            self._stats['batch_sizes'][size] = self._stats['batch_sizes'].get(size, 0) + 1
@@ -0,0 +1,120 @@
+"""
+Conditional GET for lists that change rarely: reviews, the example images
+and each user's history.
+
+Every list has a version: a random token and the time of the last change.
+Versions live in the ``HTTP_CACHE['CACHE_ALIAS']`` cache, so all workers see
+the same one. api/signals.py bumps them on commit when a Review or Diagnosis
+is saved or deleted, and when a User is saved or deleted, since reviews show
+usernames. Bulk inserts send no signals, so they call ``bump_version``
+themselves.
+
+``ConditionalGetMixin`` runs after authentication and permission checks. It
+derives the ``ETag`` from the version, the URL, the renderer and the user,
+and ``Last-Modified`` from the time of the change. A request whose
+``If-None-Match`` or ``If-Modified-Since`` still matches gets 304 without
+touching the ORM or the serializers. With ``cache_pages`` (the review list),
+rendered JSON pages are also cached under their ETag. A bump therefore
+turns every page into a miss, and old pages expire after
+``HTTP_CACHE['PAGE_TTL_SECONDS']``.
+
+A version missing from the cache (evicted, or a new server) starts again
+with a new token, so clients refetch once and never get a stale 304.
+"""
+import functools
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+REVIEWS = 'reviews'
+
+
+def history_scope(user_id):
+    return f'history:{user_id}'
+
+
+def http_cache():
+    return caches[settings.HTTP_CACHE['CACHE_ALIAS']]
+
+
+def _new_version():
+    return uuid.uuid4().hex, int(time.time())
+
+
+def current_version(scope):
+    """``(token, modified)`` of a list, where ``modified`` is a Unix timestamp."""
+    cache = http_cache()
+    key = f'version:{scope}'
+    version = cache.get(key)
+    if version is None:
+        # add(), so two workers starting a version agree on one.
+        cache.add(key, _new_version(), None)
+        version = cache.get(key) or _new_version()
+    return version
+
+
+def bump_version(scope):
+    http_cache().set(f'version:{scope}', _new_version(), None)
+
+
+class ConditionalGetMixin:
+    """
+    For list views: put it before the DRF view in the bases and implement
+    ``get_version`` (a ``(token, modified)`` pair; ``modified`` may be None).
+    """
+    # Per-user responses: Cache-Control private, Vary on Authorization.
+    private = False
+    # Keep rendered JSON pages in the HTTP cache.
+    cache_pages = False
+
+    def get_version(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, functools.partial(super().list, request, *args, **kwargs))
+
+    def conditional_response(self, request, build):
+        token, modified = self.get_version()
+        key = ':'.join([
+            token, str(request.user.id if self.private else ''), request.accepted_renderer.format,
+            request.build_absolute_uri(),
+        ])
+        etag = hashlib.md5(key.encode('utf-8')).hexdigest()
+
+        response = get_conditional_response(request, etag=quote_etag(etag), last_modified=modified)
+        if response is None:
+            response = self.cached_page(request, etag, build) if self.cache_pages else build()
+        if response.status_code in (200, 304):
+            response['ETag'] = quote_etag(etag)
+            if modified:
+                response['Last-Modified'] = http_date(modified)
+            response['Cache-Control'] = 'private, no-cache' if self.private else 'no-cache'
+            if self.private:
+                patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def cached_page(self, request, etag, build):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            # The browsable API is rendered for each request.
+            return build()
+        cache = http_cache()
+        page = cache.get(f'page:{etag}')
+        if page is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            content_type = request.accepted_media_type
+            if renderer.charset:
+                content_type = f'{content_type}; charset={renderer.charset}'
+            content = renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+            page = (content, content_type)
+            cache.set(f'page:{etag}', page, settings.HTTP_CACHE['PAGE_TTL_SECONDS'])
+        content, content_type = page
+        return HttpResponse(content, content_type=content_type)
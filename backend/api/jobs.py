@@ -0,0 +1,316 @@
+"""
+Inference jobs executed by a pool of model-holding worker processes.
+
+``JobQueue`` owns a ``ProcessPoolExecutor``. Each worker process loads the
+model once through the registry and then serves predictions. With
+``preload`` (the inference server, see ``INFERENCE['PRELOAD']``) and a
+backend whose loaded state survives ``fork()`` (the NumPy backend), the
+model is loaded once in the pool's parent and the workers are forked from
+it, so they share one copy of the weights. Other backends own thread pools
+and sessions that do not survive a fork, so their workers are spawned and
+each loads its own copy. The web process
+only preprocesses uploads, so a slow forward pass no longer ties up the
+interpreter that serves logins, reviews and history:
+
+* ``predict(batch, timeout)`` runs one batch of the synchronous path (the
+  micro-batcher's batches, see api/model_registry.py) and waits for it,
+* ``submit(array, meta)`` queues an ``async=true`` prediction and returns a
+  job id to poll with ``get``. When the job finishes, ``on_done(job_id, job)``
+  runs on one callback thread, so the Diagnosis is stored whether or not
+  anyone polls (``api.views.persist_job``),
+* ``status(timeout)`` reports a worker's registry, for the readiness probe.
+
+With ``INFERENCE['JOBS']['ADDRESS']`` set, the pool runs in a separate
+``python manage.py run_inference_server`` process. Web workers reach it over
+a Unix socket through ``RemoteJobQueue``. Job ids are then visible to every
+web worker. Without an address, each web worker runs its own pool.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .batching import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobServerUnavailable(Exception):
+    """Raised when the inference server socket cannot be reached."""
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+    from .model_registry import ModelNotReady, registry
+    try:
+        registry.get()
+    except ModelNotReady:
+        # Surfaced per job by _run_prediction instead of killing the pool.
+        pass
+
+
+def _run_prediction(array):
+    from .model_registry import registry
+    return registry.predict(array[None, ...])[0]
+
+
+def _run_batch(batch):
+    from .model_registry import registry
+    return registry.predict(batch)
+
+
+def _worker_status():
+    from .model_registry import READY, registry
+    model_status = registry.status()
+    if model_status['state'] != READY:
+        # E.g. after a failed load; the next probe sees the result.
+        registry.load_in_background()
+    return model_status
+
+
+class JobQueue:
+    def __init__(self, workers=2, max_pending=256, result_ttl=600, on_done=None, preload=False):
+        self.workers = workers
+        self.preload = preload
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.on_done = on_done
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._executor = None
+        self._done_executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._mp_context(),
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'backend_project.settings'),),
+            )
+            self._done_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference-job-done')
+            self._jobs = {}
+            self._pid = os.getpid()
+        return self._executor
+
+    def _mp_context(self):
+        from .model_registry import FORK_SAFE_BACKENDS, ModelNotReady, registry
+
+        if self.preload and registry.backend_name in FORK_SAFE_BACKENDS:
+            try:
+                registry.get()
+            except ModelNotReady:
+                # Spawned workers retry the load themselves.
+                pass
+            else:
+                # The workers inherit the loaded weights copy-on-write (see ModelRegistry._check_fork).
+                return multiprocessing.get_context('fork')
+        # 'spawn' keeps worker processes independent of the runtime state
+        # (thread pools, sessions) of the process that creates them.
+        return multiprocessing.get_context('spawn')
+
+    def start(self):
+        """Start the worker processes now instead of on the first job."""
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(os.getpid)
+
+    def submit(self, array, meta=None):
+        """Queue one preprocessed (H, W, C) array and return its job id."""
+        with self._lock:
+            executor = self._get_executor()
+            self._expire()
+            pending = sum(1 for job in self._jobs.values() if not job['future'].done())
+            if pending >= self.max_pending:
+                raise QueueFullError(f'Inference job queue is full ({self.max_pending} pending).')
+            job_id = str(uuid.uuid4())
+            future = executor.submit(_run_prediction, array)
+            self._jobs[job_id] = {'future': future, 'meta': meta or {}, 'created': time.monotonic()}
+            done_executor = self._done_executor
+        if self.on_done is not None:
+            # Outside the lock: the callback runs at once if the job is already done.
+            future.add_done_callback(lambda _: done_executor.submit(self._job_done, job_id))
+        return job_id
+
+    def predict(self, batch, timeout=None):
+        """Run one (N, H, W, C) batch on a worker and return its scores, waiting up to ``timeout`` seconds."""
+        with self._lock:
+            future = self._get_executor().submit(_run_batch, batch)
+        return self._wait(future, timeout)
+
+    def status(self, timeout=None):
+        """The registry status of a worker (see ModelRegistry.status); TimeoutError while all are busy or starting."""
+        with self._lock:
+            future = self._get_executor().submit(_worker_status)
+        return self._wait(future, timeout)
+
+    @staticmethod
+    def _wait(future, timeout):
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # Not run at all if no worker has picked it up yet.
+            future.cancel()
+            raise
+
+    def get(self, job_id, timeout=None):
+        """
+        Return ``{'status', 'scores', 'error', 'meta'}`` for a job, or None if unknown.
+
+        With ``timeout``, wait up to that many seconds for the job to finish.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future = job['future']
+        if timeout:
+            try:
+                future.exception(timeout=timeout)
+            except TimeoutError:
+                pass
+        result = {'status': PENDING, 'scores': None, 'error': None, 'meta': job['meta']}
+        if future.done():
+            error = future.exception()
+            if error is None:
+                result.update(status=DONE, scores=future.result())
+            else:
+                result.update(status=FAILED, error=f'{type(error).__name__}: {error}')
+        return result
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            'workers': self.workers,
+            'jobs': len(jobs),
+            'pending': sum(1 for job in jobs if not job['future'].done()),
+            'max_pending': self.max_pending,
+        }
+
+    def _job_done(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return
+        try:
+            self.on_done(job_id, job)
+        except Exception:
+            logger.exception('Handling finished inference job %s failed', job_id)
+        finally:
+            close_old_connections()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job['created'] < cutoff and job['future'].done()]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class RemoteJobQueue:
+    """Client for a JobQueue served by ``manage.py run_inference_server``."""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+
+    def _call(self, *message):
+        try:
+            with Client(self.address, family='AF_UNIX', authkey=self.authkey) as connection:
+                connection.send(message)
+                status, payload = connection.recv()
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise JobServerUnavailable(f'Inference server at {self.address} is unavailable: {e}') from e
+        if status == 'queue_full':
+            raise QueueFullError(payload)
+        if status == 'timeout':
+            raise TimeoutError(payload)
+        if status == 'not_ready':
+            from .model_registry import ModelNotReady
+            raise ModelNotReady(payload)
+        if status == 'error':
+            raise JobServerUnavailable(payload)
+        return payload
+
+    def submit(self, array, meta=None):
+        return self._call('submit', array, meta)
+
+    def get(self, job_id, timeout=None):
+        return self._call('get', job_id, timeout)
+
+    def predict(self, batch, timeout=None):
+        return self._call('predict', batch, timeout)
+
+    def status(self, timeout=None):
+        return self._call('status', timeout)
+
+    def stats(self):
+        return self._call('stats')
+
+
+def handle_message(queue, message):
+    """Dispatch one RemoteJobQueue message to a local JobQueue (server side)."""
+    from .model_registry import ModelNotReady
+
+    command, *args = message
+    try:
+        if command not in ('submit', 'get', 'predict', 'status', 'stats'):
+            return 'error', f'Unknown command {command!r}'
+        return 'ok', getattr(queue, command)(*args)
+    except QueueFullError as e:
+        return 'queue_full', str(e)
+    except TimeoutError as e:
+        return 'timeout', str(e) or f'{command} timed out'
+    except ModelNotReady as e:
+        return 'not_ready', str(e)
+    except Exception as e:
+        logger.exception('Inference server failed to handle %r', command)
+        return 'error', f'{type(e).__name__}: {e}'
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def start_job_queue():
+    """Start this process's worker pool (which loads the model) now; nothing to do with a remote pool."""
+    queue = get_job_queue()
+    if isinstance(queue, JobQueue):
+        queue.start()
+
+
+def make_job_queue(workers=None, preload=False):
+    """A local JobQueue configured from settings, storing the results of finished jobs."""
+    # Imported here: api.views imports this module.
+    from .views import persist_job
+
+    config = settings.INFERENCE['JOBS']
+    return JobQueue(workers or config['WORKERS'], config['MAX_PENDING'], config['RESULT_TTL_SECONDS'],
+                    on_done=persist_job, preload=preload)
+
+
+def get_job_queue():
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            config = settings.INFERENCE['JOBS']
+            if config['ADDRESS']:
+                _job_queue = RemoteJobQueue(config['ADDRESS'], settings.SECRET_KEY.encode('utf-8'))
+            else:
+                _job_queue = make_job_queue()
+        return _job_queue
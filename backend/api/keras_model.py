@@ -0,0 +1,114 @@
+"""
+Keras definition of the skin CNN and its serving-time inference function.
+
+The training graph (see the original training code) also contains a
+``data_augmentation`` block (RandomFlip/RandomRotation) and Dropout, and is
+compiled with an optimizer. None of that does anything at inference time, so
+the serving graph below only keeps the layers that carry weights or change
+the output. Weight loading from ``keras.h5`` is unaffected because those
+layers have no weights.
+"""
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Input, Conv2D, MaxPooling2D, Flatten, Dense, Dropout, Rescaling, RandomFlip, RandomRotation
+from tensorflow.keras.optimizers import Adam
+
+from .backends import IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS
+
+
+def build_training_model(num_classes):
+    """Build the full training graph, as the model was originally served."""
+    data_augmentation = Sequential(
+      [
+        RandomFlip("horizontal"),
+        RandomRotation(0.1),
+      ],
+      name="data_augmentation"
+    )
+
+    model = Sequential([
+        Input(shape=(IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS)),
+        Rescaling(1./255),
+        data_augmentation,
+        Conv2D(32, (3, 3), activation='relu', padding='same'),
+        MaxPooling2D((2, 2)),
+        Conv2D(64, (3, 3), activation='relu', padding='same'),
+        MaxPooling2D((2, 2)),
+        Conv2D(128, (3, 3), activation='relu', padding='same'),
+        MaxPooling2D((2, 2)),
+        Flatten(),
+        Dense(128, activation='relu'),
+        Dropout(0.5),
+        Dense(num_classes, activation='softmax')
+    ])
+    model.compile(optimizer=Adam(learning_rate=0.00075), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def build_model(num_classes):
+    """Build the serving graph of the skin CNN (no augmentation, dropout or optimizer)."""
+    return Sequential([
+        Input(shape=(IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS)),
+        Rescaling(1./255),
+        Conv2D(32, (3, 3), activation='relu', padding='same'),
+        MaxPooling2D((2, 2)),
+        Conv2D(64, (3, 3), activation='relu', padding='same'),
+        MaxPooling2D((2, 2)),
+        Conv2D(128, (3, 3), activation='relu', padding='same'),
+        MaxPooling2D((2, 2)),
+        Flatten(),
+        Dense(128, activation='relu'),
+        Dense(num_classes, activation='softmax')
+    ], name='skin_cnn_serving')
+
+
+def configure_threads(intra_op_threads, inter_op_threads):
+    """
+    Size TensorFlow's thread pools (0 = one thread per core). Only possible
+    before TensorFlow runs its first op; later calls keep the existing pools.
+    """
+    try:
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        pass
+
+
+def load_model(weights_path, num_classes):
+    model = build_model(num_classes)
+    model.load_weights(weights_path)
+    model.trainable = False
+    return model
+
+
+class CompiledPredictor:
+    """
+    Graph-mode replacement for ``model.predict``.
+
+    ``model.predict`` sets up callbacks, a data adapter and a step loop on every
+    call. Here the forward pass is traced once into a ``tf.function`` with a
+    fixed (None, 100, 125, 3) float32 signature, so any batch size reuses the
+    same concrete graph without retracing.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._fn = tf.function(
+            self._forward,
+            input_signature=[tf.TensorSpec(shape=(None, IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS), dtype=tf.float32)],
+            reduce_retracing=True,
+        )
+
+    def _forward(self, images):
+        return self.model(images, training=False)
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        return self._fn(tf.convert_to_tensor(batch)).numpy()
+
+    def warm_up(self, batch_size=1):
+        """Trace the graph and run it once so the first request does not pay for it."""
+        self(np.zeros((batch_size, IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS), dtype=np.float32))
@@ -0,0 +1,65 @@
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.keras_model import IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS, CompiledPredictor, build_model, build_training_model
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000.0
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks per-request latency of model.predict against the compiled serving function.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=1)
+        parser.add_argument('--weights', default=os.path.join(settings.INFERENCE['MODEL_DIR'], 'keras.h5'),
+                            help='Path to keras.h5. Random weights are used if the file does not exist.')
+
+    def handle(self, *args, **options):
+        with open(settings.INFERENCE['LABELS_PATH'], 'r', encoding='utf-8') as f:
+            num_classes = len([line for line in f if line.strip()])
+
+        training_model = build_training_model(num_classes)
+        serving_model = build_model(num_classes)
+        if os.path.exists(options['weights']):
+            training_model.load_weights(options['weights'])
+            serving_model.load_weights(options['weights'])
+        else:
+            self.stdout.write(self.style.WARNING(f"{options['weights']} not found, using random weights."))
+            serving_model.set_weights(training_model.get_weights())
+
+        predictor = CompiledPredictor(serving_model)
+        predictor.warm_up(options['batch_size'])
+
+        rng = np.random.default_rng(0)
+        batch = rng.integers(0, 256, size=(options['batch_size'], IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS), dtype=np.uint8)
+
+        paths = [
+            ('model.predict (training graph)', lambda: training_model.predict(batch, verbose=0)),
+            ('compiled serving function', lambda: predictor(batch)),
+        ]
+
+        results = {}
+        for name, fn in paths:
+            for _ in range(options['warmup']):
+                fn()
+            samples = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - started)
+            results[name] = fn()
+            self.stdout.write(
+                f"{name:32s} p50={percentile_ms(samples, 50):8.2f} ms  "
+                f"p99={percentile_ms(samples, 99):8.2f} ms  mean={np.mean(samples) * 1000.0:8.2f} ms"
+            )
+
+        outputs = list(results.values())
+        self.stdout.write(f'max |difference| between paths: {np.max(np.abs(outputs[0] - outputs[1])):.2e}')
@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.postprocessing import top_predictions
+
+
+def legacy_predictions(scores, labels):
+    """What PredictionView did per image before api/postprocessing.py."""
+    confidences = {labels[i]: float(scores[i] * 100) for i in range(len(labels))}
+    sorted_confidences = sorted(confidences.items(), key=lambda item: item[1], reverse=True)
+    filtered_results = []
+    for label, confidence in sorted_confidences:
+        if confidence > 10.0:
+            filtered_results.append({'label': label, 'confidence': round(confidence, 2)})
+        if len(filtered_results) >= 3:
+            break
+    return filtered_results
+
+
+def random_scores(rows, num_labels, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.dirichlet(np.ones(num_labels) * 0.5, size=rows).astype(np.float32)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares per-row dict/sort post-processing of model scores with the vectorized top-k in '
+        'api/postprocessing.py, for several batch sizes and label counts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-sizes', default='1,16,256')
+        parser.add_argument('--labels', default='6,100', help='Label counts to try.')
+        parser.add_argument('--seconds', type=float, default=1.0, help='Time spent per measurement.')
+
+    def time_per_call(self, fn, seconds):
+        calls, started = 0, time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            fn()
+            calls += 1
+        return (time.perf_counter() - started) / calls
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'labels':>6s} {'batch':>6s} {'legacy us':>10s} {'vector us':>10s} {'speedup':>8s}  same")
+        for num_labels in (int(n) for n in options['labels'].split(',')):
+            labels = [f'label {i}' for i in range(num_labels)]
+            for batch_size in (int(n) for n in options['batch_sizes'].split(',')):
+                scores = random_scores(batch_size, num_labels)
+                rows = list(scores)
+                same = [legacy_predictions(row, labels) for row in rows] == top_predictions(scores, labels, 3, 10.0, 1.0)
+                legacy = self.time_per_call(lambda: [legacy_predictions(row, labels) for row in rows], options['seconds'])
+                vector = self.time_per_call(lambda: top_predictions(scores, labels, 3, 10.0, 1.0), options['seconds'])
+                self.stdout.write(
+                    f'{num_labels:6d} {batch_size:6d} {legacy * 1e6:10.1f} {vector * 1e6:10.1f} '
+                    f'{legacy / vector:7.1f}x  {same}'
+                )
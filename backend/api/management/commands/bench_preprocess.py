@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from api.backends import IMAGE_HEIGHT, IMAGE_WIDTH
+from api.preprocessing import load_image_array
+
+
+def legacy_preprocess(path):
+    """The pipeline PredictionView used before api/preprocessing.py."""
+    img = Image.open(path)
+    img = img.resize((IMAGE_WIDTH, IMAGE_HEIGHT), Image.LANCZOS)
+    img = img.convert('RGB')
+    return np.array(img)
+
+
+def fast_preprocess(path):
+    with open(path, 'rb') as f:
+        return load_image_array(f)
+
+
+PATHS = {
+    'legacy': legacy_preprocess,
+    'fast': fast_preprocess,
+}
+
+
+def make_photo(width, height, seed=0):
+    """A smooth gradient with sensor-like noise, so encoders produce realistic file sizes."""
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    base = np.stack(np.broadcast_arrays(180 * x + 40 * y, 120 + 60 * y + 0 * x, 200 - 90 * x + 0 * y), axis=-1)
+    noise = rng.normal(0, 6, size=(height, width, 1)).astype(np.float32)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def write_inputs(directory):
+    photo = make_photo(4032, 3024)
+    image = Image.fromarray(photo)
+    inputs = {}
+
+    inputs['jpeg 12MP'] = os.path.join(directory, 'photo.jpg')
+    image.save(inputs['jpeg 12MP'], quality=90)
+
+    inputs['jpeg 12MP progressive'] = os.path.join(directory, 'progressive.jpg')
+    image.save(inputs['jpeg 12MP progressive'], quality=90, progressive=True)
+
+    # Portrait phone photo stored landscape with an EXIF rotation, as most cameras do.
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    inputs['jpeg 12MP exif-rotated'] = os.path.join(directory, 'rotated.jpg')
+    image.save(inputs['jpeg 12MP exif-rotated'], quality=90, exif=exif)
+
+    inputs['png 12MP rgb'] = os.path.join(directory, 'photo.png')
+    image.save(inputs['png 12MP rgb'], compress_level=1)
+
+    # HEIC-like: high-resolution image with an alpha channel, decoded in a non-RGB mode.
+    inputs['png 12MP rgba'] = os.path.join(directory, 'photo_rgba.png')
+    image.convert('RGBA').save(inputs['png 12MP rgba'], compress_level=1)
+
+    inputs['webp 12MP'] = os.path.join(directory, 'photo.webp')
+    image.save(inputs['webp 12MP'], quality=90)
+    return inputs
+
+
+def read_status_kib(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return None
+
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS (Linux 4.0+). Returns False when unsupported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def measure(path_name, input_path, iterations):
+    """Runs in a fresh child process so peak RSS belongs to this input and path only."""
+    fn = PATHS[path_name]
+    if reset_peak_rss():
+        rss_before = read_status_kib('VmRSS')
+        read_peak = lambda: read_status_kib('VmHWM')  # noqa: E731
+    else:
+        # ru_maxrss may include the parent's peak; the delta is then a lower bound.
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        read_peak = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # noqa: E731
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(input_path)
+        samples.append(time.perf_counter() - started)
+    return float(np.median(samples)), float(np.percentile(samples, 99)), (read_peak() - rss_before) / 1024.0
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks decode+resize time and peak RSS of the legacy and fast image preprocessing paths.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        context = multiprocessing.get_context('spawn')
+        try:
+            inputs = write_inputs(directory)
+            self.stdout.write(f"{'input':26s} {'size':>8s} {'path':>7s} {'p50 ms':>9s} {'p99 ms':>9s} {'peak RSS +MiB':>14s}")
+            for input_name, input_path in inputs.items():
+                size = f'{os.path.getsize(input_path) / 1024 / 1024:.1f}M'
+                for path_name in PATHS:
+                    with context.Pool(1) as pool:
+                        p50, p99, rss = pool.apply(measure, (path_name, input_path, options['iterations']))
+                    self.stdout.write(
+                        f'{input_name:26s} {size:>8s} {path_name:>7s} {p50 * 1000:9.1f} {p99 * 1000:9.1f} {rss:14.1f}'
+                    )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,76 @@
+import json
+import statistics
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIClient
+
+from api.models import Diagnosis, Profile
+from api.results import compact_legacy_result
+from api.tips import tips_labels
+from api.views import build_prediction_response
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares legacy full-payload Diagnosis.result rows with the compact format: stored bytes per row '
+        'and /api/history/ response size and latency. Runs in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=50, help='History requests per format.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        user = User.objects.create_user('bench-results')
+        Profile.objects.create(user=user, skin_type='oily')
+        labels = tips_labels()
+        rng = np.random.default_rng(0)
+        legacy = []
+        while len(legacy) < options['rows']:
+            response = build_prediction_response(rng.dirichlet(np.ones(len(labels)) * 0.5), labels, 'oily')
+            if response is not None:
+                legacy.append(response)
+        Diagnosis.objects.bulk_create(Diagnosis(user=user, image='', result=result) for result in legacy)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        rows = Diagnosis.objects.filter(user=user)
+
+        def measure():
+            # Serialized the way JSONField writes the column.
+            stored = [len(json.dumps(result).encode('utf-8')) for result in rows.values_list('result', flat=True)]
+            timings, size = [], 0
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                response = client.get('/api/history/', {'page_size': options['page_size']})
+                timings.append(time.perf_counter() - started)
+                size = len(response.content)
+            return sum(stored), statistics.mean(stored), size, statistics.median(timings) * 1000.0
+
+        before = measure()
+        first_page = client.get('/api/history/', {'page_size': options['page_size']}).json()['results']
+
+        compacted = []
+        for diagnosis in rows.only('id', 'result'):
+            diagnosis.result = compact_legacy_result(diagnosis.result)
+            compacted.append(diagnosis)
+        Diagnosis.objects.bulk_update(compacted, ['result'])
+
+        after = measure()
+        same = client.get('/api/history/', {'page_size': options['page_size']}).json()['results'] == first_page
+
+        self.stdout.write(f"{options['rows']} rows, history page of {options['page_size']}")
+        self.stdout.write(f"{'format':8s} {'table KiB':>10s} {'bytes/row':>10s} {'page bytes':>11s} {'page ms':>8s}")
+        for name, (total, per_row, page, ms) in (('legacy', before), ('compact', after)):
+            self.stdout.write(f'{name:8s} {total / 1024:10.1f} {per_row:10.0f} {page:11d} {ms:8.2f}')
+        self.stdout.write(f'Stored size: {after[0] / before[0]:.1%} of legacy. Identical API output: {same}.')
@@ -0,0 +1,146 @@
+import io
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from . import loadtest
+
+
+def tree_rss_kib(pid):
+    """Resident memory of ``pid`` and all its descendants, from /proc."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def wait_until_ready(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'The server exited with status {process.returncode}.')
+        try:
+            with urlopen(f'{base_url}/api/health/ready/', timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (URLError, OSError):
+            pass
+        time.sleep(0.5)
+    raise CommandError(f'The server did not become ready within {timeout}s.')
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_loadtest(base_url, process, **options):
+    """
+    Run ``loadtest`` against a started server. Returns the loadtest command
+    (its ``samples``, ``errors`` and ``elapsed``), its report, and the
+    server's idle and peak RSS in KiB.
+    """
+    wait_until_ready(base_url, process)
+    idle_rss = tree_rss_kib(process.pid)
+    peak_rss = [idle_rss]
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(0.25):
+            peak_rss[0] = max(peak_rss[0], tree_rss_kib(process.pid))
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    out = io.StringIO()
+    command = loadtest.Command()
+    try:
+        call_command(command, base_url=base_url, create_user=True, stdout=out, **options)
+    finally:
+        done.set()
+        sampler.join()
+    return command, out.getvalue(), idle_rss, peak_rss[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts the app under Gunicorn (WSGI) and then under Uvicorn (ASGI) with the same memory budget '
+        '(one process holding the model), runs the same loadtest against each, and reports throughput, '
+        'latency and peak memory. Uses the configured settings and database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--servers', default='wsgi,asgi', help='Which servers to run, in order.')
+        parser.add_argument('--wsgi-workers', type=int, default=1)
+        parser.add_argument('--wsgi-threads', type=int, default=4,
+                            help='Gunicorn gthread threads per worker (1 = the sync worker).')
+        parser.add_argument('--asgi-executor-workers', type=int, default=4,
+                            help='ASYNC_SERVING executor threads for the ASGI run.')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=20.0, help='Seconds per server.')
+        parser.add_argument('--mix', default='predict=1,review_list=2')
+        parser.add_argument('--upload-kbps', type=float, default=64.0,
+                            help='Upload speed per client in KiB/s (0 = full speed).')
+
+    def handle(self, *args, **options):
+        base_url = f"http://127.0.0.1:{options['port']}"
+        for server in options['servers'].split(','):
+            command, env = self.server_command(server, options)
+            self.stdout.write(f'== {server}: {" ".join(command)}')
+            process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                _, report, idle_rss, peak_rss = run_loadtest(
+                    base_url, process, concurrency=options['concurrency'], duration=options['duration'],
+                    mix=options['mix'], upload_kbps=options['upload_kbps'],
+                )
+                self.stdout.write(report.rstrip())
+                self.stdout.write(f'memory: {idle_rss / 1024:.0f} MiB idle, {peak_rss / 1024:.0f} MiB peak')
+            finally:
+                stop_server(process)
+
+    def server_command(self, server, options):
+        env = dict(os.environ, SERVER_INTERFACE=server)
+        bind = f"127.0.0.1:{options['port']}"
+        if server == 'wsgi':
+            executable = shutil.which('gunicorn')
+            if executable is None:
+                raise CommandError('gunicorn is not installed.')
+            command = [
+                executable, '--workers', str(options['wsgi_workers']), '--preload', '--bind', bind,
+                '--timeout', '300', 'backend_project.wsgi:application',
+            ]
+            if options['wsgi_threads'] > 1:
+                command[1:1] = ['--worker-class', 'gthread', '--threads', str(options['wsgi_threads'])]
+            return command, env
+        if server == 'asgi':
+            env['ASYNC_EXECUTOR_WORKERS'] = str(options['asgi_executor_workers'])
+            return [
+                sys.executable, '-m', 'uvicorn', '--workers', '1', '--host', '127.0.0.1',
+                '--port', str(options['port']), '--no-access-log', 'backend_project.asgi:application',
+            ], env
+        raise CommandError(f'Unknown server {server!r}; use wsgi or asgi.')
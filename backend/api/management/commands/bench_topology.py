@@ -0,0 +1,100 @@
+import os
+import shutil
+import subprocess
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend_project.serving import available_cores, plan_topology
+
+from .bench_serving import run_loadtest, stop_server
+
+
+def parse_config(value):
+    """``auto`` or ``WORKERSxTHREADSxINFERENCE_THREADS``, e.g. ``2x4x1``."""
+    if value == 'auto':
+        return {}
+    try:
+        workers, threads, inference_threads = (int(part) for part in value.split('x'))
+    except ValueError:
+        raise CommandError(f'Invalid configuration {value!r}; use auto or WORKERSxTHREADSxINFERENCE_THREADS.')
+    return {'workers': workers, 'threads': threads, 'inference_threads': inference_threads}
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts Gunicorn with gunicorn.conf.py once per core count and serving configuration, runs the same '
+        'loadtest against each, and reports throughput per core. Uses the configured settings and database.'
+    )
+
+    def add_arguments(self, parser):
+        all_cores = len(available_cores())
+        default_cores = sorted({min(2 ** i, all_cores) for i in range(all_cores.bit_length() + 1)})
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--cores', default=','.join(map(str, default_cores)),
+                            help='Core counts to pin the server to, e.g. 1,2,4.')
+        parser.add_argument('--configs', default='auto,1x1x0,0x1x1',
+                            help='auto (the plan of backend_project/serving.py) or WORKERSxTHREADSxINFERENCE_THREADS; '
+                                 '0 means one per core for workers and the runtime default for inference threads.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=20.0, help='Seconds per run.')
+        parser.add_argument('--mix', default='predict=1')
+
+    def handle(self, *args, **options):
+        executable = shutil.which('gunicorn')
+        if executable is None:
+            raise CommandError('gunicorn is not installed.')
+        cores = available_cores()
+        bind = f"127.0.0.1:{options['port']}"
+        base_url = f'http://{bind}'
+        request_name = options['mix'].split(',')[0].partition('=')[0]
+
+        rows = []
+        for core_count in (int(value) for value in options['cores'].split(',')):
+            if core_count > len(cores):
+                raise CommandError(f'Only {len(cores)} cores are available.')
+            pinned = cores[:core_count]
+            for config in options['configs'].split(','):
+                overrides = parse_config(config)
+                if overrides.get('workers') == 0:
+                    overrides['workers'] = core_count
+                if overrides.get('inference_threads') == 0:
+                    # The runtimes' own default: one thread per core in every worker.
+                    overrides['inference_threads'] = core_count
+                topology = plan_topology(cores=pinned, **overrides)
+                self.stdout.write(f'== {core_count} cores, {config}: {topology.describe()}')
+
+                env = dict(
+                    os.environ, SERVER_INTERFACE='wsgi', SERVING_WORKERS=str(topology.workers),
+                    SERVING_THREADS=str(topology.threads), SERVING_INFERENCE_THREADS=str(topology.inference_threads),
+                )
+                process = subprocess.Popen(
+                    [executable, '-c', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'), '--bind', bind],
+                    cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    preexec_fn=lambda: os.sched_setaffinity(0, pinned),
+                )
+                try:
+                    loadtest, _, _, peak_rss = run_loadtest(
+                        base_url, process, concurrency=options['concurrency'], duration=options['duration'],
+                        mix=options['mix'],
+                    )
+                finally:
+                    stop_server(process)
+
+                samples = loadtest.samples[request_name]
+                throughput = len(samples) / loadtest.elapsed
+                p95 = float(np.percentile(samples, 95)) * 1000.0 if samples else float('nan')
+                rows.append((
+                    core_count, config, topology.workers, topology.threads, topology.inference_threads,
+                    throughput, throughput / core_count, p95, peak_rss / 1024, loadtest.errors[request_name] or '-',
+                ))
+
+        self.stdout.write(
+            f"\n{'cores':>5s} {'config':>8s} {'workers':>7s} {'threads':>7s} {'inf thr':>7s} "
+            f"{'req/s':>8s} {'req/s/core':>10s} {'p95 ms':>8s} {'peak MiB':>8s}  errors"
+        )
+        for row in rows:
+            self.stdout.write(
+                '{:5d} {:>8s} {:7d} {:7d} {:7d} {:8.1f} {:10.1f} {:8.1f} {:8.0f}  {}'.format(*row)
+            )
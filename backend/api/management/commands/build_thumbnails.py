@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Diagnosis
+from api.storage import walk_files
+from api.thumbnails import build_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Builds missing thumbnail/medium derivatives for the images under media/diagnoses/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=sorted(settings.THUMBNAILS['SIZES']), default=None)
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives that already exist.')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        field = Diagnosis._meta.get_field('image')
+        storage = field.storage
+        directory = field.upload_to.rstrip('/')
+        if not storage.exists(directory):
+            raise CommandError(f'{directory}/ does not exist in the media storage.')
+
+        def build(name):
+            try:
+                return name, build_derivatives(name, storage, sizes=options['sizes'], force=options['force']), None
+            except Exception as e:
+                return name, [], e
+
+        built = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for name, written, error in executor.map(build, walk_files(storage, directory)):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                elif written:
+                    built += len(written)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{name}: {", ".join(written)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Built {built} derivatives ({failed} images failed).'))
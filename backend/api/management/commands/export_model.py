@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.backends import IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS, BACKENDS, load_backend
+
+FORMATS = ('onnx', 'tflite')
+
+
+class Command(BaseCommand):
+    help = 'Exports model/keras.h5 to ONNX or TFLite for the TensorFlow-free inference backends.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, required=True)
+        parser.add_argument('--weights', default=None, help='Path to keras.h5 (defaults to INFERENCE["MODEL_DIR"]).')
+        parser.add_argument('--output', default=None, help='Output file (defaults to INFERENCE["MODEL_DIR"]).')
+        parser.add_argument('--num-classes', type=int, default=None,
+                            help='Number of output classes (defaults to the number of lines in labels.txt).')
+        parser.add_argument('--opset', type=int, default=13)
+        parser.add_argument('--tolerance', type=float, default=1e-4,
+                            help='Maximum absolute score difference allowed against the Keras backend.')
+
+    def handle(self, *args, **options):
+        model_dir = settings.INFERENCE['MODEL_DIR']
+        fmt = options['format']
+        weights = options['weights'] or os.path.join(model_dir, BACKENDS['keras'].filename)
+        output = options['output'] or os.path.join(model_dir, BACKENDS[fmt].filename)
+        num_classes = options['num_classes']
+        if num_classes is None:
+            with open(settings.INFERENCE['LABELS_PATH'], 'r', encoding='utf-8') as f:
+                num_classes = len([line for line in f if line.strip()])
+
+        if not os.path.exists(weights):
+            raise CommandError(f'Weights file not found: {weights}')
+
+        keras_backend = load_backend('keras', model_dir, num_classes, model_path=weights)
+
+        if fmt == 'onnx':
+            self._export_onnx(keras_backend, output, options['opset'])
+        else:
+            self._export_tflite(keras_backend, output)
+
+        # Verify the exported file against Keras before anyone deploys it.
+        exported = load_backend(fmt, model_dir, num_classes, model_path=output)
+        rng = np.random.default_rng(0)
+        batch = rng.integers(0, 256, size=(8, IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS)).astype(np.float32)
+        diff = float(np.max(np.abs(keras_backend.predict(batch) - exported.predict(batch))))
+        if not np.isfinite(diff) or diff > options['tolerance']:
+            raise CommandError(f'Exported {fmt} model differs from Keras by {diff:.2e} (tolerance {options["tolerance"]:.0e}).')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {weights} to {output} ({os.path.getsize(output) / 1024:.0f} KiB, max |diff| {diff:.2e}).'
+        ))
+
+    def _export_onnx(self, keras_backend, output, opset):
+        try:
+            import tensorflow as tf
+            import tf2onnx
+        except ImportError as e:
+            raise CommandError('ONNX export requires the tf2onnx package.') from e
+
+        input_signature = [tf.TensorSpec((None, IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS), tf.float32)]
+        tf2onnx.convert.from_function(
+            keras_backend.predictor._fn,
+            input_signature=input_signature,
+            opset=opset,
+            output_path=output,
+        )
+
+    def _export_tflite(self, keras_backend, output):
+        import tensorflow as tf
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(keras_backend.predictor.model)
+        with open(output, 'wb') as f:
+            f.write(converter.convert())
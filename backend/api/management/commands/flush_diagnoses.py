@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.persistence import diagnosis_writer
+
+
+class Command(BaseCommand):
+    help = 'Writes spooled (deferred) diagnoses to the database, releasing claims left by dead workers first.'
+
+    def handle(self, *args, **options):
+        released = diagnosis_writer.recover()
+        written = diagnosis_writer.flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'Released {released} stale claims, wrote {written} diagnoses; '
+            f'{diagnosis_writer.pending()} pending, {diagnosis_writer.failed()} failed.'
+        ))
@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.models import Diagnosis
+from api.persistence import diagnosis_writer
+from api.storage import walk_files
+from api.thumbnails import derivative_name
+
+
+class Command(BaseCommand):
+    help = 'Deletes diagnosis images and thumbnails that no Diagnosis (or spooled diagnosis) refers to.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-seconds', type=int, default=settings.MEDIA_GRACE_SECONDS,
+            help='Keep files younger than this; they may belong to a prediction that is still being saved.',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        field = Diagnosis._meta.get_field('image')
+        storage = field.storage
+        cutoff = time.time() - options['grace_seconds']
+
+        referenced = set(Diagnosis.objects.values_list('image', flat=True))
+        referenced |= diagnosis_writer.referenced_images()
+        referenced_derivatives = {
+            derivative_name(name, size) for name in referenced for size in settings.THUMBNAILS['SIZES']
+        }
+
+        candidates = [
+            (storage, name) for name in walk_files(storage, field.upload_to.rstrip('/')) if name not in referenced
+        ]
+        candidates += [
+            (default_storage, name) for name in walk_files(default_storage, settings.THUMBNAILS['DIRECTORY'])
+            if name not in referenced_derivatives
+        ]
+
+        deleted = freed = 0
+        for file_storage, name in candidates:
+            if file_storage.get_modified_time(name).timestamp() > cutoff:
+                continue
+            size = file_storage.size(name)
+            if not options['dry_run']:
+                if file_storage is storage:
+                    # Checked again under the storage lock: it may have been saved again since.
+                    in_use = Diagnosis.objects.filter(image=name).exists
+                    if not storage.delete_if_stale(name, options['grace_seconds'], in_use=in_use):
+                        continue
+                else:
+                    file_storage.delete(name)
+            if options['verbosity'] > 1 or options['dry_run']:
+                self.stdout.write(f'{name} ({size} bytes)')
+            deleted += 1
+            freed += size
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} unreferenced files ({freed / 1024 / 1024:.1f} MiB); '
+            f'{len(referenced)} images are referenced.'
+        ))
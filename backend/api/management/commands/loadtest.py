@@ -0,0 +1,181 @@
+import http.client
+import io
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from api.models import Profile
+
+
+def make_jpegs(count, size=(1024, 768)):
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, size=(size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).resize(size, Image.BILINEAR).save(buffer, 'JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        body.write(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode()
+        )
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammers a running server with concurrent /api/predict/ uploads and /api/reviews/ reads and writes, '
+        'and reports latency and throughput per endpoint. Run it once per database or server configuration '
+        'to compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--username', default='loadtest')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--create-user', action='store_true',
+                            help='Create the user in the configured database first (must be the server\'s database).')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds.')
+        parser.add_argument('--mix', default='predict=1,review_list=2,review_create=1',
+                            help='Relative weights of the request types.')
+        parser.add_argument('--images', type=int, default=20, help='Distinct synthetic photos to upload.')
+        parser.add_argument('--upload-kbps', type=float, default=0,
+                            help='Send uploads at this many KiB/s, like a phone on a slow network (0 = full speed).')
+
+    def handle(self, *args, **options):
+        if options['create_user'] and not User.objects.filter(username=options['username']).exists():
+            user = User.objects.create_user(options['username'], password=options['password'])
+            Profile.objects.create(user=user, skin_type='normal')
+
+        self.base_url = options['base_url'].rstrip('/')
+        self.upload_kbps = options['upload_kbps']
+        self.token = self.login(options['username'], options['password'])
+        self.images = make_jpegs(options['images'])
+
+        weights = {}
+        for item in options['mix'].split(','):
+            name, _, weight = item.partition('=')
+            if not hasattr(self, f'request_{name}'):
+                raise CommandError(f'Unknown request type {name!r}.')
+            weights[name] = int(weight or 1)
+        schedule = [name for name, weight in weights.items() for _ in range(weight)]
+
+        self.lock = threading.Lock()
+        self.samples = {name: [] for name in weights}
+        self.errors = {name: {} for name in weights}
+        deadline = time.monotonic() + options['duration']
+
+        def worker(worker_id):
+            i = worker_id
+            while time.monotonic() < deadline:
+                name = schedule[i % len(schedule)]
+                started = time.perf_counter()
+                try:
+                    getattr(self, f'request_{name}')(i)
+                    error = None
+                except HTTPError as e:
+                    error = str(e.code)
+                except (URLError, OSError) as e:
+                    error = type(e).__name__
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    if error is None:
+                        self.samples[name].append(elapsed)
+                    else:
+                        self.errors[name][error] = self.errors[name].get(error, 0) + 1
+                i += options['concurrency']
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(worker, range(options['concurrency'])))
+        elapsed = self.elapsed = time.monotonic() - started
+
+        self.stdout.write(f"{options['concurrency']} clients for {elapsed:.1f}s against {self.base_url}")
+        self.stdout.write(f"{'request':14s} {'ok':>7s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}  errors")
+        for name, samples in self.samples.items():
+            if samples:
+                p50, p95, p99 = (float(np.percentile(samples, q)) * 1000.0 for q in (50, 95, 99))
+            else:
+                p50 = p95 = p99 = float('nan')
+            self.stdout.write(
+                f'{name:14s} {len(samples):7d} {len(samples) / elapsed:8.1f} {p50:9.1f} {p95:9.1f} {p99:9.1f}  '
+                f'{self.errors[name] or "-"}'
+            )
+
+    def call(self, method, path, body=None, content_type=None, auth=True):
+        request = Request(self.base_url + path, data=body, method=method)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        if auth:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        with urlopen(request, timeout=60) as response:
+            return response.read()
+
+    def login(self, username, password):
+        body = json.dumps({'username': username, 'password': password}).encode()
+        try:
+            response = self.call('POST', '/api/users/login/', body, 'application/json', auth=False)
+        except (HTTPError, URLError) as e:
+            raise CommandError(f'Login to {self.base_url} failed ({e}); pass --create-user or valid credentials.')
+        return json.loads(response)['access']
+
+    def call_slowly(self, path, body, content_type):
+        """POST ``body`` in 4 KiB chunks paced to ``upload_kbps``."""
+        url = urlsplit(self.base_url + path)
+        connection = http.client.HTTPConnection(url.hostname, url.port, timeout=120)
+        try:
+            connection.putrequest('POST', url.path)
+            connection.putheader('Content-Type', content_type)
+            connection.putheader('Content-Length', str(len(body)))
+            connection.putheader('Authorization', f'Bearer {self.token}')
+            connection.endheaders()
+            chunk_size = 4096
+            for start in range(0, len(body), chunk_size):
+                connection.send(body[start:start + chunk_size])
+                time.sleep(chunk_size / (self.upload_kbps * 1024))
+            response = connection.getresponse()
+            data = response.read()
+            if response.status >= 400:
+                raise HTTPError(self.base_url + path, response.status, response.reason, response.headers, None)
+            return data
+        finally:
+            connection.close()
+
+    def request_predict(self, i):
+        body, content_type = encode_multipart(
+            {}, {'image': (f'loadtest-{i}.jpg', self.images[i % len(self.images)], 'image/jpeg')}
+        )
+        if self.upload_kbps:
+            self.call_slowly('/api/predict/', body, content_type)
+        else:
+            self.call('POST', '/api/predict/', body, content_type)
+
+    def request_review_list(self, i):
+        self.call('GET', '/api/reviews/')
+
+    def request_review_create(self, i):
+        body = json.dumps({'rating': i % 5 + 1, 'text': f'load test review {i}'}).encode()
+        self.call('POST', '/api/reviews/create/', body, 'application/json')
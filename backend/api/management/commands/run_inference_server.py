@@ -0,0 +1,59 @@
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend_project.serving import plan_inference
+
+
+class Command(BaseCommand):
+    help = 'Runs the inference worker pool and serves jobs to the web workers over a Unix socket.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default=None, help='Unix socket path (defaults to INFERENCE["JOBS"]["ADDRESS"]).')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Inference worker processes (defaults to the plan of backend_project/serving.py).')
+
+    def handle(self, *args, **options):
+        config = settings.INFERENCE['JOBS']
+        address = options['address'] or config['ADDRESS']
+        if not address:
+            raise CommandError('Set INFERENCE["JOBS"]["ADDRESS"] (INFERENCE_JOBS_ADDRESS) or pass --address.')
+        if os.path.exists(address):
+            os.unlink(address)
+
+        topology = plan_inference(workers=options['workers'])
+        # Before NumPy and the runtimes are imported (api.jobs imports NumPy): BLAS sizes its
+        # thread pool then, and spawned workers read these when they start.
+        for name, value in topology.thread_env().items():
+            os.environ.setdefault(name, value)
+        from api.jobs import make_job_queue
+
+        # Finished async jobs are stored from here, so they reach the history even if nobody polls.
+        # With PRELOAD, a fork-safe backend is loaded here once and shared by the workers.
+        queue = make_job_queue(topology.workers, preload=settings.INFERENCE['PRELOAD'])
+        queue.start()
+
+        with Listener(address, family='AF_UNIX', authkey=settings.SECRET_KEY.encode('utf-8')) as listener:
+            self.stdout.write(self.style.SUCCESS(f'Serving inference jobs on {address}: {topology.describe()}'))
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, AuthenticationError) as e:
+                    # Failed handshake (e.g. wrong authkey); keep serving others.
+                    self.stderr.write(f'Rejected connection: {e}')
+                    continue
+                threading.Thread(target=self._serve, args=(queue, connection), daemon=True).start()
+
+    def _serve(self, queue, connection):
+        from api.jobs import handle_message
+
+        with connection:
+            try:
+                while True:
+                    connection.send(handle_message(queue, connection.recv()))
+            except EOFError:
+                pass
@@ -0,0 +1,223 @@
+"""
+Per-stage latency histograms for the prediction pipeline.
+
+``timed(stage)`` measures a block and records it in the
+``skinlab_stage_duration_seconds`` histogram. The stages are:
+
+* ``upload``: reading and parsing the multipart body (Django parses it on
+  first access, through api/upload_handlers.py),
+* ``decode``: PIL decode and resize (api/preprocessing.py),
+* ``inference``: model scores, including the prediction cache and the
+  micro-batch queue,
+* ``postprocess``: top-k and threshold (api/postprocessing.py),
+* ``tips``: tip assembly (api/tips.py),
+* ``image_write`` and ``db_insert``: the photo and the Diagnosis row when
+  persistence is synchronous, or ``spool`` when they are handed to the
+  write-behind writer.
+
+Work done outside a request is recorded too: ``batch_queue_wait`` and
+``batch_model`` in the micro-batcher thread, and ``writer_image_write``,
+``writer_db_insert`` and ``writer_thumbnails`` in the diagnosis writer.
+
+``ServerTimingMiddleware`` collects the stages of the current request into a
+``Server-Timing`` header (shown under Timing in the browser devtools network
+panel) and records the whole request in ``skinlab_request_duration_seconds``
+by URL name.
+
+``/api/metrics/`` (admins only) renders the histograms in the Prometheus text
+format. Histograms live in each process. With ``METRICS['DIRECTORY']`` set,
+each process also writes its counts there and the endpoint adds up all
+processes, so whichever Gunicorn worker answers the scrape reports the whole
+server.
+"""
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+STAGE_METRIC = 'skinlab_stage_duration_seconds'
+REQUEST_METRIC = 'skinlab_request_duration_seconds'
+
+METRIC_HELP = {
+    STAGE_METRIC: 'Time spent in each stage of the prediction pipeline.',
+    REQUEST_METRIC: 'Time spent serving each API route.',
+}
+
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histograms:
+    """Histograms keyed by metric name and a tuple of ``(label, value)`` pairs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._series = {}
+        self._next_flush = 0.0
+
+    def observe(self, name, labels, seconds):
+        buckets = settings.METRICS['BUCKETS']
+        index = bisect.bisect_left(buckets, seconds)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child (e.g. a Gunicorn worker): start from zero.
+                self._pid = os.getpid()
+                self._series = {}
+            series = self._series.get((name, labels))
+            if series is None:
+                # One count per bucket, one for +Inf, then the sum.
+                series = self._series[name, labels] = [0] * (len(buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+        if settings.METRICS['DIRECTORY'] and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return []
+            return [[name, [list(pair) for pair in labels], list(series)] for (name, labels), series in self._series.items()]
+
+    def flush(self):
+        """Write this process's counts to ``METRICS['DIRECTORY']/<pid>.json``."""
+        directory = settings.METRICS['DIRECTORY']
+        self._next_flush = time.monotonic() + settings.METRICS['FLUSH_INTERVAL_SECONDS']
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{os.getpid()}.json')
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'buckets': list(settings.METRICS['BUCKETS']), 'series': self.snapshot()}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception('Could not write metrics to %s', directory)
+
+    def collect(self):
+        """``{(name, labels): [bucket counts..., +Inf count, sum]}`` for all processes."""
+        directory = settings.METRICS['DIRECTORY']
+        if not directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            buckets = list(settings.METRICS['BUCKETS'])
+            snapshots = []
+            # Files of exited workers are kept, so the totals never go down while the server runs.
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if data['buckets'] == buckets:
+                    snapshots.append(data['series'])
+
+        merged = {}
+        for snapshot in snapshots:
+            for name, labels, series in snapshot:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                total = merged.setdefault(key, [0] * (len(series) - 1) + [0.0])
+                for i, value in enumerate(series):
+                    total[i] += value
+        return merged
+
+
+histograms = Histograms()
+
+
+def record(stage, seconds):
+    histograms.observe(STAGE_METRIC, (('stage', stage),), seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus():
+    buckets = settings.METRICS['BUCKETS']
+    series_by_name = {}
+    for (name, labels), series in sorted(histograms.collect().items()):
+        series_by_name.setdefault(name, []).append((labels, series))
+
+    lines = []
+    for name, all_series in series_by_name.items():
+        lines.append(f'# HELP {name} {METRIC_HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, series in all_series:
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], series[:-1]):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {series[-1]!r}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class ServerTimingMiddleware:
+    """Times each request and reports its stages in a ``Server-Timing`` header."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    def finish(self, request, response, timings, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else 'unmatched'
+        histograms.observe(REQUEST_METRIC, (('route', route), ('method', request.method)), elapsed)
+
+        if settings.METRICS['SERVER_TIMING']:
+            entries = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items()]
+            entries.append(f'total;dur={elapsed * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entries)
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:57
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_profile_gender'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='diagnosis',
+            name='image',
+            field=models.ImageField(db_index=True, storage=api.storage.diagnosis_storage, upload_to='diagnoses/'),
+        ),
+    ]
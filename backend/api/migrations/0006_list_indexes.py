@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_content_addressed_image'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['user', '-created_at'], name='diagnosis_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['-created_at'], name='diagnosis_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at'], name='review_created_idx'),
+        ),
+        # The admin user list orders by -date_joined; auth.User belongs to Django, so the index is added here.
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS auth_user_date_joined_idx ON auth_user (date_joined DESC);',
+            reverse_sql='DROP INDEX IF EXISTS auth_user_date_joined_idx;',
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='diagnosis',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='review',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='diagnosis',
+            name='diagnosis_user_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='diagnosis',
+            name='diagnosis_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='diagnosis_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['-created_at', '-id'], name='diagnosis_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ),
+        migrations.RunSQL(
+            [
+                'DROP INDEX IF EXISTS auth_user_date_joined_idx;',
+                'CREATE INDEX auth_user_date_joined_idx ON auth_user (date_joined DESC, id DESC);',
+            ],
+            reverse_sql=[
+                'DROP INDEX IF EXISTS auth_user_date_joined_idx;',
+                'CREATE INDEX auth_user_date_joined_idx ON auth_user (date_joined DESC);',
+            ],
+        ),
+    ]
@@ -0,0 +1,209 @@
+"""
+Process-wide registry for the inference model and labels.
+
+Nothing is loaded when ``api.views`` is imported. That way ``migrate``,
+``seed_reviews`` and URL resolution never pay for the inference runtime.
+
+The model is only loaded in the inference worker processes (api/jobs.py),
+each once at start-up. Web processes never load it: they read the labels
+with ``get_labels()`` and the model version (the digest of the model file,
+part of prediction cache keys and stored results) with
+``get_model_version()``, and send every forward pass to the worker pool
+through ``batcher``.
+
+The inference server loads a backend whose state survives ``fork()`` (the
+NumPy backend: plain arrays) before forking its workers, which then keep it
+and share its pages (see ``JobQueue`` in api/jobs.py). A forked copy of a
+registry with any other backend is reset, and the runtime (Keras, ONNX
+Runtime or TFLite, which own thread pools) is loaded again in the child.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .backends import load_backend, model_file
+from .batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+UNLOADED = 'unloaded'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+# Backends whose loaded state can be inherited by forked workers.
+FORK_SAFE_BACKENDS = {'numpy'}
+
+# How long a failed load is remembered before the next request retries it.
+RETRY_INTERVAL_SECONDS = 30
+
+
+class ModelNotReady(Exception):
+    """Raised when the model could not be loaded."""
+
+
+def read_labels():
+    with open(settings.INFERENCE['LABELS_PATH'], 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+def file_digest(path):
+    """Short SHA-256 of the model file, used as the model version."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._file_version = None
+        self.state = UNLOADED
+        self.backend = None
+        self.labels = None
+        self.model_version = None
+        self.error = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.failed_at = None
+        self.pid = os.getpid()
+
+    @property
+    def backend_name(self):
+        return settings.INFERENCE['BACKEND']
+
+    def _check_fork(self):
+        if self.pid != os.getpid():
+            inherited = self.state == READY and self.backend_name in FORK_SAFE_BACKENDS
+            if not inherited:
+                logger.info('Forked into pid %s, %s backend will be loaded in this worker', os.getpid(), self.backend_name)
+                self._reset()
+            else:
+                self.pid = os.getpid()
+
+    def get(self):
+        """Return the registry with the model loaded, loading it first if needed."""
+        with self._lock:
+            self._check_fork()
+            if self.state == READY:
+                return self
+            if self.state == FAILED and time.monotonic() - self.failed_at < RETRY_INTERVAL_SECONDS:
+                raise ModelNotReady(self.error)
+            self._load()
+            return self
+
+    def _load(self):
+        self.state = LOADING
+        started = time.monotonic()
+        try:
+            labels = read_labels()
+            backend = load_backend(
+                self.backend_name, settings.INFERENCE['MODEL_DIR'], len(labels),
+                intra_op_threads=settings.INFERENCE['INTRA_OP_THREADS'],
+                inter_op_threads=settings.INFERENCE['INTER_OP_THREADS'],
+            )
+            backend.warm_up()
+            model_version = file_digest(backend.model_path)
+        except Exception as e:
+            self.state = FAILED
+            self.error = f'{type(e).__name__}: {e}'
+            self.failed_at = time.monotonic()
+            logger.exception('Error loading model or labels')
+            raise ModelNotReady(self.error) from e
+
+        self.backend = backend
+        self.labels = labels
+        self.model_version = model_version
+        self.state = READY
+        self.error = None
+        self.load_seconds = time.monotonic() - started
+        self.loaded_at = time.time()
+        logger.info('Loaded %s backend with %d labels in %.2fs (pid %s)',
+                    self.backend_name, len(labels), self.load_seconds, os.getpid())
+
+    def load_in_background(self):
+        """Start loading without blocking the caller (a pool worker does this when its status is asked for)."""
+        if self.state in (UNLOADED, FAILED):
+            threading.Thread(target=self._get_quietly, name='model-loader', daemon=True).start()
+
+    def _get_quietly(self):
+        try:
+            self.get()
+        except ModelNotReady:
+            pass
+
+    def predict(self, batch):
+        return self.get().backend.predict(batch)
+
+    def get_labels(self):
+        """Labels without loading the model, for processes that only post-process scores."""
+        if self.labels is not None:
+            return self.labels
+        try:
+            return read_labels()
+        except OSError as e:
+            raise ModelNotReady(f'{type(e).__name__}: {e}') from e
+
+    def get_model_version(self):
+        """
+        The model version without loading the model. The digest is computed
+        again only when the model file's size or mtime changes.
+        """
+        if self.model_version is not None:
+            return self.model_version
+        try:
+            path = model_file(self.backend_name, settings.INFERENCE['MODEL_DIR'])
+            stat = os.stat(path)
+        except Exception as e:
+            raise ModelNotReady(f'{type(e).__name__}: {e}') from e
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        cached = self._file_version
+        if cached is None or cached[0] != key:
+            cached = self._file_version = (key, file_digest(path))
+        return cached[1]
+
+    def status(self):
+        state = self.state
+        if self.pid != os.getpid() and self.backend_name not in FORK_SAFE_BACKENDS:
+            state = UNLOADED
+        return {
+            'state': state,
+            'backend': self.backend_name,
+            'labels': len(self.labels) if self.labels else 0,
+            'model_version': self.model_version,
+            'load_seconds': self.load_seconds,
+            'loaded_at': self.loaded_at,
+            'error': self.error,
+            'pid': os.getpid(),
+        }
+
+
+registry = ModelRegistry()
+
+
+def predict_on_pool(batch):
+    """Run one batch on the inference worker pool (api/jobs.py) and wait for its scores."""
+    from .jobs import get_job_queue
+    return get_job_queue().predict(batch, timeout=settings.INFERENCE['TIMEOUT_SECONDS'])
+
+
+# Concurrent predictions are grouped into a single forward pass (see api/batching.py),
+# with up to one batch in flight per pool worker. The threads start on first use,
+# i.e. after any fork.
+batcher = MicroBatcher(
+    predict_on_pool,
+    max_batch_size=settings.INFERENCE['BATCH_MAX_SIZE'],
+    max_wait_ms=settings.INFERENCE['BATCH_MAX_WAIT_MS'],
+    max_queue_size=settings.INFERENCE['QUEUE_MAX_SIZE'],
+    timeout=settings.INFERENCE['TIMEOUT_SECONDS'],
+    concurrency=settings.INFERENCE['JOBS']['WORKERS'],
+)
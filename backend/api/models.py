@@ -2,17 +2,29 @@ from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .storage import diagnosis_storage
+
 class Diagnosis(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='diagnoses')
-    image = models.ImageField(upload_to='diagnoses/')
+    # Content-addressed: identical photos share one file (see api/storage.py).
+    image = models.ImageField(upload_to='diagnoses/', storage=diagnosis_storage, db_index=True)
     result = models.JSONField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # The write-behind spool record it came from, so a replayed record is not inserted twice (see api/persistence.py).
+    spool_id = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False)
 
     def __str__(self):
         return f'Diagnosis for {self.user.username} at {self.created_at.strftime("%Y-%m-%d %H:%M")}'
 
     class Meta:
-        ordering = ['-created_at']
+        # id breaks ties, so pages are stable (see api/pagination.py).
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # History: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='diagnosis_user_created_idx'),
+            # Admin list: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='diagnosis_created_idx'),
+        ]
 
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -29,7 +41,10 @@ class Review(models.Model):
         return f'Review by {self.user.username} - {self.rating} stars'
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ]
 
 class Profile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
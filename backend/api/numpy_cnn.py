@@ -0,0 +1,108 @@
+"""
+Pure-NumPy implementation of the skin CNN forward pass.
+
+The serving graph is Rescaling -> (Conv2D 3x3 same + ReLU -> MaxPool 2x2) x3
+-> Flatten -> Dense + ReLU -> Dense + softmax. Augmentation and Dropout are
+identities at inference time and are skipped. Weights are read from the
+Keras HDF5 file with h5py, so serving needs neither TensorFlow nor Keras.
+
+Convolutions are done with im2col: every 3x3xC input patch becomes one row of
+a matrix that is multiplied with the reshaped (9*C, filters) kernel in a
+single GEMM, so the heavy lifting happens in BLAS.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+CONV_LAYERS = 3
+DENSE_LAYERS = 2
+
+
+def read_keras_h5_weights(path):
+    """
+    Return the weight arrays of every layer that has weights, in layer order.
+
+    Handles both files written by ``model.save('keras.h5')`` (weights under
+    ``model_weights``) and by ``model.save_weights('keras.h5')``.
+    """
+    import h5py
+
+    layers = []
+    with h5py.File(path, 'r') as f:
+        root = f['model_weights'] if 'model_weights' in f else f
+        for layer_name in root.attrs['layer_names']:
+            layer_name = layer_name.decode('utf-8') if isinstance(layer_name, bytes) else layer_name
+            group = root[layer_name]
+            weight_names = [
+                name.decode('utf-8') if isinstance(name, bytes) else name
+                for name in group.attrs.get('weight_names', [])
+            ]
+            if weight_names:
+                layers.append([np.array(group[name]) for name in weight_names])
+    return layers
+
+
+class NumpySkinCNN:
+    def __init__(self, conv_weights, dense_weights):
+        self.conv_layers = []
+        for kernel, bias in conv_weights:
+            kh, kw, in_channels, filters = kernel.shape
+            # (kh, kw, C, F) -> (kh*kw*C, F), matching the patch layout built in _conv2d.
+            gemm_kernel = np.ascontiguousarray(kernel.reshape(kh * kw * in_channels, filters), dtype=np.float32)
+            self.conv_layers.append((kh, kw, gemm_kernel, np.ascontiguousarray(bias, dtype=np.float32)))
+        self.dense_layers = [
+            (np.ascontiguousarray(kernel, dtype=np.float32), np.ascontiguousarray(bias, dtype=np.float32))
+            for kernel, bias in dense_weights
+        ]
+
+    @classmethod
+    def from_h5(cls, path):
+        layers = read_keras_h5_weights(path)
+        if len(layers) != CONV_LAYERS + DENSE_LAYERS or any(len(weights) != 2 for weights in layers):
+            raise ValueError(
+                f'Unexpected weight layout in {path}: expected {CONV_LAYERS} Conv2D and {DENSE_LAYERS} Dense '
+                f'layers with kernel and bias, found {[len(weights) for weights in layers]}.'
+            )
+        for kernel, _ in layers[:CONV_LAYERS]:
+            if kernel.ndim != 4:
+                raise ValueError(f'Expected a 4-D Conv2D kernel in {path}, found shape {kernel.shape}.')
+        return cls(layers[:CONV_LAYERS], layers[CONV_LAYERS:])
+
+    @property
+    def num_classes(self):
+        return self.dense_layers[-1][0].shape[1]
+
+    def predict(self, batch):
+        """Run (N, H, W, 3) pixels in the 0-255 range through the network, returning (N, classes) scores."""
+        x = np.asarray(batch, dtype=np.float32) * np.float32(1. / 255)
+        for kh, kw, kernel, bias in self.conv_layers:
+            x = self._conv2d_relu(x, kh, kw, kernel, bias)
+            x = self._max_pool(x)
+        x = x.reshape(x.shape[0], -1)
+        (hidden_kernel, hidden_bias), (output_kernel, output_bias) = self.dense_layers
+        x = np.maximum(x @ hidden_kernel + hidden_bias, 0.0)
+        return self._softmax(x @ output_kernel + output_bias)
+
+    @staticmethod
+    def _conv2d_relu(x, kh, kw, kernel, bias):
+        n, h, w, c = x.shape
+        padded = np.pad(x, ((0, 0), (kh // 2, kh // 2), (kw // 2, kw // 2), (0, 0)))
+        # (N, H, W, C, kh, kw) view -> (N*H*W, kh*kw*C) patch matrix.
+        windows = sliding_window_view(padded, (kh, kw), axis=(1, 2))
+        patches = windows.transpose(0, 1, 2, 4, 5, 3).reshape(n * h * w, kh * kw * c)
+        out = patches @ kernel
+        out += bias
+        np.maximum(out, 0.0, out=out)
+        return out.reshape(n, h, w, kernel.shape[1])
+
+    @staticmethod
+    def _max_pool(x):
+        n, h, w, c = x.shape
+        h2, w2 = h // 2, w // 2
+        return x[:, :h2 * 2, :w2 * 2, :].reshape(n, h2, 2, w2, 2, c).max(axis=(2, 4))
+
+    @staticmethod
+    def _softmax(logits):
+        logits = logits - logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
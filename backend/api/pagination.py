@@ -0,0 +1,209 @@
+"""
+Pagination for the history, review and admin lists.
+
+``KeysetPagination`` pages on ``(created_at, id)``, or on another timestamp
+set by the view's ``cursor_ordering``. The cursor holds the last row's key,
+and the next page is ``WHERE (created_at, id) < (key)``, which the
+``(created_at DESC, id DESC)`` indexes answer directly. Cost does not grow
+with the page depth the way OFFSET does. Rows inserted while a client is
+paging do not shift or repeat entries. ``COUNT(*)`` only runs with
+``?count=true``.
+
+``PageNumberPagination`` (``?page=``) remains for clients that need page
+numbers, such as the MyPage history. It takes ``?count=false`` to skip the
+count.
+
+``HybridPagination`` picks one per request. ``?cursor=`` or
+``?pagination=cursor`` selects keyset mode, ``?page=`` or
+``?pagination=page`` selects page numbers, and otherwise the view's
+``default_mode`` applies.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.pagination import PageNumberPagination as DRFPageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+DEFAULT_CURSOR_ORDERING = ('-created_at', '-id')
+
+
+def wants_count(request, default):
+    value = request.query_params.get('count')
+    if value is None:
+        return default
+    return value.lower() not in ('false', '0', 'no')
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        ordering = getattr(view, 'cursor_ordering', DEFAULT_CURSOR_ORDERING)
+        self.field = ordering[0].lstrip('-')
+        self.model_field = queryset.model._meta.get_field(self.field)
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            queryset = queryset.order_by(f'-{self.field}', '-pk')
+            reverse = False
+        else:
+            value, pk, reverse = cursor
+            if reverse:
+                # Previous page: the rows just above the cursor, read upwards and flipped below.
+                queryset = queryset.filter(
+                    Q(**{f'{self.field}__gt': value}) | Q(**{self.field: value, 'pk__gt': pk})
+                ).order_by(self.field, 'pk')
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{self.field}__lt': value}) | Q(**{self.field: value, 'pk__lt': pk})
+                ).order_by(f'-{self.field}', '-pk')
+
+        self.count = queryset.count() if wants_count(request, False) and cursor is None else None
+        rows = list(queryset[:self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if reverse:
+            rows.reverse()
+
+        # Going forwards there is a next page if a row was left over, and a previous one
+        # unless this is the first page; going backwards it is the other way round.
+        self.next_key = self.previous_key = None
+        if rows:
+            if reverse or has_more:
+                self.next_key = self.key_of(rows[-1])
+            if has_more if reverse else cursor is not None:
+                self.previous_key = self.key_of(rows[0])
+        return rows
+
+    def key_of(self, row):
+        return self.model_field.value_to_string(row), row.pk
+
+    def encode_cursor(self, key, reverse):
+        payload = json.dumps([key[0], key[1], reverse], separators=(',', ':')).encode('utf-8')
+        token = base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            value, pk, reverse = json.loads(payload)
+            return self.model_field.to_python(value), int(pk), bool(reverse)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        return self.encode_cursor(self.next_key, False) if self.next_key else None
+
+    def get_previous_link(self):
+        return self.encode_cursor(self.previous_key, True) if self.previous_key else None
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+
+class PageNumberPagination(DRFPageNumberPagination):
+    page_size = 6
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.skip_count = not wants_count(request, True)
+        if not self.skip_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        # Without COUNT(*): fetch one extra row to know whether there is a next page.
+        self.request = request
+        page_size = self.get_page_size(request)
+        page_number = request.query_params.get(self.page_query_param, 1)
+        try:
+            self.page_number = int(page_number)
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Invalid page'))
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if not self.skip_count:
+            return super().get_paginated_response(data)
+        url = self.request.build_absolute_uri()
+        next_link = replace_query_param(url, self.page_query_param, self.page_number + 1) if self.has_next else None
+        previous_link = None
+        if self.page_number > 1:
+            previous_link = (
+                remove_query_param(url, self.page_query_param) if self.page_number == 2
+                else replace_query_param(url, self.page_query_param, self.page_number - 1)
+            )
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', next_link),
+            ('previous', previous_link),
+            ('results', data),
+        ]))
+
+
+class HybridPagination(BasePagination):
+    default_mode = 'cursor'
+    cursor_class = KeysetPagination
+    page_class = PageNumberPagination
+
+    def mode(self, request):
+        requested = request.query_params.get('pagination')
+        if requested in ('cursor', 'page'):
+            return requested
+        if self.cursor_class.cursor_query_param in request.query_params:
+            return 'cursor'
+        if self.page_class.page_query_param in request.query_params:
+            return 'page'
+        return self.default_mode
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.cursor_class() if self.mode(request) == 'cursor' else self.page_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
+class HistoryPagination(HybridPagination):
+    """Page numbers by default, as MyPage expects; ?pagination=cursor for keyset."""
+    default_mode = 'page'
+
+
+class ListPagination(HybridPagination):
+    """Keyset by default for the review and admin lists."""
+    default_mode = 'cursor'
+
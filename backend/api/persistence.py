@@ -0,0 +1,328 @@
+"""
+Write-behind persistence of Diagnosis records.
+
+With ``DIAGNOSIS_PERSISTENCE['MODE'] = 'deferred'`` a prediction no longer
+stores its upload and inserts its row before responding. ``enqueue`` instead
+moves the upload into a local spool directory and writes a small JSON record
+next to it (fsync + atomic rename). That is all the request pays for. A
+background writer thread in each web worker then:
+
+1. claims spooled records by renaming them to ``<record>.<pid>``, so several
+   workers can share one spool without writing a record twice,
+2. moves each spooled image into the media storage and records the storage
+   name in the claim file,
+3. inserts the rows with one ``bulk_create`` per ``BATCH_SIZE`` records in a
+   single transaction, each row carrying its record id as ``spool_id``,
+4. deletes the claim files and builds the list-view thumbnails
+   (api/thumbnails.py).
+
+A record that fails on its own (its user was deleted, its spooled image is
+missing after a crash, its file is corrupt) is renamed to ``<record>.failed``
+instead of blocking the spool. Database errors that hit every record (the
+database is locked or down) release the claims for the next flush instead.
+
+Records reach the database within about ``FLUSH_INTERVAL_SECONDS``. The
+spool survives restarts. Claims held by dead processes are released on the
+writer's next start, and ``python manage.py flush_diagnoses`` drains the
+spool on demand (e.g. before Gunicorn starts). A replay after a crash between
+steps 3 and 4 does not duplicate rows, because records whose ``spool_id``
+already has a row are skipped. (Image names are no use for that: identical
+photos share one name, see api/storage.py.)
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db import DatabaseError, DataError, IntegrityError, close_old_connections, transaction
+
+from .http_cache import bump_version, history_scope
+from .metrics import timed
+from .models import Diagnosis
+from .thumbnails import build_derivatives
+
+logger = logging.getLogger(__name__)
+
+RECORD_SUFFIX = '.json'
+FAILED_SUFFIX = '.failed'
+
+
+class SpooledFile(File):
+    """A spooled image that FileSystemStorage can move into place instead of copying."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _fsync_write(path, payload):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _is_transient(error):
+    """Database errors not caused by the record itself, e.g. a locked or unreachable database."""
+    return isinstance(error, DatabaseError) and not isinstance(error, (IntegrityError, DataError))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DiagnosisWriter:
+    def __init__(self, spool_dir, batch_size=100, flush_interval=1.0):
+        self.spool_dir = spool_dir
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {'enqueued': 0, 'written': 0, 'batches': 0, 'failed_batches': 0}
+
+    # --- Request side ---
+
+    def enqueue(self, user_id, result, upload=None, image_name=None):
+        """
+        Spool one Diagnosis. Pass either the ``upload`` (an UploadedFile not yet
+        stored) or the ``image_name`` of a file already in the media storage.
+        """
+        self._ensure_worker()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        record_id = f'{time.time_ns()}-{uuid.uuid4().hex}'
+        record = {
+            'user_id': user_id,
+            'result': result,
+            'image': image_name,
+            'spool_image': None,
+            'filename': None,
+            'sha256': None,
+        }
+        if upload is not None:
+            record['filename'] = upload.name
+            record['sha256'] = getattr(upload, 'sha256', None)
+            record['spool_image'] = self._spool_upload(upload, record_id)
+        _fsync_write(os.path.join(self.spool_dir, record_id + RECORD_SUFFIX), record)
+
+        with self._lock:
+            self._stats['enqueued'] += 1
+        return record_id
+
+    def _spool_upload(self, upload, record_id):
+        path = os.path.join(self.spool_dir, record_id + '.upload')
+        if hasattr(upload, 'temporary_file_path'):
+            # Same filesystem as FILE_UPLOAD_TEMP_DIR: a rename, not a copy.
+            upload.file.flush()
+            os.fsync(upload.file.fileno())
+            os.replace(upload.temporary_file_path(), path)
+        else:
+            with open(path, 'wb') as f:
+                for chunk in upload.chunks():
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+        return path
+
+    # --- Writer side ---
+
+    def flush(self):
+        """Write every spooled record to the database. Returns the number written."""
+        written = 0
+        while True:
+            claimed = self._claim(self.batch_size)
+            if not claimed:
+                return written
+            try:
+                written += self._write(claimed)
+            except Exception:
+                with self._lock:
+                    self._stats['failed_batches'] += 1
+                # One record at a time, so one bad record cannot block the others.
+                for index, path in enumerate(claimed):
+                    try:
+                        written += self._write([path])
+                    except Exception as e:
+                        if _is_transient(e):
+                            # Not this record's fault: release the rest for a later flush.
+                            for pending in claimed[index:]:
+                                self._release(pending)
+                            raise
+                        logger.exception('Diagnosis record %s cannot be written; moved aside', path)
+                        self._quarantine(path)
+
+    def recover(self):
+        """Release claims held by processes that no longer exist."""
+        released = 0
+        for name in self._list():
+            record, _, pid = name.rpartition(RECORD_SUFFIX + '.')
+            if record and pid.isdigit() and not _pid_alive(int(pid)):
+                self._release(os.path.join(self.spool_dir, name))
+                released += 1
+        return released
+
+    def referenced_images(self):
+        """Storage names of images whose records are still in the spool."""
+        names = set()
+        for name in self._list():
+            if RECORD_SUFFIX in name and not name.endswith('.tmp'):
+                try:
+                    with open(os.path.join(self.spool_dir, name), encoding='utf-8') as f:
+                        image = json.load(f)['image']
+                except (FileNotFoundError, ValueError):
+                    continue
+                if image:
+                    names.add(image)
+        return names
+
+    def pending(self):
+        return sum(1 for name in self._list() if name.endswith(RECORD_SUFFIX))
+
+    def failed(self):
+        return sum(1 for name in self._list() if name.endswith(FAILED_SUFFIX))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'pending': self.pending(),
+            'failed': self.failed(),
+            'batch_size': self.batch_size,
+            'flush_interval_seconds': self.flush_interval,
+        })
+        return stats
+
+    def _list(self):
+        try:
+            return sorted(os.listdir(self.spool_dir))
+        except FileNotFoundError:
+            return []
+
+    def _claim(self, limit):
+        claimed = []
+        suffix = f'.{os.getpid()}'
+        for name in self._list():
+            if len(claimed) >= limit:
+                break
+            if not name.endswith(RECORD_SUFFIX):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                os.rename(path, path + suffix)
+            except FileNotFoundError:
+                # Claimed by another worker first.
+                continue
+            claimed.append(path + suffix)
+        return claimed
+
+    def _quarantine(self, claim_path):
+        try:
+            os.replace(claim_path, claim_path.rpartition('.')[0] + FAILED_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+    def _release(self, claim_path):
+        try:
+            os.rename(claim_path, claim_path.rpartition('.')[0])
+        except FileNotFoundError:
+            pass
+
+    def _write(self, claimed):
+        image_field = Diagnosis._meta.get_field('image')
+        records = []
+        for claim_path in claimed:
+            with open(claim_path, encoding='utf-8') as f:
+                record = json.load(f)
+            record_id = os.path.basename(claim_path).partition(RECORD_SUFFIX)[0]
+            if record['image'] is None:
+                with open(record['spool_image'], 'rb') as f, timed('writer_image_write'):
+                    spooled = SpooledFile(f)
+                    spooled.sha256 = record.get('sha256')
+                    record['image'] = image_field.storage.save(
+                        image_field.generate_filename(None, record['filename']), spooled
+                    )
+                if os.path.exists(record['spool_image']):
+                    # The storage already had this content and did not take the file.
+                    os.remove(record['spool_image'])
+                # Remember the stored name so a retry does not look for the moved spool file.
+                _fsync_write(claim_path, record)
+            records.append((record_id, record))
+
+        with timed('writer_db_insert'), transaction.atomic():
+            existing = set(
+                Diagnosis.objects.filter(spool_id__in=[record_id for record_id, _ in records])
+                .values_list('spool_id', flat=True)
+            )
+            created = Diagnosis.objects.bulk_create([
+                Diagnosis(user_id=record['user_id'], image=record['image'], result=record['result'], spool_id=record_id)
+                for record_id, record in records if record_id not in existing
+            ])
+            # bulk_create sends no post_save, so the history versions are bumped here (see api/http_cache.py).
+            user_ids = {diagnosis.user_id for diagnosis in created}
+
+            def bump_histories():
+                for user_id in user_ids:
+                    bump_version(history_scope(user_id))
+
+            transaction.on_commit(bump_histories)
+
+        for claim_path in claimed:
+            os.remove(claim_path)
+        for image_name in {diagnosis.image.name for diagnosis in created}:
+            try:
+                with timed('writer_thumbnails'):
+                    build_derivatives(image_name, image_field.storage)
+            except Exception:
+                # Built lazily on first listing instead.
+                logger.exception('Could not build derivatives of %s', image_name)
+        with self._lock:
+            self._stats['written'] += len(created)
+            self._stats['batches'] += 1
+        return len(created)
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='diagnosis-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception:
+            logger.exception('Could not release stale diagnosis spool claims')
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing spooled diagnoses failed; will retry')
+            finally:
+                close_old_connections()
+
+
+diagnosis_writer = DiagnosisWriter(
+    spool_dir=settings.DIAGNOSIS_PERSISTENCE['SPOOL_DIR'],
+    batch_size=settings.DIAGNOSIS_PERSISTENCE['BATCH_SIZE'],
+    flush_interval=settings.DIAGNOSIS_PERSISTENCE['FLUSH_INTERVAL_SECONDS'],
+)
+
+
+def is_deferred():
+    return settings.DIAGNOSIS_PERSISTENCE['MODE'] == 'deferred'
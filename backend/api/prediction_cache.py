@@ -0,0 +1,125 @@
+"""
+Cache of model scores keyed by the preprocessed image.
+
+The key is a SHA-256 of the normalized 100x125 RGB tensor plus the model
+version, so re-uploads of the same photo (and the frontend's example images)
+skip the forward pass. Only raw scores are cached. Tips are still assembled
+per request for the user's skin type.
+
+There are two tiers:
+
+* a bounded in-process LRU with a TTL, and
+* an optional shared tier in a Django cache (``INFERENCE['CACHE']['SHARED_ALIAS']``),
+  e.g. a file-based or Redis cache, so all workers benefit from each other's results.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'prediction:'
+
+
+class PredictionCache:
+    def __init__(self, max_entries=1024, ttl=3600, shared_alias=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {
+            'memory_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+        }
+
+    @staticmethod
+    def make_key(img_array, model_version):
+        img_array = np.ascontiguousarray(img_array, dtype=np.uint8)
+        digest = hashlib.sha256()
+        digest.update(str(model_version).encode('utf-8'))
+        digest.update(repr(img_array.shape).encode('ascii'))
+        digest.update(img_array.data)
+        return digest.hexdigest()
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, key):
+        """Return cached scores for ``key`` or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, scores = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return scores
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        if self.shared is not None:
+            scores = self.shared.get(KEY_PREFIX + key)
+            if scores is not None:
+                scores = self._freeze(scores)
+                self._remember(key, scores)
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return scores
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key, scores):
+        scores = self._freeze(scores)
+        self._remember(key, scores)
+        if self.shared is not None:
+            self.shared.set(KEY_PREFIX + key, scores, timeout=self.ttl)
+
+    def _remember(self, key, scores):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, scores)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    @staticmethod
+    def _freeze(scores):
+        # Cached rows are shared between requests, so make them immutable.
+        scores = np.array(scores, dtype=np.float32)
+        scores.setflags(write=False)
+        return scores
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['shared_hits'] + stats['misses']
+        stats.update({
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'shared_alias': self.shared_alias,
+            'hit_rate': (stats['memory_hits'] + stats['shared_hits']) / lookups if lookups else 0.0,
+        })
+        return stats
+
+
+prediction_cache = PredictionCache(
+    max_entries=settings.INFERENCE['CACHE']['MAX_ENTRIES'],
+    ttl=settings.INFERENCE['CACHE']['TTL_SECONDS'],
+    shared_alias=settings.INFERENCE['CACHE']['SHARED_ALIAS'],
+)
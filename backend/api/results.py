@@ -0,0 +1,69 @@
+"""
+Compact storage format for ``Diagnosis.result``.
+
+Rows used to store the whole API response, including every tips paragraph,
+so each row repeated kilobytes of the same Korean text. Rows now store::
+
+    {"v": 2, "labels": [2, 3], "scores": [81.52, 12.3], "skin_type": "oily",
+     "model": "3fa2c1d0e9b84a11", "tips": 1}
+
+* ``labels``: ids into ``tips_labels(tips)`` (a label missing from that table
+  is stored by name),
+* ``scores``: the confidences shown, in percent,
+* ``skin_type``: the skin type the tips were chosen for,
+* ``model``: the model version that produced the scores,
+* ``tips``: the tips table version (api/tips.py).
+
+``expand_result`` rebuilds the ``{"predictions", "tips"}`` payload the API
+has always returned. Rows without ``"v"`` are legacy full payloads and are
+returned unchanged.
+"""
+from .tips import build_tips, stored_tips_table, tips_table
+
+RESULT_FORMAT = 2
+# Full payloads were all written with the first tips version.
+LEGACY_TIPS_VERSION = 1
+
+
+def compact_result(predictions, skin_type, model_version=None, tips_version=None):
+    table = tips_table(tips_version)
+    return {
+        'v': RESULT_FORMAT,
+        'labels': [table.label_ids.get(item['label'], item['label']) for item in predictions],
+        'scores': [item['confidence'] for item in predictions],
+        'skin_type': skin_type,
+        'model': model_version,
+        'tips': table.version,
+    }
+
+
+def expand_result(result):
+    if not isinstance(result, dict) or result.get('v') != RESULT_FORMAT:
+        return result
+    table = stored_tips_table(result['tips'])
+    predictions = [
+        {'label': table.labels[label] if isinstance(label, int) and label < len(table.labels) else label,
+         'confidence': score}
+        for label, score in zip(result['labels'], result['scores'])
+    ]
+    return {
+        'predictions': predictions,
+        'tips': build_tips(predictions, result['skin_type'], table=table),
+    }
+
+
+def compact_legacy_result(result):
+    """
+    Compact form of a legacy full payload, or None if it cannot be rebuilt exactly
+    (e.g. its tips no longer match any skin type in the tips table).
+    """
+    if not isinstance(result, dict) or 'v' in result or not result.get('predictions'):
+        return None
+    # The skin type was not stored; find one whose tips reproduce the row,
+    # preferring 'default' when the labels shown have no skin-specific tips.
+    expected = {'predictions': result['predictions'], 'tips': result.get('tips', [])}
+    for skin_type in ('default',) + tips_table(LEGACY_TIPS_VERSION).skin_types:
+        compact = compact_result(result['predictions'], skin_type, tips_version=LEGACY_TIPS_VERSION)
+        if expand_result(compact) == expected:
+            return compact
+    return None
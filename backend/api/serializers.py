@@ -1,7 +1,11 @@
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .authentication import CLAIMS_TIME_CLAIM
 from .models import Diagnosis, Review, Profile
+from .results import expand_result
+from .thumbnails import derivative_url
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
@@ -11,6 +15,11 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Add custom claims
         token['username'] = user.username
         token['is_staff'] = user.is_staff
+        # Read by ClaimsJWTAuthentication so predictions need no profile query.
+        profile = getattr(user, 'profile', None)
+        token['skin_type'] = profile.skin_type if profile else None
+        # Copied to refreshed access tokens with the claims above, unlike iat.
+        token[CLAIMS_TIME_CLAIM] = token['iat']
 
         return token
 
@@ -22,7 +31,9 @@ class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('username', 'password', 'age', 'gender', 'skin_type')
-        extra_kwargs = {'password': {'write_only': True}}
+        # validate_username already checks uniqueness (with a Korean message), so skip
+        # the model's UniqueValidator and its duplicate query.
+        extra_kwargs = {'password': {'write_only': True}, 'username': {'validators': [UnicodeUsernameValidator()]}}
 
     def validate_username(self, value):
         if User.objects.filter(username=value).exists():
@@ -69,10 +80,36 @@ class ReviewSerializer(serializers.ModelSerializer):
         review = Review.objects.create(user=user, **validated_data)
         return review
 
+class DerivativeImageField(serializers.Field):
+    """Absolute URL of a resized copy of the diagnosis image (see api/thumbnails.py)."""
+
+    def __init__(self, size, **kwargs):
+        self.size = size
+        kwargs['source'] = 'image'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, image):
+        url = derivative_url(image, self.size)
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+class ResultField(serializers.Field):
+    """Expands the compact stored result into the `predictions`/`tips` payload (see api/results.py)."""
+
+    def to_representation(self, value):
+        return expand_result(value)
+
 class DiagnosisSerializer(serializers.ModelSerializer):
+    thumbnail = DerivativeImageField('thumbnail')
+    medium = DerivativeImageField('medium')
+    result = ResultField(read_only=True)
+
     class Meta:
         model = Diagnosis
-        fields = ['id', 'image', 'result', 'created_at']
+        fields = ['id', 'image', 'thumbnail', 'medium', 'result', 'created_at']
 
 class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -86,16 +123,25 @@ class UserSerializerForProfile(serializers.ModelSerializer):
         model = User
         fields = ('username', 'profile')
 
+    @staticmethod
+    def profile_of(user):
+        # One query via the reverse accessor (none if select_related); only users
+        # created before profiles existed get one created here.
+        try:
+            return user.profile
+        except Profile.DoesNotExist:
+            user.profile = Profile.objects.create(user=user)
+            return user.profile
+
     def get_profile(self, obj):
-        profile, created = Profile.objects.get_or_create(user=obj)
-        return ProfileSerializer(profile).data
+        return ProfileSerializer(self.profile_of(obj)).data
 
     def update(self, instance, validated_data):
         # This part of the update logic is now handled by the ProfileView's serializer
         # We can simplify or adjust if needed, but for now, let's focus on retrieval.
         # The existing update logic in ProfileView should handle nested updates.
         profile_data = self.context['request'].data.get('profile', {})
-        profile = instance.profile
+        profile = self.profile_of(instance)
 
         instance.username = validated_data.get('username', instance.username)
         instance.save()
@@ -128,6 +174,9 @@ class ReviewAdminSerializer(serializers.ModelSerializer):
 
 class DiagnosisAdminSerializer(serializers.ModelSerializer):
     user = UserDisplaySerializer(read_only=True)
+    thumbnail = DerivativeImageField('thumbnail')
+    medium = DerivativeImageField('medium')
+    result = ResultField(read_only=True)
     class Meta:
         model = Diagnosis
-        fields = ['id', 'user', 'image', 'result', 'created_at']
+        fields = ['id', 'user', 'image', 'thumbnail', 'medium', 'result', 'created_at']
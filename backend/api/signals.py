@@ -0,0 +1,84 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import principal_data, remember_principal
+from .http_cache import REVIEWS, bump_version, history_scope
+from .models import Diagnosis, Profile, Review
+from .thumbnails import delete_derivatives
+
+
+def release_image(storage, name):
+    """
+    Delete an image file and its thumbnails once no Diagnosis refers to it.
+    Files saved within ``MEDIA_GRACE_SECONDS`` are left to gc_media, since
+    another prediction may be about to use them (see api/storage.py).
+    """
+    if storage.delete_if_stale(name, in_use=Diagnosis.objects.filter(image=name).exists):
+        delete_derivatives(name)
+
+
+@receiver(post_delete, sender=Diagnosis)
+def release_diagnosis_image(sender, instance, **kwargs):
+    if not instance.image:
+        return
+    storage, name = instance.image.storage, instance.image.name
+    # After commit, so a rolled-back delete keeps its file.
+    transaction.on_commit(lambda: release_image(storage, name))
+
+
+# Token claims go stale when a user or profile changes; the cache keeps the
+# current values for ClaimsJWTAuthentication (see api/authentication.py).
+
+@receiver(post_save, sender=User)
+def remember_changed_user(sender, instance, created, **kwargs):
+    if created:
+        # No token has been issued yet.
+        return
+    if User.profile.is_cached(instance):
+        skin_type = instance.profile.skin_type
+    else:
+        skin_type = Profile.objects.filter(user_id=instance.pk).values_list('skin_type', flat=True).first()
+    data = principal_data(instance, skin_type)
+    transaction.on_commit(lambda: remember_principal(instance.pk, data))
+
+
+@receiver(post_save, sender=Profile)
+def remember_changed_profile(sender, instance, created, **kwargs):
+    if created:
+        # Registration creates it before any token is issued; a profile added later for
+        # an older user has no skin type yet, which is what that user's tokens carry.
+        return
+    data = principal_data(instance.user, instance.skin_type)
+    transaction.on_commit(lambda: remember_principal(instance.user_id, data))
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    data = dict(principal_data(instance, None), is_active=False)
+    user_id = instance.pk
+    transaction.on_commit(lambda: remember_principal(user_id, data))
+
+
+# Versions behind the ETags of the review list and each user's history (see api/http_cache.py).
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def bump_reviews_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(REVIEWS))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_reviews_version_for_user(sender, created=False, **kwargs):
+    # Reviews show the username; a new user has none yet.
+    if not created:
+        transaction.on_commit(lambda: bump_version(REVIEWS))
+
+
+@receiver(post_save, sender=Diagnosis)
+@receiver(post_delete, sender=Diagnosis)
+def bump_history_version(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: bump_version(history_scope(user_id)))
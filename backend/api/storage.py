@@ -0,0 +1,138 @@
+"""
+Content-addressed storage for diagnosis images.
+
+An image is stored under the SHA-256 of its bytes, sharded by the first two
+byte pairs of the digest::
+
+    diagnoses/3f/a2/3fa2...e1.jpg
+
+Saving the same photo again returns the existing name instead of writing a
+second copy with a random suffix, also when two uploads of it race: each
+writes a temporary file, and only the first is moved into place. The upload handler has already hashed the
+upload (``uploaded_file.sha256``, see api/upload_handlers.py). Other content
+is hashed here.
+
+Several Diagnosis rows can therefore share one file. The rows are its
+reference count. ``api/signals.py`` deletes a file (and its thumbnails) only
+when the last row using it is deleted, and ``python manage.py gc_media``
+removes files that no row or spooled record refers to.
+
+A file is saved before the row that uses it is inserted, so "no row refers
+to it" is also true of a file another request is about to use. Saving
+existing content therefore refreshes the file's modification time, and
+``delete_if_stale`` only deletes files older than ``MEDIA_GRACE_SECONDS``.
+Both run under a lock file in the storage location, so a save cannot slip
+in between the age check and the delete.
+"""
+import contextlib
+import fcntl
+import hashlib
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+LOCK_NAME = '.content.lock'
+
+
+def content_name(directory, digest, extension):
+    return f'{directory}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}'
+
+
+def walk_files(storage, directory):
+    """Yield the name of every file below ``directory`` in ``storage``."""
+    try:
+        directories, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield f'{directory}/{name}'
+    for subdirectory in directories:
+        yield from walk_files(storage, f'{directory}/{subdirectory}')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_content_name(self, name, content):
+        """The name ``save(name, content)`` stores ``content`` under, without storing it."""
+        digest = getattr(content, 'sha256', None) or self.hash_content(content)
+        directory, filename = os.path.split(name)
+        return content_name(directory, digest, os.path.splitext(filename)[1])
+
+    def _save(self, name, content):
+        name = self.get_content_name(name, content)
+        with self.lock():
+            if self._reuse(name):
+                return name
+        # Written outside the lock, so other uploads are not held up, under a name of its
+        # own; then moved into place unless a concurrent save of the same content won.
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        with self.lock():
+            if self._reuse(name):
+                self.delete(temporary)
+            else:
+                os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def _reuse(self, name):
+        if not self.exists(name):
+            return False
+        # In use again: restart its grace period.
+        os.utime(self.path(name))
+        return True
+
+    def delete_if_stale(self, name, grace_seconds=None, in_use=None):
+        """
+        Delete ``name`` unless it was saved within the grace period or
+        ``in_use()`` (checked under the lock) is true. Returns whether it was deleted.
+        """
+        if grace_seconds is None:
+            grace_seconds = settings.MEDIA_GRACE_SECONDS
+        with self.lock():
+            try:
+                if self.get_modified_time(name).timestamp() > time.time() - grace_seconds:
+                    return False
+            except FileNotFoundError:
+                return False
+            if in_use is not None and in_use():
+                return False
+            self.delete(name)
+        return True
+
+    @contextlib.contextmanager
+    def lock(self):
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, LOCK_NAME), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def hash_content(content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+class OverwritingStorage(FileSystemStorage):
+    """
+    Saving a name that exists replaces the file instead of picking a new name.
+    The content is written to a temporary file first and renamed over the
+    old one, so readers and concurrent saves never see a partial file.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+def diagnosis_storage():
+    return ContentAddressedStorage()
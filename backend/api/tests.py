@@ -1,3 +1,1623 @@
-from django.test import TestCase
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from backend_project.serving import plan_inference, plan_topology
+
+from .async_views import AsyncPredictionView, AsyncReviewList
+from .authentication import CLAIMS_TIME_CLAIM, ClaimsJWTAuthentication, last_change_key, principal_cache, principal_key
+from .backends import IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS, load_backend
+from .batching import MicroBatcher, QueueFullError
+from .jobs import DONE, FAILED, JobQueue, JobServerUnavailable, RemoteJobQueue, handle_message
+from .model_registry import ModelNotReady, predict_on_pool
+from .models import Diagnosis, Profile, Review
+from .persistence import DiagnosisWriter
+from .serializers import MyTokenObtainPairSerializer
+from .metrics import record, timed
+from .postprocessing import top_predictions
+from .prediction_cache import PredictionCache
+from .preprocessing import ImageTooLarge, load_image_array
+from .results import RESULT_FORMAT, compact_legacy_result, compact_result, expand_result
+from .thumbnails import build_derivatives, derivative_name, derivative_url, derivatives
+from .tips import build_tips, tips_labels
+from .views import build_prediction_response, get_skin_type, persist_job
+
+
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+NUM_CLASSES = 6
+SCORE_TOLERANCE = 1e-5
+
+
+@unittest.skipUnless(has_module('tensorflow'), 'tensorflow is not installed')
+class BackendParityTests(TestCase):
+    """Exported runtimes must reproduce the Keras scores for the same weights."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .keras_model import build_training_model
+
+        cls.model_dir = tempfile.mkdtemp()
+        cls.weights = os.path.join(cls.model_dir, 'keras.h5')
+        build_training_model(NUM_CLASSES).save(cls.weights)
+        cls.keras = load_backend('keras', cls.model_dir, NUM_CLASSES)
+        rng = np.random.default_rng(42)
+        cls.batch = rng.integers(0, 256, size=(5, IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS)).astype(np.float32)
+        cls.expected = cls.keras.predict(cls.batch)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.model_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def export(self, fmt, filename):
+        output = os.path.join(self.model_dir, filename)
+        call_command('export_model', format=fmt, weights=self.weights, output=output,
+                     num_classes=NUM_CLASSES, stdout=StringIO())
+        return load_backend(fmt, self.model_dir, NUM_CLASSES, model_path=output)
+
+    @unittest.skipUnless(has_module('tf2onnx') and has_module('onnxruntime'), 'tf2onnx/onnxruntime are not installed')
+    def test_onnx_matches_keras(self):
+        backend = self.export('onnx', 'model.onnx')
+        np.testing.assert_allclose(backend.predict(self.batch), self.expected, atol=SCORE_TOLERANCE)
+
+    def test_tflite_matches_keras(self):
+        backend = self.export('tflite', 'model.tflite')
+        np.testing.assert_allclose(backend.predict(self.batch), self.expected, atol=SCORE_TOLERANCE)
+        # The interpreter is resized when the batch size changes.
+        np.testing.assert_allclose(backend.predict(self.batch[:1]), self.expected[:1], atol=SCORE_TOLERANCE)
+
+    @unittest.skipUnless(has_module('h5py'), 'h5py is not installed')
+    def test_numpy_matches_keras(self):
+        backend = load_backend('numpy', self.model_dir, NUM_CLASSES)
+        np.testing.assert_allclose(backend.predict(self.batch), self.expected, atol=SCORE_TOLERANCE)
+        # Rows are independent of the batch they are computed in.
+        np.testing.assert_allclose(backend.predict(self.batch[2:3]), self.expected[2:3], atol=SCORE_TOLERANCE)
+
+
+@override_settings(
+    AUTH_PRINCIPAL=dict(settings.AUTH_PRINCIPAL, CACHE_ALIAS='default'),
+    HTTP_CACHE=dict(settings.HTTP_CACHE, CACHE_ALIAS='default'),
+)
+class APITestCase(TestCase):
+    """
+    The auth and HTTP caches are files shared with a running server. API tests
+    use the per-process cache instead, emptied before each test.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+
+
+class QueryPlanTests(APITestCase):
+    """
+    The list/detail queries behind these endpoints must be answered from an index,
+    without a full table scan or a sort. A dropped or mismatched index fails here.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        cls.users = [User.objects.create_user(f'user{i}', password='pw') for i in range(3)]
+        for user in cls.users:
+            Review.objects.create(user=user, rating=5, text='good')
+            for i in range(3):
+                Diagnosis.objects.create(user=user, image=f'diagnoses/{user.username}-{i}.jpg', result={})
+
+    def explain(self, path, user, table):
+        """Run GET ``path`` and return the query plan of its ordered query on ``table``."""
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.content)
+        selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql'] and 'COUNT(' not in query['sql']
+        ]
+        self.assertTrue(selects, f'No query on {table} for {path}')
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + selects[0])
+                return '\n'.join(row[-1] for row in cursor.fetchall())
+            if connection.vendor == 'postgresql':
+                # Tables this small are always seq-scanned unless told otherwise.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + selects[0])
+                return '\n'.join(row[0] for row in cursor.fetchall())
+        self.skipTest(f'No plan check for {connection.vendor}')
+
+    def assertUsesIndex(self, plan, index):
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)  # SQLite sort step
+        self.assertNotIn('Sort', plan)  # PostgreSQL sort step
+
+    def test_history_uses_user_created_index(self):
+        plan = self.explain('/api/history/', self.users[0], 'api_diagnosis')
+        self.assertUsesIndex(plan, 'diagnosis_user_created_idx')
+
+    def test_history_detail_uses_primary_key(self):
+        diagnosis = Diagnosis.objects.filter(user=self.users[0]).first()
+        plan = self.explain(f'/api/history/{diagnosis.pk}/', self.users[0], 'api_diagnosis')
+        self.assertRegex(plan, 'PRIMARY KEY|api_diagnosis_pkey')
+
+    def test_admin_diagnoses_use_created_index(self):
+        plan = self.explain('/api/admin/diagnoses/', self.admin, 'api_diagnosis')
+        self.assertUsesIndex(plan, 'diagnosis_created_idx')
+
+    def test_reviews_use_created_index(self):
+        for path in ('/api/reviews/', '/api/admin/reviews/'):
+            with self.subTest(path=path):
+                self.assertUsesIndex(self.explain(path, self.admin, 'api_review'), 'review_created_idx')
+
+    def test_cursor_pages_use_index(self):
+        self.client.force_authenticate(self.admin)
+        next_page = self.client.get('/api/admin/diagnoses/', {'page_size': 2}).json()['next']
+        plan = self.explain(next_page, self.admin, 'api_diagnosis')
+        self.assertUsesIndex(plan, 'diagnosis_created_idx')
+
+    def test_admin_users_use_date_joined_index(self):
+        plan = self.explain('/api/admin/users/', self.admin, 'auth_user')
+        self.assertUsesIndex(plan, 'auth_user_date_joined_idx')
+
+
+def make_upload(name='photo.jpg', seed=0):
+    buffer = BytesIO()
+    rng = np.random.default_rng(seed)
+    Image.fromarray(rng.integers(0, 256, size=(60, 80, 3), dtype=np.uint8)).save(buffer, 'JPEG')
+    buffer.seek(0)
+    buffer.name = name
+    return buffer
+
+
+class FakeModel:
+    labels = ['여드름 피부', '정상 피부']
+
+
+def patch_registry(test):
+    """FakeModel's labels and a fixed model version, instead of reading the model files."""
+    for patch in (
+        mock.patch('api.model_registry.registry.get_labels', return_value=FakeModel.labels),
+        mock.patch('api.model_registry.registry.get_model_version', return_value='test'),
+    ):
+        patch.start()
+        test.addCleanup(patch.stop)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    DIAGNOSIS_PERSISTENCE=dict(settings.DIAGNOSIS_PERSISTENCE, MODE='sync'),
+)
+class NumQueriesTests(APITestCase):
+    """
+    Query counts per endpoint in api/urls.py. List endpoints are measured with
+    few and with many rows and must not grow with the page size.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        Profile.objects.create(user=cls.admin, skin_type='dry')
+        cls.user = User.objects.create_user('user', password='pw')
+        Profile.objects.create(user=cls.user, skin_type='oily')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def login(self, user):
+        # A real JWT as issued at login, so authentication is part of every count.
+        token = MyTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def add_rows(self, count):
+        # Run the on-commit hooks so list versions change as after a real commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_rows(count)
+
+    def create_rows(self, count):
+        for i in range(count):
+            user = User.objects.create_user(f'extra{User.objects.count()}', password='pw')
+            Profile.objects.create(user=user, skin_type='normal')
+            Review.objects.create(user=user, rating=4, text='ok')
+            Diagnosis.objects.create(user=self.user, image=f'diagnoses/{uuid.uuid4().hex}.jpg', result={})
+
+    def assertConstantQueries(self, num, method, path, user=None, **kwargs):
+        if user is not None:
+            self.login(user)
+        for rows in (1, 10):
+            self.add_rows(rows)
+            with self.subTest(rows=rows), self.assertNumQueries(num):
+                response = getattr(self.client, method)(path, **kwargs)
+            self.assertEqual(response.status_code, 200, response.content)
+
+    # --- Auth / profile ---
+
+    def test_register(self):
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/users/register/', {
+                'username': 'new', 'password': 'pw12345!', 'age': 20, 'gender': 'F', 'skin_type': 'dry',
+            })
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_login(self):
+        # user, profile (for the skin_type claim)
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/users/login/', {'username': 'user', 'password': 'pw'})
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_token_refresh(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        # The user is looked up to check it is still active.
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_profile(self):
+        self.login(self.user)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.json()['profile']['skin_type'], 'oily')
+        # auth, username uniqueness, profile, two updates
+        with self.assertNumQueries(5):
+            response = self.client.put('/api/profile/', {'username': 'user', 'profile': {'age': 30}}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_profile_created_for_legacy_user(self):
+        legacy = User.objects.create_user('legacy', password='pw')
+        self.login(legacy)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_change_password(self):
+        self.login(self.user)
+        # auth, update, the skin type for the auth cache (api/signals.py)
+        with self.assertNumQueries(3):
+            response = self.client.put('/api/change-password/', {'old_password': 'pw', 'new_password': 'pw2'})
+        self.assertEqual(response.status_code, 200, response.content)
+
+    # --- Prediction ---
+
+    def patch_model(self):
+        patch_registry(self)
+        patches = [
+            mock.patch('api.views.predict_scores', return_value=np.array([0.9, 0.1], dtype=np.float32)),
+            mock.patch('api.views.predict_scores_batch',
+                       side_effect=lambda arrays: [np.array([0.9, 0.1], dtype=np.float32)] * len(arrays)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_predict(self):
+        self.patch_model()
+        self.login(self.user)
+        # insert (the user and skin type come from the token)
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/predict/', {'image': make_upload()})
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_predict_batch(self):
+        self.patch_model()
+        self.login(self.user)
+        # one bulk insert in a transaction (savepoint + insert + release)
+        for count in (1, 4):
+            with self.subTest(images=count), CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/predict/batch/', {
+                    'images': [make_upload(f'{i}.jpg', seed=i) for i in range(count)],
+                })
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(len(queries), 3, [q['sql'] for q in queries.captured_queries])
+
+    def test_failed_batch_keeps_shared_images(self):
+        self.patch_model()
+        self.login(self.user)
+        self.client.post('/api/predict/batch/', {'images': [make_upload(seed=7)]})
+        image = Diagnosis.objects.get().image
+        with mock.patch.object(Diagnosis.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            response = self.client.post('/api/predict/batch/', {'images': [make_upload(seed=7)]})
+        self.assertIn('error', response.json()['results'][0])
+        self.assertTrue(image.storage.exists(image.name))
+
+    def test_predict_stats(self):
+        self.login(self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/predict/stats/')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_predict_job_unknown(self):
+        self.login(self.user)
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/predict/{uuid.uuid4()}/')
+        self.assertEqual(response.status_code, 404, response.content)
+
+    def test_examples_and_health(self):
+        queue = mock.Mock(**{'status.return_value': {'state': 'ready'}})
+        with mock.patch('api.views.get_job_queue', return_value=queue), self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/examples/').status_code, 200)
+            self.assertEqual(self.client.get('/api/health/ready/').status_code, 200)
+
+    # --- Reviews ---
+
+    def test_review_list(self):
+        self.assertConstantQueries(1, 'get', '/api/reviews/')
+
+    def test_review_create(self):
+        self.login(self.user)
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/reviews/create/', {'rating': 5, 'text': 'great'})
+        self.assertEqual(response.status_code, 201, response.content)
+
+    # --- History ---
+
+    def test_history(self):
+        self.assertConstantQueries(2, 'get', '/api/history/', user=self.user)
+
+    def test_history_detail(self):
+        diagnosis = Diagnosis.objects.create(user=self.user, image='diagnoses/a.jpg', result={})
+        self.login(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(f'/api/history/{diagnosis.pk}/').status_code, 200)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.delete(f'/api/history/{diagnosis.pk}/').status_code, 204)
+
+    # --- Admin ---
+
+    def test_admin_root(self):
+        self.login(self.admin)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/admin/').status_code, 200)
+
+    def test_admin_users(self):
+        self.assertConstantQueries(2, 'get', '/api/admin/users/', user=self.admin)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(f'/api/admin/users/{self.user.pk}/').status_code, 200)
+
+    def test_admin_reviews(self):
+        self.assertConstantQueries(2, 'get', '/api/admin/reviews/', user=self.admin)
+        review = Review.objects.first()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(f'/api/admin/reviews/{review.pk}/').status_code, 200)
+
+    def test_admin_diagnoses(self):
+        self.assertConstantQueries(2, 'get', '/api/admin/diagnoses/', user=self.admin)
+        diagnosis = Diagnosis.objects.first()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(f'/api/admin/diagnoses/{diagnosis.pk}/').status_code, 200)
+
+
+class UploadHandlerTests(APITestCase):
+    """HashingImageUploadHandler, through a parsed request and through the predict endpoint."""
+
+    def post(self, files):
+        request = RequestFactory().post('/api/predict/batch/', {'images': files})
+        return request.FILES.getlist('images'), request.upload_rejections
+
+    def tiny_png(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+        buffer.seek(0)
+        buffer.name = 'tiny.png'
+        return buffer
+
+    def test_hash_and_temporary_file(self):
+        upload = make_upload()
+        expected = hashlib.sha256(upload.getvalue()).hexdigest()
+        files, rejections = self.post([upload])
+        self.assertEqual(rejections, [])
+        self.assertEqual(files[0].sha256, expected)
+        self.assertEqual(files[0].upload_index, 0)
+        # Streamed to FILE_UPLOAD_TEMP_DIR, never held in memory as a whole.
+        self.assertTrue(files[0].temporary_file_path().startswith(settings.FILE_UPLOAD_TEMP_DIR))
+        files[0].close()
+
+    def test_file_that_is_not_an_image(self):
+        text = BytesIO(b'just some text, not an image')
+        text.name = 'notes.jpg'
+        files, rejections = self.post([text, make_upload()])
+        self.assertEqual([f.upload_index for f in files], [1])
+        self.assertEqual([(r['index'], r['filename'], r['status']) for r in rejections], [(0, 'notes.jpg', 415)])
+
+    @override_settings(UPLOAD_MAX_IMAGE_BYTES=2000)
+    def test_file_over_the_size_limit(self):
+        big = make_upload('big.jpg')
+        self.assertGreater(len(big.getvalue()), 2000)
+        files, rejections = self.post([big, self.tiny_png()])
+        self.assertEqual([(f.name, f.upload_index) for f in files], [('tiny.png', 1)])
+        self.assertEqual([(r['index'], r['filename'], r['status']) for r in rejections], [(0, 'big.jpg', 413)])
+
+    @override_settings(UPLOAD_MAX_IMAGE_BYTES=100, INFERENCE=dict(settings.INFERENCE, BATCH_UPLOAD_MAX_IMAGES=1))
+    def test_request_over_the_total_limit(self):
+        # Refused on the first file, from Content-Length alone.
+        files, rejections = self.post([self.tiny_png(), self.tiny_png()])
+        self.assertEqual(files, [])
+        self.assertEqual([(r['index'], r['status']) for r in rejections], [(0, 413)])
+
+    def test_predict_reports_the_rejection(self):
+        user = User.objects.create_user('user', password='pw')
+        self.client.force_authenticate(user)
+        text = BytesIO(b'just some text, not an image')
+        text.name = 'notes.jpg'
+        patch_registry(self)
+        response = self.client.post('/api/predict/', {'image': text})
+        self.assertEqual(response.status_code, 415, response.content)
+        self.assertEqual(response.json(), {'error': 'The uploaded file is not a supported image.'})
+
+
+class PredictionCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.oily = User.objects.create_user('oily', password='pw')
+        Profile.objects.create(user=cls.oily, skin_type='oily')
+        cls.dry = User.objects.create_user('dry', password='pw')
+        Profile.objects.create(user=cls.dry, skin_type='dry')
+
+    def setUp(self):
+        super().setUp()
+        self.image = np.random.default_rng(0).integers(0, 256, size=(IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS), dtype=np.uint8)
+        self.scores = np.array([0.9, 0.1], dtype=np.float32)
+
+    def test_memory_and_shared_tiers(self):
+        # Two workers sharing the 'default' cache, and one without a shared tier.
+        first = PredictionCache(max_entries=2, ttl=60, shared_alias='default')
+        second = PredictionCache(max_entries=2, ttl=60, shared_alias='default')
+        alone = PredictionCache(max_entries=2, ttl=60)
+        key = PredictionCache.make_key(self.image, 'v1')
+        self.assertIsNone(first.get(key))
+
+        first.set(key, self.scores)
+        np.testing.assert_array_equal(first.get(key), self.scores)
+        np.testing.assert_array_equal(second.get(key), self.scores)
+        # Promoted to the second worker's memory tier.
+        np.testing.assert_array_equal(second.get(key), self.scores)
+        self.assertIsNone(alone.get(key))
+
+        self.assertEqual({name: first.stats()[name] for name in ('memory_hits', 'shared_hits', 'misses')},
+                         {'memory_hits': 1, 'shared_hits': 0, 'misses': 1})
+        self.assertEqual({name: second.stats()[name] for name in ('memory_hits', 'shared_hits', 'misses')},
+                         {'memory_hits': 1, 'shared_hits': 1, 'misses': 0})
+        self.assertFalse(first.get(key).flags.writeable)
+
+    def test_model_version_is_part_of_the_key(self):
+        cache = PredictionCache(max_entries=4, ttl=60)
+        cache.set(PredictionCache.make_key(self.image, 'v1'), self.scores)
+        self.assertNotEqual(PredictionCache.make_key(self.image, 'v1'), PredictionCache.make_key(self.image, 'v2'))
+        self.assertIsNone(cache.get(PredictionCache.make_key(self.image, 'v2')))
+        self.assertIsNotNone(cache.get(PredictionCache.make_key(self.image, 'v1')))
+
+    def test_eviction_and_expiry(self):
+        cache = PredictionCache(max_entries=2, ttl=60)
+        keys = [PredictionCache.make_key(self.image + i, 'v1') for i in range(3)]
+        for key in keys:
+            cache.set(key, self.scores)
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        expired = PredictionCache(max_entries=2, ttl=0)
+        expired.set(keys[0], self.scores)
+        self.assertIsNone(expired.get(keys[0]))
+        self.assertEqual(expired.stats()['expirations'], 1)
+
+    def test_tips_follow_the_skin_type_on_a_hit(self):
+        cache = PredictionCache(max_entries=4, ttl=60)
+        predict = mock.Mock(return_value=self.scores)
+        patch_registry(self)
+        patches = [
+            mock.patch('api.views.prediction_cache', cache),
+            mock.patch('api.views.batcher.predict', predict),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        tips = {}
+        for user in (self.oily, self.dry):
+            token = MyTokenObtainPairSerializer.get_token(user).access_token
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            response = self.client.post('/api/predict/', {'image': make_upload(), 'is_example': 'true'})
+            self.assertEqual(response.status_code, 200, response.content)
+            tips[user.username] = response.json()['tips']
+            self.assertEqual(response.json(), build_prediction_response(self.scores, FakeModel.labels, user.username))
+
+        # The model ran once; the second user got the cached scores with their own tips.
+        self.assertEqual(predict.call_count, 1)
+        self.assertEqual(cache.stats()['memory_hits'], 1)
+        self.assertNotEqual(tips['oily'], tips['dry'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DiagnosisWriterTests(APITestCase):
+    """The write-behind spool of api/persistence.py, flushed by hand instead of by the writer thread."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='pw')
+
+    def setUp(self):
+        super().setUp()
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        self.writer = DiagnosisWriter(spool_dir, batch_size=10)
+        patch = mock.patch.object(self.writer, '_ensure_worker')
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def enqueue(self, seed=0, user_id=None):
+        upload = make_upload(f'{seed}.jpg', seed=seed)
+        return self.writer.enqueue(user_id or self.user.id, {'v': 2, 'seed': seed},
+                                   upload=SimpleUploadedFile(upload.name, upload.getvalue()))
+
+    def spool_files(self):
+        return sorted(os.listdir(self.writer.spool_dir))
+
+    def test_enqueue_and_flush(self):
+        record_id = self.enqueue()
+        self.assertEqual(self.spool_files(), [f'{record_id}.json', f'{record_id}.upload'])
+        self.assertEqual(self.writer.pending(), 1)
+        self.assertEqual(Diagnosis.objects.count(), 0)
+
+        self.assertEqual(self.writer.flush(), 1)
+        diagnosis = Diagnosis.objects.get()
+        self.assertEqual((diagnosis.user_id, diagnosis.result), (self.user.id, {'v': 2, 'seed': 0}))
+        self.assertTrue(diagnosis.image.storage.exists(diagnosis.image.name))
+        self.assertEqual(self.spool_files(), [])
+        self.assertEqual(self.writer.stats()['written'], 1)
+
+    def test_same_photo_twice_gives_two_rows(self):
+        self.enqueue(seed=3)
+        self.enqueue(seed=3)
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(Diagnosis.objects.count(), 2)
+        self.assertEqual(len(set(Diagnosis.objects.values_list('image', flat=True))), 1)
+
+    def test_replayed_record_is_not_written_twice(self):
+        record_id = self.enqueue()
+        self.writer.flush()
+        diagnosis = Diagnosis.objects.get()
+        self.assertEqual(diagnosis.spool_id, record_id)
+        # A crash after the insert but before the claim was deleted leaves the record behind.
+        record = {'user_id': self.user.id, 'result': diagnosis.result, 'image': diagnosis.image.name,
+                  'spool_image': None, 'filename': '0.jpg', 'sha256': None}
+        with open(os.path.join(self.writer.spool_dir, f'{record_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+
+        self.assertEqual(self.writer.flush(), 0)
+        self.assertEqual(Diagnosis.objects.count(), 1)
+        self.assertEqual(self.spool_files(), [])
+
+    def test_claims_and_recover(self):
+        self.enqueue()
+        claimed = self.writer._claim(10)
+        self.assertEqual(len(claimed), 1)
+        self.assertTrue(claimed[0].endswith(f'.json.{os.getpid()}'))
+        # Held by this (live) process: neither claimed again nor released.
+        self.assertEqual(self.writer._claim(10), [])
+        self.assertEqual(self.writer.recover(), 0)
+
+        # A claim left by a process that has exited.
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        os.rename(claimed[0], claimed[0].rpartition('.')[0] + f'.{dead.pid}')
+        self.assertEqual(self.writer.recover(), 1)
+        self.assertEqual(self.writer.pending(), 1)
+        self.assertEqual(self.writer.flush(), 1)
+
+    def test_bad_record_is_moved_aside(self):
+        lost = self.enqueue(seed=1)
+        self.enqueue(seed=2)
+        # A crash between spooling the record and its image.
+        os.remove(os.path.join(self.writer.spool_dir, f'{lost}.upload'))
+
+        with self.assertLogs('api.persistence', 'ERROR'):
+            self.assertEqual(self.writer.flush(), 1)
+        self.assertEqual([d.result['seed'] for d in Diagnosis.objects.all()], [2])
+        self.assertEqual(self.spool_files(), [f'{lost}.json.failed'])
+        self.assertEqual((self.writer.pending(), self.writer.failed()), (0, 1))
+
+    def test_database_errors_are_retried(self):
+        self.enqueue()
+        with mock.patch.object(Diagnosis.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.writer.flush()
+        self.assertEqual((self.writer.pending(), self.writer.failed()), (1, 0))
+        self.assertEqual(self.writer.flush(), 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        derivatives.clear()
+        self.addCleanup(derivatives.clear)
+
+    def store(self, fmt='JPEG'):
+        # Distinct content per test: names are content-addressed.
+        image = Image.fromarray(np.random.default_rng().integers(0, 256, size=(600, 800, 3), dtype=np.uint8))
+        buffer = BytesIO()
+        image.save(buffer, fmt)
+        image_field = Diagnosis._meta.get_field('image')
+        name = image_field.storage.save(f'diagnoses/{uuid.uuid4().hex}.jpg', ContentFile(buffer.getvalue()))
+        return Diagnosis(image=name).image
+
+    def open_derivative(self, image, size):
+        with default_storage.open(derivative_name(image.name, size), 'rb') as f:
+            derivative = Image.open(f)
+            derivative.load()
+        return derivative
+
+    def test_build_all_sizes(self):
+        image = self.store()
+        written = build_derivatives(image.name, image.storage)
+        self.assertEqual(sorted(written), sorted(derivative_name(image.name, size) for size in ('thumbnail', 'medium')))
+        thumbnail, medium = self.open_derivative(image, 'thumbnail'), self.open_derivative(image, 'medium')
+        self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (160, 120)))
+        self.assertEqual((medium.format, medium.size), ('WEBP', (640, 480)))
+        # Existing derivatives are kept unless forced.
+        self.assertEqual(build_derivatives(image.name, image.storage), [])
+        self.assertEqual(len(build_derivatives(image.name, image.storage, sizes=['thumbnail'], force=True)), 1)
+
+    def test_rebuilds_replace_the_derivative(self):
+        image = self.store()
+        name = derivative_name(image.name, 'thumbnail')
+        for _ in range(2):
+            self.assertIn(name, build_derivatives(image.name, image.storage, force=True))
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(name))), [os.path.basename(name)])
+
+    def test_originals_differing_by_extension_have_their_own_derivatives(self):
+        self.assertEqual(derivative_name('diagnoses/photo.jpg', 'thumbnail'), 'derivatives/thumbnail/diagnoses/photo.jpg.webp')
+        self.assertNotEqual(derivative_name('diagnoses/photo.jpg', 'thumbnail'),
+                            derivative_name('diagnoses/photo.png', 'thumbnail'))
+
+    @override_settings(THUMBNAILS=dict(settings.THUMBNAILS, FORMAT='JPEG'))
+    def test_jpeg_format(self):
+        image = self.store(fmt='PNG')
+        build_derivatives(image.name, image.storage)
+        self.assertTrue(derivative_name(image.name, 'thumbnail').endswith('.jpg'))
+        self.assertEqual(self.open_derivative(image, 'thumbnail').format, 'JPEG')
+
+    def test_listing_builds_in_the_background(self):
+        image = self.store()
+        # The original until the derivative exists.
+        self.assertEqual(derivative_url(image, 'thumbnail'), image.url)
+        derivatives.wait(timeout=10)
+        expected = default_storage.url(derivative_name(image.name, 'thumbnail'))
+        self.assertEqual(derivative_url(image, 'thumbnail'), expected)
+        # Remembered: no more stats.
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            self.assertEqual(derivative_url(image, 'thumbnail'), expected)
+            self.assertEqual(derivative_url(image, 'medium'), default_storage.url(derivative_name(image.name, 'medium')))
+        self.assertEqual(exists.call_count, 0)
+
+    def test_missing_original(self):
+        image = Diagnosis(image=f'diagnoses/{uuid.uuid4().hex}.jpg').image
+        with self.assertLogs('api.thumbnails', 'WARNING') as logs:
+            self.assertEqual(derivative_url(image, 'thumbnail'), image.url)
+            derivatives.wait(timeout=10)
+        self.assertIsNone(logs.records[0].exc_info)
+        # Not retried by the next listings.
+        with mock.patch.object(derivatives, '_build') as build, self.assertNoLogs('api.thumbnails'):
+            self.assertEqual(derivative_url(image, 'medium'), image.url)
+            derivatives.wait(timeout=10)
+        build.assert_not_called()
+
+    def test_unreadable_original_falls_back(self):
+        image_field = Diagnosis._meta.get_field('image')
+        image = Diagnosis(image=image_field.storage.save('diagnoses/broken.jpg', ContentFile(b'not an image'))).image
+        with self.assertLogs('api.thumbnails', 'ERROR'):
+            self.assertEqual(derivative_url(image, 'thumbnail'), image.url)
+            derivatives.wait(timeout=10)
+        self.assertEqual(derivative_url(image, 'thumbnail'), image.url)
+
+
+class StorageTests(APITestCase):
+    """Content-addressed names, reference counting on delete and gc_media."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        cls.user = User.objects.create_user('user', password='pw')
+
+    def setUp(self):
+        super().setUp()
+        # A media root of its own, since gc_media looks at every file in it.
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.storage = Diagnosis._meta.get_field('image').storage
+
+    def store(self, content=None, age=0):
+        name = self.storage.save('diagnoses/photo.JPG', ContentFile(content or uuid.uuid4().bytes))
+        self.age(self.storage, name, age)
+        return name
+
+    def age(self, storage, name, seconds):
+        then = time.time() - seconds
+        os.utime(storage.path(name), (then, then))
+
+    def test_same_content_is_stored_once(self):
+        name = self.store(b'photo')
+        digest = hashlib.sha256(b'photo').hexdigest()
+        self.assertEqual(name, f'diagnoses/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(self.store(b'photo'), name)
+        self.assertEqual(os.listdir(os.path.dirname(self.storage.path(name))), [f'{digest}.jpg'])
+        self.assertNotEqual(self.store(b'other photo'), name)
+
+    def test_concurrent_saves_of_new_content_keep_one_file(self):
+        digest = hashlib.sha256(b'race').hexdigest()
+        original_save = FileSystemStorage._save
+        raced = []
+
+        def save_after_the_other_upload(storage, name, content):
+            # The other upload of the same photo finishes while this one writes.
+            if not raced:
+                raced.append(name)
+                self.store(b'race')
+            return original_save(storage, name, content)
+
+        with mock.patch.object(FileSystemStorage, '_save', save_after_the_other_upload):
+            name = self.storage.save('diagnoses/photo.jpg', ContentFile(b'race'))
+        self.assertEqual(name, f'diagnoses/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(os.listdir(os.path.dirname(self.storage.path(name))), [f'{digest}.jpg'])
+
+    def test_saving_again_restarts_the_grace_period(self):
+        name = self.store(b'again', age=2 * settings.MEDIA_GRACE_SECONDS)
+        self.store(b'again')
+        self.assertFalse(self.storage.delete_if_stale(name))
+        self.assertTrue(self.storage.exists(name))
+
+    def test_delete_if_stale(self):
+        young, old = self.store(), self.store(age=2 * settings.MEDIA_GRACE_SECONDS)
+        self.assertFalse(self.storage.delete_if_stale(young))
+        self.assertFalse(self.storage.delete_if_stale(old, in_use=lambda: True))
+        self.assertTrue(self.storage.delete_if_stale(old))
+        self.assertFalse(self.storage.exists(old))
+        self.assertFalse(self.storage.delete_if_stale(old))
+
+    def test_last_reference_deletes_the_file(self):
+        name = self.store(age=2 * settings.MEDIA_GRACE_SECONDS)
+        first = Diagnosis.objects.create(user=self.user, image=name, result={})
+        second = Diagnosis.objects.create(user=self.user, image=name, result={})
+
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/history/{first.pk}/').status_code, 204)
+        self.assertTrue(self.storage.exists(name))
+
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/admin/diagnoses/{second.pk}/').status_code, 204)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_recent_file_is_left_to_gc_media(self):
+        name = self.store()
+        diagnosis = Diagnosis.objects.create(user=self.user, image=name, result={})
+        with self.captureOnCommitCallbacks(execute=True):
+            diagnosis.delete()
+        self.assertTrue(self.storage.exists(name))
+
+    def test_gc_media(self):
+        old = 2 * settings.MEDIA_GRACE_SECONDS
+        referenced, spooled, orphan, young = (self.store(age=old), self.store(age=old), self.store(age=old), self.store())
+        Diagnosis.objects.create(user=self.user, image=referenced, result={})
+        stale_derivative = derivative_name(orphan, 'thumbnail')
+        default_storage.save(stale_derivative, ContentFile(b'thumbnail'))
+        self.age(default_storage, stale_derivative, old)
+
+        def gc_media(*args):
+            out = StringIO()
+            with mock.patch('api.management.commands.gc_media.diagnosis_writer.referenced_images',
+                            return_value={spooled}):
+                call_command('gc_media', *args, stdout=out)
+            return out.getvalue()
+
+        self.assertIn('Would delete 2 unreferenced files', gc_media('--dry-run'))
+        self.assertTrue(self.storage.exists(orphan))
+
+        self.assertIn('Deleted 2 unreferenced files', gc_media())
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertFalse(default_storage.exists(stale_derivative))
+        for name in (referenced, spooled, young):
+            self.assertTrue(self.storage.exists(name), name)
+
+        # A shorter grace period also collects the young file.
+        self.assertIn('Deleted 1 unreferenced files', gc_media('--grace-seconds', '0'))
+        self.assertFalse(self.storage.exists(young))
+
+
+class PaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='pw')
+        for i in range(7):
+            Review.objects.create(user=cls.user, rating=5, text=f'review {i}')
+
+    def walk(self, url, on_page=None):
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(item['id'] for item in page['results'])
+            if on_page:
+                on_page(page)
+            url = page['next']
+        return seen
+
+    def test_cursor_pages_are_stable_under_inserts(self):
+        expected = list(Review.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        def insert(page):
+            Review.objects.create(user=self.user, rating=1, text='new')
+
+        self.assertEqual(self.walk('/api/reviews/?page_size=3', on_page=insert), expected)
+
+    def test_cursor_previous_link(self):
+        first = self.client.get('/api/reviews/', {'page_size': 3}).json()
+        self.assertIsNone(first['previous'])
+        self.assertNotIn('count', first)
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_cursor_count_is_optional(self):
+        response = self.client.get('/api/reviews/', {'count': 'true'}).json()
+        self.assertEqual(response['count'], 7)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/reviews/', {'cursor': 'garbage'}).status_code, 404)
+
+    def test_history_page_numbers_without_count(self):
+        for i in range(8):
+            Diagnosis.objects.create(user=self.user, image=f'diagnoses/{i}.jpg', result={})
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/history/').json()['count'], 8)
+        with self.assertNumQueries(1):
+            page = self.client.get('/api/history/', {'page': 2, 'count': 'false'}).json()
+        self.assertIsNone(page['count'])
+        self.assertEqual(len(page['results']), 2)
+        self.assertIsNone(page['next'])
+        ids = self.walk('/api/history/?pagination=cursor&page_size=3')
+        self.assertEqual(ids, list(Diagnosis.objects.values_list('id', flat=True)))
+
+
+class ResultFormatTests(TestCase):
+    def test_compact_rows_expand_to_the_full_payload(self):
+        labels = tips_labels()
+        for skin_type in ('default', 'oily', 'dry'):
+            payload = build_prediction_response(np.array([0.7, 0.2, 0.1] + [0.0] * (len(labels) - 3)), labels, skin_type)
+            compact = compact_result(payload['predictions'], skin_type, 'abc')
+            self.assertEqual(expand_result(compact), payload)
+            self.assertEqual(expand_result(compact_legacy_result(payload)), payload)
+            self.assertLess(len(json.dumps(compact)), len(json.dumps(payload)) / 5)
+
+    def test_migration_matches_the_live_format(self):
+        # 0008 carries its own copy of the v1 tips; it must still agree with api/results.py.
+        migration = importlib.import_module('api.migrations.0008_compact_diagnosis_results')
+        labels = tips_labels(migration.LEGACY_TIPS_VERSION)
+        for skin_type in ('default', 'oily', 'dry'):
+            payload = build_prediction_response(np.array([0.7, 0.2, 0.1] + [0.0] * (len(labels) - 3)), labels, skin_type)
+            compact = migration.compact_legacy(payload)
+            self.assertEqual(compact, compact_legacy_result(payload))
+            self.assertEqual(migration.expand(compact), expand_result(compact))
+        self.assertIsNone(migration.compact_legacy({'predictions': [{'label': 'acne', 'confidence': 50.0}], 'tips': ['edited by hand']}))
+
+    def test_unknown_rows_are_served_unchanged(self):
+        legacy = {'predictions': [{'label': 'acne', 'confidence': 50.0}], 'tips': ['edited by hand']}
+        self.assertIsNone(compact_legacy_result(legacy))
+        self.assertEqual(expand_result(legacy), legacy)
+        self.assertEqual(expand_result({}), {})
+
+
+class TipsTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'tips.json')
+        self.write({'A': {'default': ['a'], 'oily': ['a oily']}, 'B': {'default': ['b']}}, mtime=1)
+        override = override_settings(TIPS={'PATH': self.path, 'RELOAD_CHECK_SECONDS': 0})
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def write(self, tips, mtime, current=1):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'current': current, 'versions': {'1': tips}}, f)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_fallbacks_and_headers(self):
+        shown = [{'label': 'A', 'confidence': 60.04}, {'label': 'B', 'confidence': 20.0}]
+        self.assertEqual(build_tips(shown, 'oily'), [
+            '--- A (60.0%) 관련 솔루션 ---', 'a oily', '--- B (20.0%) 관련 솔루션 ---', 'b',
+        ])
+        self.assertEqual(build_tips(shown[1:], 'oily'), ['b'])
+        self.assertEqual(build_tips(shown[:1], 'normal'), ['a'])
+        self.assertEqual(build_tips([{'label': 'C', 'confidence': 50.0}], 'oily'), [])
+
+    def test_reloads_when_the_file_changes(self):
+        shown = [{'label': 'A', 'confidence': 90.0}]
+        self.assertEqual(build_tips(shown, 'dry'), ['a'])
+        self.write({'A': {'default': ['a, edited']}, 'B': {'default': ['b']}}, mtime=2)
+        self.assertEqual(build_tips(shown, 'dry'), ['a, edited'])
+
+        with open(self.path, 'w') as f:
+            f.write('{not json')
+        os.utime(self.path, (3, 3))
+        with self.assertLogs('api.tips', 'ERROR'):
+            self.assertEqual(build_tips(shown, 'dry'), ['a, edited'])
+
+    def test_rows_of_a_removed_version_use_the_current_one(self):
+        row = {'v': RESULT_FORMAT, 'labels': [1, 5], 'scores': [70.0, 20.0], 'skin_type': 'dry', 'tips': 99}
+        expected = {
+            'predictions': [{'label': 'B', 'confidence': 70.0}, {'label': 5, 'confidence': 20.0}],
+            'tips': ['--- B (70.0%) 관련 솔루션 ---', 'b'],
+        }
+        with self.assertLogs('api.tips', 'WARNING') as logs:
+            self.assertEqual(expand_result(row), expected)
+            self.assertEqual(expand_result(row), expected)
+        self.assertEqual(len(logs.records), 1)
+
+
+class PreprocessingParityTests(unittest.TestCase):
+    """
+    Draft decoding, EXIF transpose and resizing after RGB conversion must give the
+    model the same input as the old pipeline (resize, then convert), within a few levels.
+    """
+    MEAN_TOLERANCE = 1.0
+    MAX_TOLERANCE = 8
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .management.commands.bench_preprocess import make_photo
+
+        cls.photo = Image.fromarray(make_photo(1200, 900))
+
+    def encode(self, image, fmt, **options):
+        buffer = BytesIO()
+        image.save(buffer, fmt, **options)
+        buffer.seek(0)
+        return buffer
+
+    def assertMatchesLegacy(self, upload, reference):
+        from .management.commands.bench_preprocess import legacy_preprocess
+
+        array = load_image_array(upload)
+        expected = legacy_preprocess(reference)
+        self.assertEqual(array.shape, (IMAGE_HEIGHT, IMAGE_WIDTH, 3))
+        self.assertEqual(array.dtype, np.uint8)
+        self.assertTrue(array.flags.c_contiguous)
+        difference = np.abs(array.astype(np.int16) - expected.astype(np.int16))
+        self.assertLess(difference.mean(), self.MEAN_TOLERANCE)
+        self.assertLessEqual(difference.max(), self.MAX_TOLERANCE)
+
+    def test_formats_match_the_legacy_pipeline(self):
+        for fmt, image, options in (
+            ('JPEG', self.photo, {'quality': 90}),
+            ('JPEG', self.photo, {'quality': 90, 'progressive': True}),
+            ('PNG', self.photo, {}),
+            ('PNG', self.photo.convert('RGBA'), {}),
+            ('WEBP', self.photo, {'quality': 90}),
+        ):
+            with self.subTest(format=fmt, mode=image.mode, **options):
+                self.assertMatchesLegacy(self.encode(image, fmt, **options), self.encode(image, fmt, **options))
+
+    def test_exif_orientation_is_applied(self):
+        # Stored landscape with "rotate 90° clockwise to display": compared with the photo rotated up front.
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        upload = self.encode(self.photo, 'JPEG', quality=90, exif=exif)
+        upright = self.encode(self.photo.transpose(Image.Transpose.ROTATE_270), 'JPEG', quality=90)
+        self.assertMatchesLegacy(upload, upright)
+
+    def test_too_many_pixels(self):
+        with self.assertRaises(ImageTooLarge):
+            load_image_array(self.encode(self.photo, 'JPEG'), max_pixels=1200 * 900 - 1)
+        self.assertEqual(load_image_array(self.encode(self.photo, 'JPEG'), max_pixels=1200 * 900).shape[0], IMAGE_HEIGHT)
+
+
+class MicroBatcherTests(unittest.TestCase):
+    """The batcher with a stub model that returns the sum of each row."""
+
+    def make_batcher(self, predict_fn=None, **options):
+        self.batch_sizes = []
+
+        def predict(batch):
+            self.batch_sizes.append(len(batch))
+            if predict_fn is not None:
+                return predict_fn(batch)
+            return batch.reshape(len(batch), -1).sum(axis=1)
+
+        batcher = MicroBatcher(predict, **options)
+        self.addCleanup(batcher.shutdown, 5)
+        return batcher
+
+    def rows(self, count):
+        return [np.full((2, 2, 1), i, dtype=np.float32) for i in range(count)]
+
+    def test_full_batch_runs_without_waiting(self):
+        batcher = self.make_batcher(max_batch_size=4, max_wait_ms=5000)
+        started = time.monotonic()
+        futures = [batcher.submit(row) for row in self.rows(4)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 4, 8, 12])
+        self.assertLess(time.monotonic() - started, 2.5)
+        self.assertEqual(self.batch_sizes, [4])
+        self.assertEqual(batcher.stats()['batch_sizes'], {4: 1})
+
+    def test_partial_batch_runs_after_max_wait(self):
+        batcher = self.make_batcher(max_batch_size=16, max_wait_ms=50)
+        started = time.monotonic()
+        futures = [batcher.submit(row) for row in self.rows(3)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 4, 8])
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+        self.assertEqual(self.batch_sizes, [3])
+
+    def test_error_reaches_every_waiter(self):
+        def fail(batch):
+            raise ValueError('model failed')
+
+        batcher = self.make_batcher(fail, max_batch_size=3, max_wait_ms=5000)
+        with self.assertLogs('api.batching', 'ERROR'):
+            futures = [batcher.submit(row) for row in self.rows(3)]
+            errors = [future.exception(timeout=5) for future in futures]
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors), errors)
+        self.assertEqual(batcher.stats()['failed_batches'], 1)
+
+    def test_concurrent_batches(self):
+        # Each batch waits for the other, so this only finishes with two batches in flight.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def predict(batch):
+            barrier.wait()
+            return batch.reshape(len(batch), -1).sum(axis=1)
+
+        batcher = self.make_batcher(predict, max_batch_size=1, max_wait_ms=0, concurrency=2)
+        futures = [batcher.submit(row) for row in self.rows(2)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 4])
+        self.assertEqual(self.batch_sizes, [1, 1])
+
+    def test_shutdown_runs_queued_rows_and_restarts(self):
+        batcher = self.make_batcher(max_batch_size=16, max_wait_ms=5000)
+        futures = [batcher.submit(row) for row in self.rows(2)]
+        started = time.monotonic()
+        self.assertTrue(batcher.shutdown(timeout=5))
+        # The rows ran at once instead of after max_wait.
+        self.assertLess(time.monotonic() - started, 2.5)
+        self.assertEqual([future.result(timeout=0) for future in futures], [0, 4])
+
+        future = batcher.submit(self.rows(2)[1])
+        self.assertTrue(batcher.shutdown(timeout=5))
+        self.assertEqual(future.result(timeout=0), 4)
+        self.assertEqual(self.batch_sizes, [2, 1])
+
+
+class PostProcessingTests(TestCase):
+    def test_matches_the_per_label_sort(self):
+        from .management.commands.bench_postprocess import legacy_predictions, random_scores
+
+        for num_labels in (6, 100):
+            labels = [f'label {i}' for i in range(num_labels)]
+            scores = random_scores(500, num_labels, seed=num_labels)
+            scores[0, :3] = [0.3, 0.3, 0.2]  # ties are broken by label order
+            expected = [legacy_predictions(row, labels) for row in scores]
+            self.assertEqual(top_predictions(scores, labels, 3, 10.0, 1.0), expected)
+            self.assertEqual(top_predictions(scores[0], labels, 3, 10.0, 1.0), expected[:1])
+
+    def test_k_threshold_and_temperature(self):
+        labels = ['a', 'b', 'c', 'd']
+        scores = np.array([[0.6, 0.25, 0.1, 0.05]], dtype=np.float32)
+        self.assertEqual([p['label'] for p in top_predictions(scores, labels, 2, 10.0, 1.0)[0]], ['a', 'b'])
+        self.assertEqual([p['label'] for p in top_predictions(scores, labels, 4, 5.0, 1.0)[0]], ['a', 'b', 'c'])
+        self.assertEqual(top_predictions(scores, labels, 3, 70.0, 1.0), [[]])
+
+        flattened = top_predictions(scores, labels, 4, 0.0, 2.0)[0]
+        self.assertEqual([p['label'] for p in flattened], ['a', 'b', 'c', 'd'])
+        self.assertLess(flattened[0]['confidence'], 60.0)
+        self.assertAlmostEqual(sum(p['confidence'] for p in flattened), 100.0, places=1)
+
+
+class MetricsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='pw')
+        cls.admin = User.objects.create_user('admin', password='pw', is_staff=True)
+
+    def count(self, text, series):
+        for line in text.splitlines():
+            if line.startswith(series + ' '):
+                return float(line.split()[-1])
+        return 0.0
+
+    def test_server_timing_and_endpoint(self):
+        with timed('decode'):
+            pass
+        response = self.client.get('/api/reviews/')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[0-9.]+$')
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('# TYPE skinlab_stage_duration_seconds histogram', text)
+        self.assertGreaterEqual(self.count(text, 'skinlab_stage_duration_seconds_count{stage="decode"}'), 1)
+        self.assertGreaterEqual(
+            self.count(text, 'skinlab_request_duration_seconds_count{route="review-list",method="GET"}'), 1
+        )
+
+    def test_processes_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(METRICS=dict(settings.METRICS, DIRECTORY=directory)):
+            buckets = list(settings.METRICS['BUCKETS'])
+            # Another worker saw four observations above the last bucket.
+            series = [0] * len(buckets) + [4, 400.0]
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump({'buckets': buckets, 'series': [['skinlab_stage_duration_seconds', [['stage', 'slow']], series]]}, f)
+            record('slow', 0.0001)
+            self.client.force_authenticate(self.admin)
+            text = self.client.get('/api/metrics/').content.decode()
+        self.assertEqual(self.count(text, 'skinlab_stage_duration_seconds_count{stage="slow"}'), 5)
+        self.assertEqual(self.count(text, 'skinlab_stage_duration_seconds_bucket{stage="slow",le="0.001"}'), 1)
+
+
+class JobQueueTests(unittest.TestCase):
+    """JobQueue with threads standing in for the worker processes, and a stub model."""
+
+    def make_queue(self, predict=None, on_done=None):
+        patch = mock.patch('api.model_registry.registry.predict',
+                           predict or (lambda batch: batch.reshape(len(batch), -1).sum(axis=1, keepdims=True)))
+        patch.start()
+        self.addCleanup(patch.stop)
+        queue = JobQueue(workers=1, on_done=on_done)
+        queue._executor = ThreadPoolExecutor(max_workers=1)
+        queue._done_executor = ThreadPoolExecutor(max_workers=1)
+        queue._pid = os.getpid()
+        self.addCleanup(queue._executor.shutdown)
+        self.addCleanup(queue._done_executor.shutdown)
+        return queue
+
+    def test_finished_jobs_reach_on_done_without_a_poll(self):
+        done = []
+        finished = threading.Event()
+
+        def on_done(job_id, job):
+            done.append((job_id, job))
+            finished.set()
+
+        queue = self.make_queue(on_done=on_done)
+        job_id = queue.submit(np.ones((2, 2, 1), dtype=np.float32), {'user_id': 1})
+        self.assertTrue(finished.wait(5))
+        [(done_id, job)] = done
+        self.assertEqual((done_id, job['status'], job['meta']), (job_id, DONE, {'user_id': 1}))
+        np.testing.assert_array_equal(job['scores'], [4])
+
+    def test_failed_jobs_reach_on_done_too(self):
+        finished = threading.Event()
+
+        def on_done(job_id, job):
+            finished.set()
+            raise RuntimeError(job['error'])
+
+        def fail(batch):
+            raise ValueError('model failed')
+
+        queue = self.make_queue(fail, on_done=on_done)
+        with self.assertLogs('api.jobs', 'ERROR'):
+            job_id = queue.submit(np.ones((2, 2, 1), dtype=np.float32))
+            self.assertTrue(finished.wait(5))
+            queue._done_executor.shutdown(wait=True)
+        self.assertEqual(queue.get(job_id)['status'], FAILED)
+
+    def test_predict_and_status(self):
+        queue = self.make_queue()
+        np.testing.assert_array_equal(queue.predict(np.ones((3, 2, 2, 1), dtype=np.float32), timeout=5), [[4]] * 3)
+        with mock.patch('api.model_registry.registry.status', return_value={'state': 'ready'}):
+            self.assertEqual(queue.status(timeout=5), {'state': 'ready'})
+
+    def test_predict_timeout(self):
+        release = threading.Event()
+        calls = []
+
+        def slow(batch):
+            calls.append(len(batch))
+            release.wait(5)
+            return batch.reshape(len(batch), -1).sum(axis=1, keepdims=True)
+
+        queue = self.make_queue(slow)
+        self.addCleanup(release.set)
+        with self.assertRaises(TimeoutError):
+            queue.predict(np.ones((1, 2, 2, 1), dtype=np.float32), timeout=0.05)
+        # Queued behind the first and cancelled on timeout, so it never runs.
+        with self.assertRaises(TimeoutError):
+            queue.predict(np.ones((2, 2, 2, 1), dtype=np.float32), timeout=0.05)
+        release.set()
+        queue._executor.shutdown(wait=True)
+        self.assertEqual(calls, [1])
+
+    def test_preloaded_numpy_workers_are_forked(self):
+        for backend, preload, loads, method in (('numpy', True, True, 'fork'), ('numpy', False, False, 'spawn'),
+                                                ('keras', True, False, 'spawn')):
+            with self.subTest(backend=backend, preload=preload), \
+                    override_settings(INFERENCE=dict(settings.INFERENCE, BACKEND=backend)), \
+                    mock.patch('api.model_registry.registry.get') as get:
+                context = JobQueue(preload=preload)._mp_context()
+                self.assertEqual((get.called, context.get_start_method()), (loads, method))
+        # A failed load leaves it to spawned workers to retry.
+        with override_settings(INFERENCE=dict(settings.INFERENCE, BACKEND='numpy')), \
+                mock.patch('api.model_registry.registry.get', side_effect=ModelNotReady('no model')):
+            self.assertEqual(JobQueue(preload=True)._mp_context().get_start_method(), 'spawn')
+
+    def test_remote_errors(self):
+        queue = mock.Mock(**{'predict.side_effect': TimeoutError('slow'), 'status.side_effect': ModelNotReady('no model')})
+        self.assertEqual(handle_message(queue, ('predict', None, 1)), ('timeout', 'slow'))
+        self.assertEqual(handle_message(queue, ('status', 1)), ('not_ready', 'no model'))
+        self.assertEqual(handle_message(queue, ('claim', 'job'))[0], 'error')
+
+        # The client raises them again.
+        remote = RemoteJobQueue(os.path.join(tempfile.gettempdir(), f'{uuid.uuid4().hex}.sock'), b'key')
+        for reply, error in ((('timeout', 'slow'), TimeoutError), (('not_ready', 'no model'), ModelNotReady),
+                             (('queue_full', 'full'), QueueFullError)):
+            connection = mock.MagicMock()
+            connection.__enter__.return_value.recv.return_value = reply
+            with self.subTest(reply=reply), mock.patch('api.jobs.Client', return_value=connection), \
+                    self.assertRaises(error):
+                remote.predict(np.zeros((1, 2, 2, 1), dtype=np.float32), timeout=1)
+        with self.assertRaises(JobServerUnavailable):
+            remote.stats()
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    DIAGNOSIS_PERSISTENCE=dict(settings.DIAGNOSIS_PERSISTENCE, MODE='sync'),
+)
+class PredictionJobTests(APITestCase):
+    """The views on top of the job pool: async jobs are stored when they finish, sync predictions run on the pool."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='pw')
+
+    def setUp(self):
+        super().setUp()
+        patch_registry(self)
+        self.client.force_authenticate(self.user)
+        self.queue = mock.Mock()
+        self.storage = Diagnosis._meta.get_field('image').storage
+        patches = [
+            mock.patch('api.views.get_job_queue', return_value=self.queue),
+            mock.patch('api.views.prediction_cache', PredictionCache(max_entries=4, ttl=60)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def content_name(self, upload):
+        return self.storage.get_content_name('diagnoses/photo.jpg', ContentFile(upload.getvalue()))
+
+    def test_refused_job_releases_its_file(self):
+        name = self.content_name(make_upload(seed=11))
+        for error in (QueueFullError('full'), JobServerUnavailable('down')):
+            self.queue.submit.side_effect = error
+            with mock.patch('api.views.release_image') as release:
+                response = self.client.post('/api/predict/', {'image': make_upload(seed=11), 'async': 'true'})
+            self.assertEqual(response.status_code, 503, response.content)
+            release.assert_called_once_with(self.storage, name)
+
+    def test_finished_job_is_stored_without_a_poll(self):
+        name = self.content_name(make_upload(seed=12))
+        job_id = str(uuid.uuid4())
+
+        def submit(img_array, meta):
+            # The job may finish before the view returns, so the file must be there already.
+            self.assertTrue(self.storage.exists(meta['image']))
+            return job_id
+
+        self.queue.submit.side_effect = submit
+        response = self.client.post('/api/predict/', {'image': make_upload(seed=12), 'async': 'true'})
+        self.assertEqual(response.status_code, 202, response.content)
+        _, meta = self.queue.submit.call_args.args
+        self.assertEqual(meta, {'user_id': self.user.id, 'skin_type': 'default', 'is_example': False,
+                                'image': name, 'model_version': 'test'})
+        self.assertTrue(self.storage.exists(name))
+
+        # What the pool calls when the job is done.
+        persist_job(job_id, {'status': DONE, 'scores': np.array([0.9, 0.1], dtype=np.float32), 'error': None,
+                             'meta': meta})
+        diagnosis = Diagnosis.objects.get()
+        self.assertEqual((diagnosis.user_id, diagnosis.image.name, diagnosis.result['model']), (self.user.id, name, 'test'))
+
+    def test_failed_job_releases_its_image(self):
+        meta = {'user_id': self.user.id, 'skin_type': 'default', 'is_example': False,
+                'image': 'diagnoses/failed.jpg', 'model_version': 'test'}
+        with mock.patch('api.views.release_image') as release:
+            persist_job('job', {'status': FAILED, 'scores': None, 'error': 'ValueError: x', 'meta': meta})
+            persist_job('example', {'status': DONE, 'scores': np.array([0.9, 0.1], dtype=np.float32), 'error': None,
+                                    'meta': dict(meta, is_example=True, image=None)})
+        release.assert_called_once_with(self.storage, 'diagnoses/failed.jpg')
+        self.assertFalse(Diagnosis.objects.exists())
+
+    def test_sync_predictions_run_on_the_pool(self):
+        self.queue.predict.side_effect = lambda batch, timeout: np.tile([0.9, 0.1], (len(batch), 1)).astype(np.float32)
+        response = self.client.post('/api/predict/batch/', {'images': [make_upload(seed=31), make_upload(seed=32)]})
+        self.assertEqual(response.status_code, 200, response.content)
+        [call] = self.queue.predict.call_args_list
+        self.assertEqual(call.args[0].shape, (2, IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS))
+        self.assertEqual(call.kwargs, {'timeout': settings.INFERENCE['TIMEOUT_SECONDS']})
+
+        # The batcher's batches, too.
+        batch = np.zeros((3, IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS), dtype=np.float32)
+        with mock.patch('api.jobs.get_job_queue', return_value=self.queue):
+            predict_on_pool(batch)
+        self.queue.predict.assert_called_with(batch, timeout=settings.INFERENCE['TIMEOUT_SECONDS'])
+
+    def test_pool_errors(self):
+        for error, code in ((JobServerUnavailable('down'), 503), (TimeoutError(), 503), (ModelNotReady('no model'), 500)):
+            with self.subTest(error=error), mock.patch('api.views.batcher.predict', side_effect=error):
+                response = self.client.post('/api/predict/', {'image': make_upload(seed=33)})
+                self.assertEqual(response.status_code, code, response.content)
+        self.assertFalse(Diagnosis.objects.exists())
+
+    def test_readiness_while_the_workers_load(self):
+        self.queue.status.side_effect = TimeoutError
+        response = self.client.get('/api/health/ready/')
+        self.assertEqual((response.status_code, response.json()), (503, {'state': 'loading'}))
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    DIAGNOSIS_PERSISTENCE=dict(settings.DIAGNOSIS_PERSISTENCE, MODE='sync'),
+)
+class AsyncViewTests(APITestCase):
+    """The ASGI views answer like the sync ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='pw')
+        Profile.objects.create(user=cls.user, skin_type='oily')
+        Review.objects.create(user=cls.user, rating=5, text='good')
+
+    async def test_predict(self):
+        request = APIRequestFactory().post('/api/predict/', {'image': make_upload()}, format='multipart')
+        force_authenticate(request, self.user)
+        patch_registry(self)
+        with mock.patch('api.async_views.apredict_scores',
+                        mock.AsyncMock(return_value=np.array([0.9, 0.1], dtype=np.float32))):
+            response = await AsyncPredictionView.as_view()(request)
+        # Done by Django's handler when the view is served through a URL.
+        request.close()
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, build_prediction_response(np.array([0.9, 0.1]), FakeModel.labels, 'oily'))
+        self.assertEqual(await Diagnosis.objects.filter(user=self.user).acount(), 1)
+
+    async def test_review_list(self):
+        response = await AsyncReviewList.as_view()(APIRequestFactory().get('/api/reviews/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([review['text'] for review in json.loads(response.content)['results']], ['good'])
+
+
+class ServingTopologyTests(unittest.TestCase):
+    def test_cores_are_divided_between_workers(self):
+        cores = list(range(8))
+        # Enough memory: one single-threaded worker per core.
+        # Each web worker with a one-process inference pool of its own.
+        local = dict(inference_server=False, pool_workers=1)
+        topology = plan_topology(cores=cores, memory_budget_mb=8000, worker_memory_mb=700, affinity=False, **local)
+        self.assertEqual((topology.workers, topology.inference_threads, topology.threads), (8, 1, 4))
+        self.assertIsNone(topology.affinity)
+
+        # Memory for two workers: they share the cores instead.
+        topology = plan_topology(cores=cores, memory_budget_mb=1500, worker_memory_mb=700, affinity=True, **local)
+        self.assertEqual((topology.workers, topology.inference_threads, topology.threads), (2, 4, 8))
+        self.assertEqual(topology.affinity, [[0, 1, 2, 3], [4, 5, 6, 7]])
+        self.assertEqual(topology.thread_env()['OMP_NUM_THREADS'], '4')
+        self.assertEqual(topology.thread_env()['TF_NUM_INTEROP_THREADS'], '1')
+
+        topology = plan_topology(cores=[0], memory_budget_mb=100, worker_memory_mb=700, affinity=False, **local)
+        self.assertEqual((topology.workers, topology.inference_threads), (1, 1))
+
+        # Two pool workers per web worker: each gets half of its cores, and a pinned worker keeps both halves.
+        topology = plan_topology(cores=cores, memory_budget_mb=3000, affinity=True, inference_server=False, pool_workers=2)
+        self.assertEqual((topology.worker_memory_mb, topology.workers, topology.inference_threads), (1600, 1, 4))
+        self.assertEqual(topology.affinity, [cores])
+
+    def test_inference_server_gets_the_cores(self):
+        cores = list(range(8))
+        # 1600 MiB are left for eight web workers; the rest holds two model-sized workers.
+        inference = plan_inference(cores=cores, memory_budget_mb=3000)
+        self.assertEqual((inference.workers, inference.threads), (2, 4))
+        self.assertEqual(inference.thread_env()['OMP_NUM_THREADS'], '4')
+        self.assertEqual((plan_inference(cores=cores, memory_budget_mb=6000).workers,
+                          plan_inference(cores=cores, memory_budget_mb=500).workers), (6, 1))
+
+        # Web workers hold no model, so one per core fits next to the inference workers.
+        topology = plan_topology(cores=cores, memory_budget_mb=3000, affinity=False, inference_server=True)
+        self.assertEqual((topology.worker_memory_mb, topology.workers, topology.inference_threads, topology.threads),
+                         (200, 8, 1, 4))
+
+
+class ClaimsAuthenticationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='pw')
+        cls.profile = Profile.objects.create(user=cls.user, skin_type='oily')
+
+    def history_as(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.client.get('/api/history/', {'count': 'false'})
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/api/history/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_principal_from_claims(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        with self.assertNumQueries(0):
+            principal = self.authenticate(token)
+        self.assertEqual((principal.id, principal.username, principal.skin_type), (self.user.id, 'user', 'oily'))
+        self.assertEqual(get_skin_type(principal), 'oily')
+
+    def test_refreshed_token_keeps_the_claims_time(self):
+        # Logged in before the user's latest change; the access token is refreshed after it.
+        issued = timezone.now() - timedelta(minutes=10)
+        with mock.patch('rest_framework_simplejwt.tokens.aware_utcnow', return_value=issued):
+            refresh = MyTokenObtainPairSerializer.get_token(self.user)
+        principal_cache().set(last_change_key(self.user.id), time.time() - 60)
+        access = refresh.access_token
+        self.assertEqual(access[CLAIMS_TIME_CLAIM], refresh['iat'])
+        with self.assertNumQueries(1):
+            self.authenticate(access)
+
+    def test_token_without_claims_is_loaded_once(self):
+        token = RefreshToken.for_user(self.user).access_token
+        # user and profile in one query, then the history page
+        with self.assertNumQueries(2):
+            self.assertEqual(self.history_as(token).status_code, 200)
+        # The user is cached now: only the history query remains.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.history_as(token).status_code, 200)
+
+    def test_profile_update_overrides_claims(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/api/profile/', {'profile': {'skin_type': 'dry'}}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        request = APIRequestFactory().get('/api/history/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        with self.assertNumQueries(0):
+            principal, _ = ClaimsJWTAuthentication().authenticate(request)
+        self.assertEqual(principal.skin_type, 'dry')
+
+    def test_deactivated_user_is_rejected(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.assertEqual(self.history_as(token).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.history_as(token).status_code, 401)
+
+    def test_lost_entries_fall_back_to_the_database(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.skin_type = 'dry'
+            self.profile.save()
+        # As if the cache had culled the entry.
+        principal_cache().delete(principal_key(self.user.id))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token).skin_type, 'dry')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        principal_cache().delete(principal_key(self.user.id))
+        self.assertEqual(self.history_as(token).status_code, 401)
+
+    def test_other_users_changes_cost_no_query(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/register/', {
+                'username': 'other', 'password': 'pw12345!', 'age': 20, 'gender': 'F', 'skin_type': 'dry',
+            })
+        self.assertEqual(response.status_code, 201, response.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            other = User.objects.get(username='other')
+            other.profile.skin_type = 'oily'
+            other.profile.save()
+        # Only the history query.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.history_as(token).status_code, 200)
+
+
+class ConditionalGetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user', password='pw')
+        Profile.objects.create(user=cls.user, skin_type='oily')
+        cls.other = User.objects.create_user('other', password='pw')
+        Review.objects.create(user=cls.user, rating=5, text='good')
+        cls.diagnosis = Diagnosis.objects.create(user=cls.user, image='diagnoses/a.jpg', result={})
+
+    def login(self, user):
+        token = MyTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_reviews(self):
+        response = self.client.get('/api/reviews/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        # Cached page, then 304: neither queries the database.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/reviews/').content, response.content)
+            self.assertEqual(self.client.get('/api/reviews/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/reviews/?page_size=5')['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.other, rating=4, text='new')
+        response = self.client.get('/api/reviews/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_history(self):
+        self.login(self.user)
+        response = self.client.get('/api/history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Authentication still runs first, and the ETag is per user.
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag).status_code, 401)
+        self.login(self.other)
+        self.assertEqual(self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/history/{self.diagnosis.pk}/').status_code, 204)
+        response = self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_examples(self):
+        response = self.client.get('/api/examples/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/examples/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
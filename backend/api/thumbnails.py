@@ -0,0 +1,198 @@
+"""
+Resized, recompressed derivatives of diagnosis photos for list views.
+
+History cards and the admin grid only need a few hundred pixels, but used to
+load the original multi-megabyte phone photo. For ``diagnoses/abc.jpg`` each
+size in ``THUMBNAILS['SIZES']`` is stored next to the originals as
+``derivatives/<size>/diagnoses/abc.jpg.webp`` (or ``.jpg.jpg`` with
+``FORMAT = 'JPEG'``). The original's extension is kept, so ``abc.jpg`` and
+``abc.png`` do not share derivatives.
+
+Derivatives are built:
+
+* when the write-behind writer stores the diagnosis (api/persistence.py),
+* in the background after a listing asked for a missing one; until then
+  ``derivative_url`` returns the original's URL, and
+* for existing files, by ``python manage.py build_thumbnails``.
+
+Listings do not stat every derivative on every request: ``derivatives``
+remembers for ``KNOWN_TTL_SECONDS`` which ones exist, and which originals
+could not be resized, so those are not retried on every listing.
+
+All sizes are produced from a single decode. JPEGs are decoded with a DCT
+draft close to the largest size, and each smaller size is resampled from the
+previous, larger one.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as wait_all
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .storage import OverwritingStorage
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+
+# Derivatives known to exist (and originals that failed) are remembered this long, for at most this many names.
+KNOWN_TTL_SECONDS = 600
+KNOWN_MAX_ENTRIES = 10000
+
+# Same location as default_storage. A rebuild, or two builds at once, replace the file.
+derivative_storage = OverwritingStorage()
+
+
+def derivative_name(image_name, size):
+    extension = EXTENSIONS[settings.THUMBNAILS['FORMAT']]
+    return f"{settings.THUMBNAILS['DIRECTORY']}/{size}/{image_name}{extension}"
+
+
+def _encode(img):
+    config = settings.THUMBNAILS
+    buffer = io.BytesIO()
+    if config['FORMAT'] == 'WEBP':
+        img.save(buffer, 'WEBP', quality=config['QUALITY'], method=4)
+    else:
+        img.save(buffer, 'JPEG', quality=config['QUALITY'], optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def build_derivatives(image_name, storage, sizes=None, force=False):
+    """
+    Create the missing derivatives of an image in ``storage``. Returns the names written.
+
+    Derivatives go to ``derivative_storage`` under their own names (the image
+    storage would rename them by content).
+    """
+    all_sizes = settings.THUMBNAILS['SIZES']
+    sizes = [size for size in (sizes or all_sizes) if size in all_sizes]
+    if not force:
+        sizes = [size for size in sizes if not default_storage.exists(derivative_name(image_name, size))]
+    if not sizes:
+        return []
+
+    # Largest first, so each size is resampled from the one before it.
+    sizes.sort(key=lambda size: all_sizes[size][0] * all_sizes[size][1], reverse=True)
+    written = []
+    with storage.open(image_name, 'rb') as f:
+        img = Image.open(f)
+        if img.format == 'JPEG':
+            img.draft('RGB', tuple(all_sizes[sizes[0]]))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        for size in sizes:
+            img.thumbnail(tuple(all_sizes[size]), Image.LANCZOS, reducing_gap=3.0)
+            written.append(derivative_storage.save(derivative_name(image_name, size), ContentFile(_encode(img))))
+    return written
+
+
+class DerivativeBuilder:
+    """Builds missing derivatives for listings on a background thread and remembers which exist."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known = OrderedDict()
+        self._pending = {}
+        self._executor = None
+        self._pid = None
+
+    def exists(self, name):
+        if self._recall(('exists', name)):
+            return True
+        if default_storage.exists(name):
+            self._remember(('exists', name))
+            return True
+        return False
+
+    def build_later(self, image_name, storage):
+        """Build the missing derivatives of an image unless that is already running or recently failed."""
+        if self._recall(('failed', image_name)):
+            return None
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: the parent's thread does not exist here.
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='derivatives')
+                self._pending = {}
+                self._pid = os.getpid()
+            future = self._pending.get(image_name)
+            if future is None:
+                future = self._executor.submit(self._build, image_name, storage)
+                self._pending[image_name] = future
+            return future
+
+    def _build(self, image_name, storage):
+        try:
+            for name in build_derivatives(image_name, storage):
+                self._remember(('exists', name))
+        except FileNotFoundError:
+            # The original is gone too (e.g. a row restored without its media).
+            logger.warning('Cannot build derivatives of %s: the original is missing', image_name)
+            self._remember(('failed', image_name))
+        except Exception:
+            logger.exception('Could not build derivatives of %s', image_name)
+            self._remember(('failed', image_name))
+        finally:
+            with self._lock:
+                self._pending.pop(image_name, None)
+
+    def wait(self, timeout=None):
+        """Wait for the builds started so far (for tests and management commands)."""
+        with self._lock:
+            futures = list(self._pending.values())
+        wait_all(futures, timeout)
+
+    def forget(self, names):
+        with self._lock:
+            for name in names:
+                self._known.pop(('exists', name), None)
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
+
+    def _recall(self, key):
+        with self._lock:
+            expires_at = self._known.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._known[key]
+                return False
+            return True
+
+    def _remember(self, key):
+        with self._lock:
+            self._known[key] = time.monotonic() + KNOWN_TTL_SECONDS
+            self._known.move_to_end(key)
+            while len(self._known) > KNOWN_MAX_ENTRIES:
+                self._known.popitem(last=False)
+
+
+derivatives = DerivativeBuilder()
+
+
+def derivative_url(image, size):
+    """URL of a derivative of an ImageFieldFile, or of the original while the derivative is built."""
+    if not image:
+        return None
+    name = derivative_name(image.name, size)
+    if derivatives.exists(name):
+        return default_storage.url(name)
+    derivatives.build_later(image.name, image.storage)
+    return image.url
+
+
+def delete_derivatives(image_name):
+    names = [derivative_name(image_name, size) for size in settings.THUMBNAILS['SIZES']]
+    derivatives.forget(names)
+    for name in names:
+        default_storage.delete(name)
@@ -0,0 +1,193 @@
+"""
+Skincare tips shown with a diagnosis.
+
+The texts live in a data file, ``settings.TIPS['PATH']``
+(api/data/skincare_tips.json)::
+
+    {"current": 1, "versions": {"1": {"<label>": {"<skin type>": ["...", ...]}}}}
+
+Stored diagnoses keep only label ids and scores (see api/results.py) and get
+their tips from here when they are serialized. A stored result names the tips
+version it was made with, and label ids index that version's labels in file
+order. When the texts change, add a new version and point ``current`` at it
+instead of editing an old one, so existing rows still expand to the tips they
+were shown. Rows whose version was removed from the file anyway are expanded
+with the current version, and a warning is logged.
+
+Each version is compiled into a ``TipsTable``: a flat index keyed by
+``(label id, skin type)`` with the fallback to ``default`` already applied,
+and a cache of rendered tip lists, both holding tuples. The file is re-read
+when its mtime changes (checked at most every ``RELOAD_CHECK_SECONDS``), so
+edits take effect without a restart. A file that fails to load is logged and
+the tables already loaded stay in use.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+RENDER_CACHE_SIZE = 1024
+
+
+class TipsTable:
+    def __init__(self, version, tips):
+        self.version = version
+        self.source = tips
+        self.labels = tuple(tips)
+        self.label_ids = {label: i for i, label in enumerate(self.labels)}
+        self.skin_types = tuple(sorted({
+            skin_type for by_skin_type in tips.values() for skin_type in by_skin_type
+        } - {'default'}))
+        self.entries = {}
+        for label_id, label in enumerate(self.labels):
+            by_skin_type = tips[label]
+            default = tuple(by_skin_type.get('default', ()))
+            self.entries[label_id, 'default'] = default
+            for skin_type in self.skin_types:
+                self.entries[label_id, skin_type] = tuple(by_skin_type.get(skin_type, default))
+        self.render = lru_cache(maxsize=RENDER_CACHE_SIZE)(self._render)
+
+    def lookup(self, label, skin_type):
+        label_id = self.label_ids.get(label)
+        if label_id is None:
+            return ()
+        tips = self.entries.get((label_id, skin_type))
+        return tips if tips is not None else self.entries[label_id, 'default']
+
+    def _render(self, shown, skin_type):
+        """``shown`` is ``((label, confidence), ...)``."""
+        lines = []
+        for label, confidence in shown:
+            tips = self.lookup(label, skin_type)
+            if len(shown) > 1 and tips:
+                lines.append(f"--- {label} ({confidence:.1f}%) 관련 솔루션 ---")
+            lines.extend(tips)
+        return tuple(lines)
+
+
+def load_tables(path, previous=None):
+    """Parse the tips file into ``(current version, {version: TipsTable})``."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    previous = previous or {}
+    tables = {}
+    for version, tips in data['versions'].items():
+        version = int(version)
+        for label, by_skin_type in tips.items():
+            if not all(isinstance(lines, list) for lines in by_skin_type.values()):
+                raise ValueError(f'Tips for {label!r} in version {version} must be lists of lines.')
+        # Keep unchanged versions (and their render caches) across reloads.
+        old = previous.get(version)
+        tables[version] = old if old is not None and old.source == tips else TipsTable(version, tips)
+    current = int(data['current'])
+    if current not in tables:
+        raise ValueError(f'Current tips version {current} is not in the file.')
+    return current, tables
+
+
+class TipsCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._state = None  # (current version, tables)
+        self._missing = set()
+        self._mtime = None
+        self._next_check = 0.0
+
+    def _refresh(self):
+        if time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            config = settings.TIPS
+            path = config['PATH']
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                if self._state is None:
+                    raise
+                logger.exception('Could not stat %s; keeping tips version %s', path, self._state[0])
+                mtime = self._mtime
+            if mtime != self._mtime or self._state is None:
+                try:
+                    self._state = load_tables(path, self._state[1] if self._state else None)
+                    logger.info('Loaded tips from %s (current version %s)', path, self._state[0])
+                except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                    if self._state is None:
+                        raise
+                    logger.exception('Could not reload %s; keeping tips version %s', path, self._state[0])
+                self._mtime = mtime
+            self._next_check = time.monotonic() + config['RELOAD_CHECK_SECONDS']
+
+    def current_version(self):
+        self._refresh()
+        return self._state[0]
+
+    def file_mtime(self):
+        """mtime (ns) of the tips file as last loaded; changes when an edit is picked up."""
+        self._refresh()
+        return self._mtime
+
+    def table(self, version=None):
+        self._refresh()
+        current, tables = self._state
+        return tables[current if version is None else version]
+
+    def stored_table(self, version):
+        """The table of ``version``, or the current one (with a warning, once) if the file no longer has it."""
+        self._refresh()
+        current, tables = self._state
+        table = tables.get(version)
+        if table is not None:
+            return table
+        if version not in self._missing:
+            self._missing.add(version)
+            logger.warning('Tips version %s is not in %s; showing stored results with version %s',
+                           version, settings.TIPS['PATH'], current)
+        return tables[current]
+
+
+tips_catalog = TipsCatalog()
+
+
+@receiver(setting_changed)
+def reset_tips_catalog(setting, **kwargs):
+    if setting == 'TIPS':
+        tips_catalog.reset()
+
+
+def current_tips_version():
+    return tips_catalog.current_version()
+
+
+def tips_table(version=None):
+    """The compiled table of a tips version (the current one by default)."""
+    return tips_catalog.table(version)
+
+
+def stored_tips_table(version):
+    """The table to expand a stored result made with tips ``version`` (see api/results.py)."""
+    return tips_catalog.stored_table(version)
+
+
+def tips_labels(version=None):
+    """Label names in id order for a tips version."""
+    return tips_table(version).labels
+
+
+def build_tips(predictions, skin_type, version=None, table=None):
+    """
+    Tips for the shown ``predictions`` (``[{'label', 'confidence'}, ...]``), with a
+    header per label when more than one label is shown.
+    """
+    shown = tuple([(item['label'], item['confidence']) for item in predictions])
+    return list((table or tips_table(version)).render(shown, skin_type))
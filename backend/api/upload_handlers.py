@@ -0,0 +1,96 @@
+"""
+Upload handling for diagnosis images.
+
+Django's default handlers keep uploads under 2.5 MB in memory and spool
+larger ones to disk. ``HashingImageUploadHandler`` replaces both:
+
+* every file goes straight to a temporary file in ``FILE_UPLOAD_TEMP_DIR``
+  and is never held in memory as a whole;
+* the SHA-256 of the bytes is computed while they are written
+  (``uploaded_file.sha256``);
+* requests larger than ``BATCH_UPLOAD_MAX_IMAGES`` full-size images are
+  refused before the body is read, files over ``UPLOAD_MAX_IMAGE_BYTES`` are
+  dropped as soon as they cross the limit, and files whose first bytes are
+  not a known image signature are dropped on their first chunk.
+
+``FILE_UPLOAD_TEMP_DIR`` sits on the same filesystem as ``MEDIA_ROOT``, so
+``FileSystemStorage`` renames the temporary file into place instead of
+copying it. The bytes are written once and then read by the decoder.
+
+Rejected files are listed in ``request.upload_rejections`` as
+``{'index', 'filename', 'status', 'error'}`` dicts. ``index`` is the file's
+position in the request, the same as ``uploaded_file.upload_index`` for
+accepted files.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, StopUpload, TemporaryFileUploadHandler
+
+# Leading bytes of the image formats the decoder accepts.
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',            # JPEG
+    b'\x89PNG\r\n\x1a\n',       # PNG
+    b'GIF87a', b'GIF89a',       # GIF
+    b'BM',                      # BMP
+    b'II*\x00', b'MM\x00*',     # TIFF
+)
+
+
+def looks_like_image(head):
+    if head.startswith(IMAGE_SIGNATURES):
+        return True
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return True
+    # HEIC/HEIF/AVIF: ISO-BMFF 'ftyp' box.
+    return head[4:8] == b'ftyp'
+
+
+class HashingImageUploadHandler(TemporaryFileUploadHandler):
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.upload_rejections = []
+        self.index = -1
+        self.too_large = False
+        max_bytes = settings.UPLOAD_MAX_IMAGE_BYTES * settings.INFERENCE['BATCH_UPLOAD_MAX_IMAGES']
+        if content_length and content_length > max_bytes:
+            self.too_large = True
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        self.index += 1
+        if self.too_large:
+            self.reject(413, 'The upload is too large.', file_name)
+            # Stops parsing without reading the rest of the body.
+            raise StopUpload(connection_reset=True)
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not looks_like_image(raw_data[:16]):
+            self.reject(415, 'The uploaded file is not a supported image.', self.file_name)
+            self.discard()
+            raise SkipFile()
+        self.size += len(raw_data)
+        if self.size > settings.UPLOAD_MAX_IMAGE_BYTES:
+            self.reject(413, f'Each image must be at most {settings.UPLOAD_MAX_IMAGE_BYTES} bytes.', self.file_name)
+            self.discard()
+            raise SkipFile()
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.digest.hexdigest()
+        uploaded_file.upload_index = self.index
+        return uploaded_file
+
+    def discard(self):
+        self.file.close()
+
+    def reject(self, status_code, message, file_name):
+        self.request.upload_rejections.append({
+            'index': self.index,
+            'filename': file_name,
+            'status': status_code,
+            'error': message,
+        })
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    MyTokenObtainPairView, RegisterView, PredictionView, ExampleImageView,
+    MyTokenObtainPairView, RegisterView, PredictionView, BatchPredictionView, PredictionJobView, InferenceStatsView, MetricsView, ReadinessView, ExampleImageView,
     ReviewList, ReviewCreate, DiagnosisHistoryView, DiagnosisDetailView,
     ProfileView, ChangePasswordView,
     UserAdminViewSet, ReviewAdminViewSet, DiagnosisAdminViewSet
@@ -10,6 +11,12 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
+if settings.ASYNC_SERVING['ENABLED']:
+    # ASGI: decode and inference off the event loop (see api/async_views.py).
+    from .async_views import AsyncDiagnosisHistoryView, AsyncPredictionView, AsyncReviewList
+
+    PredictionView, DiagnosisHistoryView, ReviewList = AsyncPredictionView, AsyncDiagnosisHistoryView, AsyncReviewList
+
 urlpatterns = [
     # Auth
     path('users/register/', RegisterView.as_view(), name='register'),
@@ -20,7 +27,12 @@ urlpatterns = [
     
     # Main Features
     path('predict/', PredictionView.as_view(), name='predict'),
+    path('predict/batch/', BatchPredictionView.as_view(), name='predict-batch'),
+    path('predict/stats/', InferenceStatsView.as_view(), name='predict-stats'),
+    path('predict/<uuid:job_id>/', PredictionJobView.as_view(), name='predict-job'),
     path('examples/', ExampleImageView.as_view(), name='example_images'),
+    path('health/ready/', ReadinessView.as_view(), name='health-ready'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 
     # Reviews
     path('reviews/', ReviewList.as_view(), name='review-list'),
@@ -1,222 +1,37 @@
 import os
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Input, Conv2D, MaxPooling2D, Flatten, Dense, Dropout, Rescaling, RandomFlip, RandomRotation
-from tensorflow.keras.optimizers import Adam
 
 from django.contrib.auth.models import User
 from .serializers import MyTokenObtainPairSerializer, RegisterSerializer, DiagnosisSerializer, ReviewSerializer, UserSerializerForProfile, ChangePasswordSerializer, UserAdminSerializer, ReviewAdminSerializer, DiagnosisAdminSerializer
 from rest_framework import generics
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from PIL import Image
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+from django.urls import reverse
+from PIL import UnidentifiedImageError
 import numpy as np
 
-# --- 1. 기본 파라미터 및 모델 로드 --- (학습 코드 기반으로 재구성)
-IMAGE_HEIGHT = 100
-IMAGE_WIDTH = 125
-CHANNELS = 3
-
-MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'model', 'keras.h5')
-LABELS_PATH = os.path.join(os.path.dirname(__file__), '..', 'model', 'labels.txt')
-
-model = None
-labels = None
-num_classes = 0
-
-try:
-    with open(LABELS_PATH, 'r', encoding='utf-8') as f:
-        labels = [line.strip() for line in f.readlines()]
-    num_classes = len(labels)
-
-    data_augmentation = Sequential(
-      [
-        RandomFlip("horizontal"),
-        RandomRotation(0.1),
-      ],
-      name="data_augmentation"
-    )
-
-    model = Sequential([
-        Input(shape=(IMAGE_HEIGHT, IMAGE_WIDTH, CHANNELS)),
-        Rescaling(1./255),
-        data_augmentation,
-        Conv2D(32, (3, 3), activation='relu', padding='same'),
-        MaxPooling2D((2, 2)),
-        Conv2D(64, (3, 3), activation='relu', padding='same'),
-        MaxPooling2D((2, 2)),
-        Conv2D(128, (3, 3), activation='relu', padding='same'),
-        MaxPooling2D((2, 2)),
-        Flatten(),
-        Dense(128, activation='relu'),
-        Dropout(0.5),
-        Dense(num_classes, activation='softmax')
-    ])
-
-    model.load_weights(MODEL_PATH)
-    model.trainable = False
-    model.compile(optimizer=Adam(learning_rate=0.00075), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
-
-except Exception as e:
-    model = None
-    labels = None
-    print(f"Error loading model or labels: {e}")
+from .authentication import ClaimsJWTAuthentication, UserPrincipal
+from .batching import QueueFullError
+from .http_cache import REVIEWS, ConditionalGetMixin, bump_version, current_version, history_scope
+from .jobs import DONE, FAILED, PENDING, JobServerUnavailable, get_job_queue
+from .metrics import render_prometheus, timed
+from .model_registry import LOADING, READY, ModelNotReady, batcher, registry
+from .pagination import HistoryPagination, ListPagination
+from .persistence import diagnosis_writer, is_deferred
+from .postprocessing import top_predictions
+from .prediction_cache import prediction_cache
+from .preprocessing import ImageTooLarge, load_image_array, load_image_arrays
 
 from .models import Diagnosis, Review
+from .results import compact_result
+from .signals import release_image
+from .tips import build_tips, tips_catalog
 
 
-SKINCARE_TIPS = {
-    "여드름 피부": {
-        "oily": [
-            "**AI 진단:** 여드름",
-            "**피부 타입:** 지성",
-            "**원인 분석:** 과다한 피지 분비로 모공이 막히고, 각질이 제대로 탈락하지 못해 염증이 발생하기 쉬운 상태입니다.",
-            "**추천 솔루션:** BHA(살리실산) 성분이 포함된 클렌저를 사용하여 모공 속 피지와 각질을 관리하세요. 주 1-2회 클레이 마스크로 피지를 흡착해주는 것도 좋습니다. 논코메도제닉(Non-comedogenic) 오일프리 제품을 사용하세요.",
-            "**생활 팁:** 기름진 음식과 당분 높은 음식 섭취를 줄이고, 얼굴을 만지는 습관을 피하세요. 충분한 수면은 필수입니다."
-        ],
-        "dry": [
-            "**AI 진단:** 여드름",
-            "**피부 타입:** 건성",
-            "**원인 분석:** 피부 유수분 밸런스가 무너지고, 건조함으로 인해 각질이 쌓여 모공을 막아 트러블이 발생한 상태입니다.",
-            "**추천 솔루션:** 강한 세정제 대신 순한 약산성 폼클렌저를 사용하세요. 각질 제거는 자극이 적은 PHA나 효소 클렌저를 활용하고, 세라마이드, 히알루론산 성분의 보습제로 피부 장벽을 강화해야 합니다.",
-            "**생활 팁:** 보습제를 충분히 발라 피부를 촉촉하게 유지하고, 실내 습도를 적절히 조절해주세요. 알코올이 함유된 토너는 피하는 것이 좋습니다."
-        ],
-        "combination": [
-            "**AI 진단:** 여드름",
-            "**피부 타입:** 복합성",
-            "**원인 분석:** T존(이마, 코)의 과다 피지와 U존(볼, 턱)의 건조함이 복합적으로 작용하여 트러블이 발생하는 상태입니다.",
-            "**추천 솔루션:** T존에는 BHA 성분의 제품을, U존에는 수분감이 풍부한 제품을 사용하는 등 부위별 케어(Zonal Care)가 효과적입니다. 티트리 오일이나 시카 성분의 스팟 제품으로 트러블 부위를 관리하세요.",
-            "**생활 팁:** 전체적으로 유분감이 많은 제품보다는 가벼운 젤이나 로션 타입의 수분 제품을 사용하고, 주기적으로 각질을 관리해주세요."
-        ],
-        "sensitive": [
-            "**AI 진단:** 여드름",
-            "**피부 타입:** 민감성",
-            "**원인 분석:** 외부 자극에 의해 피부 장벽이 손상되고, 작은 자극에도 쉽게 염증 반응을 일으켜 트러블이 발생하는 상태입니다.",
-            "**추천 솔루션:** 최대한 자극이 적은 제품을 선택하세요. 병풀추출물(시카), 알란토인 등 진정 성분이 함유된 제품으로 피부를 보호하고, 새로운 제품 사용 전 반드시 패치 테스트를 진행하세요. 물리적 각질 제거는 피해야 합니다.",
-            "**생활 팁:** 스트레스 관리와 함께, 자외선 차단제를 꼼꼼히 발라 피부를 보호해주세요. 성분 목록이 단순한 제품을 선택하는 것이 좋습니다."
-        ],
-        "default": [
-            "**AI 진단:** 여드름",
-            "**피부 타입:** 일반",
-            "**원인 분석:** 호르몬 변화, 스트레스, 잘못된 식습관 등 다양한 요인으로 인해 일시적인 트러블이 발생할 수 있습니다.",
-            "**추천 솔루션:** 자극이 적은 약산성 클렌저를 사용하고, 트러블 부위에는 티트리 오일 등 스팟 케어 제품을 사용해 보세요.",
-            "**생활 팁:** 턱이나 손으로 얼굴을 만지는 습관을 줄이고, 침구류를 청결하게 관리하는 것이 중요합니다."
-        ]
-    },
-    "정상 피부": {
-        "default": [
-            "**AI 진단:** 양호",
-            "**분석:** 특별한 피부 질환 없이 건강한 상태입니다. 축하합니다!",
-            "**유지 팁:** 현재의 건강한 상태를 유지하기 위해 기본적인 클렌징과 보습에 충실하고, 자외선 차단제를 매일 사용하는 습관을 들이세요.",
-            "**추가 관리:** 계절 변화나 컨디션에 따라 건조함이나 유분이 느껴질 때 그에 맞는 수분/진정 팩을 사용해주면 좋습니다."
-        ]
-    },
-    "건선 피부": {
-        "oily": [
-            "**AI 진단:** 건선",
-            "**피부 타입:** 지성",
-            "**분석:** 피부 자체는 건조하고 각질이 문제지만, 두피나 얼굴 등 피지선이 발달한 곳에서는 지성 트러블이 동반될 수 있습니다.",
-            "**추천 솔루션:** 각질을 억지로 제거하지 말고, 가벼운 제형의 보습제를 사용하여 피부를 유연하게 만드세요. 살리실산(BHA) 성분은 건선에 도움이 될 수 있으나, 자극이 느껴지면 사용을 중단해야 합니다.",
-            "**생활 팁:** 스트레스 관리가 매우 중요하며, 금주, 금연을 실천하세요. 오메가-3가 풍부한 음식이 도움이 될 수 있습니다."
-        ],
-        "dry": [
-            "**AI 진단:** 건선",
-            "**피부 타입:** 건성",
-            "**분석:** 피부가 매우 건조하여 각질층이 두꺼워지고, 붉은 반점과 가려움증이 심하게 나타나는 상태입니다.",
-            "**추천 솔루션:** 바셀린, 시어버터, 세라마이드 등 고보습 성분이 함유된 매우 리치한 크림이나 연고 타입의 보습제를 사용하세요. 목욕 후 3분 이내에 전신에 보습제를 바르는 것이 핵심입니다.",
-            "**생활 팁:** 피부에 상처가 나지 않도록 주의하고, 때를 미는 등 피부에 자극을 주는 행위를 피해야 합니다. 증상이 심하면 반드시 전문의와 상담하세요."
-        ],
-        "default": [
-            "**AI 진단:** 건선",
-            "**분석:** 피부에 붉은 반점과 함께 은백색의 각질이 나타나는 만성 피부 질환일 수 있습니다.",
-            "**추천 솔루션:** 피부를 항상 촉촉하게 유지하는 것이 매우 중요합니다. 목욕 후 3분 이내에 자극 없는 고보습 크림을 전신에 발라주세요.",
-            "**생활 팁:** 스트레스 관리와 함께 금주, 금연을 실천하고, 피부에 상처가 나지 않도록 주의해야 합니다. 증상이 심할 경우 반드시 전문의와 상담하세요."
-        ]
-    },
-    "아토피 피부": {
-        "oily": [
-            "**AI 진단:** 아토피 피부염",
-            "**피부 타입:** 지성",
-            "**분석:** 피부 장벽이 약해 외부 자극에 민감하지만, 유분도 함께 분비되는 복합적인 상태일 수 있습니다.",
-            "**추천 솔루션:** 가벼운 젤이나 로션 타입의 저자극 보습제를 사용하여 피부 장벽을 보호하세요. 논코메도제닉(Non-comedogenic) 제품을 선택하여 모공 막힘을 방지하는 것이 중요합니다.",
-            "**생활 팁:** 오일프리(Oil-free) 제품을 사용하고, 잦은 세안보다는 순한 클렌저로 아침, 저녁 세안하는 습관을 유지하세요."
-        ],
-        "dry": [
-            "**AI 진단:** 아토피 피부염",
-            "**피부 타입:** 건성",
-            "**분석:** 피부의 유수분 부족과 함께 피부 장벽 기능이 심하게 저하되어 극심한 건조함과 가려움증을 유발하는 상태입니다.",
-            "**추천 솔루션:** 세라마이드, 판테놀 등 피부 장벽 강화 성분이 고농축된 리치한 크림 타입의 보습제를 수시로 덧발라주세요. 샤워나 세안 후 3분 이내에 보습제를 바르는 것이 가장 효과적입니다.",
-            "**생활 팁:** 가습기를 사용하여 실내 습도를 50-60%로 유지하고, 뜨거운 물 샤워는 피해주세요. 보습력이 좋은 입욕제를 사용하는 것도 도움이 됩니다."
-        ],
-        "sensitive": [
-            "**AI 진단:** 아토피 피부염",
-            "**피부 타입:** 민감성",
-            "**분석:** 아토피 피부염 자체가 매우 민감한 상태로, 작은 자극에도 쉽게 악화될 수 있습니다.",
-            "**추천 솔루션:** 향료, 색소, 알코올 등 자극적인 성분이 완전히 배제된 제품을 사용하세요. 물리적 자극을 최소화하기 위해 부드럽게 펴 바르고, 진정 성분(예: 판테놀, 마데카소사이드)이 포함된 제품을 선택하세요.",
-            "**생활 팁:** 면 소재의 부드러운 옷을 착용하고, 손톱을 짧게 깎아 긁어서 생기는 2차 감염을 예방하세요. 새로운 음식 섭취 시 알레르기 반응을 주의 깊게 관찰하세요."
-        ],
-        "default": [
-            "**AI 진단:** 아토피 피부염",
-            "**분석:** 심한 가려움증을 동반하는 만성적인 피부 염증 질환일 수 있습니다.",
-            "**추천 솔루션:** 피부 장벽을 강화하는 세라마이드 성분의 보습제를 하루 2-3회 이상 충분히 사용해주세요. 순한 약산성 클렌저로 짧게 샤워하는 것이 좋습니다.",
-            "**생활 팁:** 실내 온도와 습도를 적절히 유지하고, 긁지 않도록 손톱을 짧게 관리하세요. 면 소재의 부드러운 옷을 착용하는 것이 도움이 됩니다."
-        ]
-    },
-    "주사 피부": {
-        "oily": [
-            "**AI 진단:** 주사 피부염",
-            "**피부 타입:** 지성",
-            "**분석:** 피지 분비와 함께 혈관 확장이 동반되어 피부가 붉어지고 염증성 구진이 나타날 수 있습니다.",
-            "**추천 솔루션:** 아젤라익애씨드 성분은 피지 조절과 염증 완화에 모두 도움이 될 수 있습니다. 가벼운 젤 타입의 수분 제품과 오일프리 선크림을 사용하세요.",
-            "**생활 팁:** 맵고 뜨거운 음식, 음주, 사우나 등 혈관을 확장시키는 요인을 피하는 것이 매우 중요합니다."
-        ],
-        "dry": [
-            "**AI 진단:** 주사 피부염",
-            "**피부 타입:** 건성",
-            "**분석:** 피부가 건조하고 장벽이 약해져 붉어짐과 따가움이 쉽게 발생하는 상태입니다.",
-            "**추천 솔루션:** 나이아신아마이드, 세라마이드 등 장벽 강화 및 항염 효과가 있는 성분의 크림을 사용하세요. 순한 크림 클렌저를 사용하고, 자외선 차단은 무기자차(물리적 차단제)를 선택하는 것이 좋습니다.",
-            "**생활 팁:** 급격한 온도 변화를 피하고, 히터나 난로 바람을 직접 쐬지 않도록 주의하세요. 스크럽이나 강한 클렌징 기기 사용은 금물입니다."
-        ],
-        "sensitive": [
-            "**AI 진단:** 주사 피부염",
-            "**피부 타입:** 민감성",
-            "**분석:** 주사 피부염은 극도로 민감한 피부 상태로, 최소한의 자극에도 악화될 수 있습니다.",
-            "**추천 솔루션:** 성분 목록이 가장 단순하고, 진정 효과(예: 감초추출물)가 입증된 제품을 사용하세요. 알코올, 향료, 멘톨, 유칼립투스 오일 등 자극 가능성이 있는 모든 성분을 피해야 합니다.",
-            "**생활 팁:** 외출 시에는 항상 모자나 양산으로 자외선을 차단하고, 피부과 전문의와 상담하여 관리 계획을 세우는 것이 가장 안전합니다."
-        ],
-        "default": [
-            "**AI 진단:** 주사 피부염",
-            "**분석:** 얼굴 중앙 부위가 붉어지고 혈관이 확장되는 만성 염증성 질환일 수 있습니다.",
-            "**추천 솔루션:** 알코올, 향료, 멘톨 등이 없는 매우 순한 제품을 사용하고, 자외선 차단은 필수입니다. 물리적 자외선 차단제를 사용하는 것을 권장합니다.",
-            "**생활 팁:** 맵고 뜨거운 음식, 음주, 급격한 온도 변화 등 증상을 악화시키는 요인을 파악하고 피하는 것이 중요합니다."
-        ]
-    },
-    "지루 피부": {
-        "oily": [
-            "**AI 진단:** 지루 피부염",
-            "**피부 타입:** 지성",
-            "**분석:** 과도한 피지 분비가 말라세지아 효모균의 증식을 유발하여 염증과 각질을 일으키는 상태입니다. 가장 흔한 케이스입니다.",
-            "**추천 솔루션:** 케토코나졸, 시클로피록스 등 항진균 성분이 포함된 샴푸나 클렌저를 주 2-3회 사용하세요. 평소에는 BHA(살리실산) 클렌저로 피지를 조절하는 것이 도움이 됩니다.",
-            "**생활 팁:** 기름진 음식, 인스턴트 식품, 스트레스를 피하고, 머리를 자주 감아 청결을 유지하는 것이 중요합니다."
-        ],
-        "dry": [
-            "**AI 진단:** 지루 피부염",
-            "**피부 타입:** 건성",
-            "**분석:** 피부는 건조하지만, 피지선이 발달한 부위(두피, 코 옆 등)에 부분적으로 지루 피부염이 나타나는 복합적인 상태입니다.",
-            "**추천 솔루션:** 항진균 성분 샴푸/클렌저 사용 횟수를 주 1-2회로 줄이고, 사용 후에는 반드시 충분한 보습을 해주어 건조함을 막아야 합니다. 자극이 없는 보습제를 사용하세요.",
-            "**생활 팁:** 보습을 철저히 하여 피부 장벽을 건강하게 유지하는 것이 염증 완화에 도움이 됩니다. 강한 스크럽은 피하세요."
-        ],
-        "default": [
-            "**AI 진단:** 지루 피부염",
-            "**분석:** 피지 분비가 왕성한 부위에 발생하는 만성적인 습진성 피부염일 수 있습니다.",
-            "**추천 솔루션:** 항진균 성분(케토코나졸 등)이 포함된 샴푸나 클렌저를 주기적으로 사용하여 관리하는 것이 효과적입니다.",
-            "**생활 팁:** 기름진 음식, 단 음식, 음주를 피하고 충분한 수면을 통해 스트레스를 관리해야 합니다. 기름진 연고나 화장품은 피하는 것이 좋습니다."
-        ]
-    }
-}
-
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 # --- User and Auth Views ---
@@ -229,111 +44,457 @@ class RegisterView(generics.CreateAPIView):
 
 
 # --- AI Model Views ---
+NO_DIAGNOSIS_MESSAGE = "정확한 진단을 내리기 어렵습니다. 다른 이미지를 시도해 보세요."
+
+
+def predict_scores(img_array):
+    """
+    Scores for one image, served from the prediction cache when the same image
+    was seen before. Misses run on the inference workers through the batcher.
+    """
+    key = prediction_cache.make_key(img_array, registry.get_model_version())
+    scores = prediction_cache.get(key)
+    if scores is None:
+        scores = batcher.predict(img_array)
+        prediction_cache.set(key, scores)
+    return scores
+
+
+def predict_scores_batch(img_arrays):
+    """
+    Scores for several images: cache hits are reused and all misses go through
+    the inference workers as one batch (split into INFERENCE['BATCH_MAX_SIZE'] chunks).
+    """
+    model_version = registry.get_model_version()
+    keys = [prediction_cache.make_key(img_array, model_version) for img_array in img_arrays]
+    scores = [prediction_cache.get(key) for key in keys]
+    misses = [i for i, row in enumerate(scores) if row is None]
+    chunk_size = settings.INFERENCE['BATCH_MAX_SIZE']
+    for start in range(0, len(misses), chunk_size):
+        chunk = misses[start:start + chunk_size]
+        rows = get_job_queue().predict(
+            np.stack([img_arrays[i] for i in chunk]), timeout=settings.INFERENCE['TIMEOUT_SECONDS'],
+        )
+        for i, row in zip(chunk, rows):
+            scores[i] = row
+            prediction_cache.set(keys[i], row)
+    return scores
+
+
+def stored_result(response_data, skin_type):
+    """The compact form of a prediction payload kept in Diagnosis.result (see api/results.py)."""
+    return compact_result(response_data['predictions'], skin_type, registry.get_model_version())
+
+
+def save_diagnosis(user_id, result, image_file=None, image_name=None):
+    """Store a Diagnosis now, or hand it to the write-behind writer in 'deferred' mode."""
+    if is_deferred():
+        with timed('spool'):
+            diagnosis_writer.enqueue(user_id, result, upload=image_file, image_name=image_name)
+        return
+    diagnosis = Diagnosis(user_id=user_id, image=image_name, result=result)
+    if image_file is not None:
+        with timed('image_write'):
+            diagnosis.image.save(image_file.name, image_file, save=False)
+    with timed('db_insert'):
+        diagnosis.save()
+
+
+def persist_job(job_id, job):
+    """
+    Store the Diagnosis of a finished ``async=true`` job. The job pool calls
+    this when the job is done (see api/jobs.py), so it does not wait for a poll.
+    """
+    meta = job['meta']
+    if meta['is_example']:
+        return
+    predictions = None
+    if job['status'] == DONE:
+        predictions = top_predictions(job['scores'], registry.get_labels())[0]
+    if predictions:
+        result = compact_result(predictions, meta['skin_type'], meta['model_version'])
+        save_diagnosis(meta['user_id'], result, image_name=meta['image'])
+    else:
+        # Failed, or nothing confident enough to keep.
+        release_image(Diagnosis._meta.get_field('image').storage, meta['image'])
+
+
+def get_skin_type(user):
+    if isinstance(user, UserPrincipal):
+        # From the token or the auth cache; no profile query (see api/authentication.py).
+        return user.skin_type or 'default'
+    if hasattr(user, 'profile') and user.profile.skin_type:
+        return user.profile.skin_type
+    return 'default'
+
+
+def prediction_response(predictions, user_skin_type):
+    """
+    The `predictions`/`tips` payload for one image's shown predictions (see
+    api/postprocessing.py). Returns None when no label is confident enough.
+    """
+    if not predictions:
+        return None
+
+    with timed('tips'):
+        tips = build_tips(predictions, user_skin_type)
+    return {
+        "predictions": predictions,
+        "tips": tips
+    }
+
+
+def build_prediction_response(scores, labels, user_skin_type):
+    """Turn one row of model scores into the `predictions`/`tips` payload, or None."""
+    with timed('postprocess'):
+        predictions = top_predictions(scores, labels)[0]
+    return prediction_response(predictions, user_skin_type)
+
+
 class PredictionView(APIView):
+    """
+    Synchronous by default. With `async=true` the image is queued on the
+    inference worker pool and a job id is returned (202); poll it at
+    /api/predict/<job_id>/.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        if not model or not labels:
-            return Response({"error": "Model or labels not loaded properly."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        with timed('upload'):
+            is_async = request.POST.get('async', 'false').lower() == 'true'
+        labels = None
+        if not is_async:
+            try:
+                labels = registry.get_labels()
+            except ModelNotReady:
+                return Response({"error": "Model or labels not loaded properly."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         image_file = request.FILES.get('image')
         is_example = request.POST.get('is_example', 'false').lower() == 'true'
         
         if not image_file:
+            rejections = getattr(request, 'upload_rejections', None)
+            if rejections:
+                return Response({"error": rejections[0]['error']}, status=rejections[0]['status'])
             return Response({"error": "No image provided."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            img = Image.open(image_file)
-            img = img.resize((IMAGE_WIDTH, IMAGE_HEIGHT), Image.LANCZOS)
-            img = img.convert('RGB')
-            img_array = np.array(img)
-            img_array = np.expand_dims(img_array, axis=0)
-
-            prediction = model.predict(img_array)
-            scores = prediction[0]
-
-            confidences = {labels[i]: float(scores[i] * 100) for i in range(len(labels))}
-            sorted_confidences = sorted(confidences.items(), key=lambda item: item[1], reverse=True)
-
-            filtered_results = []
-            for label, confidence in sorted_confidences:
-                if confidence > 10.0:
-                    filtered_results.append({'label': label, 'confidence': round(confidence, 2)})
-                if len(filtered_results) >= 3:
-                    break
-            
-            if not filtered_results:
-                return Response({"prediction": "정확한 진단을 내리기 어렵습니다. 다른 이미지를 시도해 보세요."}, status=status.HTTP_200_OK)
-
-            user_skin_type = 'default'
-            if hasattr(request.user, 'profile') and request.user.profile.skin_type:
-                user_skin_type = request.user.profile.skin_type
-
-            combined_tips = []
-            for result in filtered_results:
-                disease_label = result['label']
-                disease_tips_structure = SKINCARE_TIPS.get(disease_label, {})
-                tips_for_disease = disease_tips_structure.get(user_skin_type, disease_tips_structure.get('default', []))
-                
-                if len(filtered_results) > 1 and tips_for_disease:
-                    separator = f"--- {disease_label} ({result['confidence']:.1f}%) 관련 솔루션 ---"
-                    combined_tips.append(separator)
-
-                combined_tips.extend(tips_for_disease)
-            
-            response_data = {
-                "predictions": filtered_results,
-                "tips": combined_tips
-            }
+            try:
+                with timed('decode'):
+                    img_array = load_image_array(image_file)
+            except ImageTooLarge as e:
+                return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            except UnidentifiedImageError:
+                return Response({"error": "The uploaded file is not a supported image."}, status=status.HTTP_400_BAD_REQUEST)
+
+            if is_async:
+                return self.submit_job(request, image_file, img_array, is_example)
+
+            try:
+                with timed('inference'):
+                    scores = predict_scores(img_array)
+            except QueueFullError:
+                return Response({"error": "The server is busy. Please try again shortly."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except TimeoutError:
+                return Response({"error": "Prediction timed out. Please try again."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except JobServerUnavailable:
+                return Response({"error": "The inference service is unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except ModelNotReady:
+                return Response({"error": "Model or labels not loaded properly."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            skin_type = get_skin_type(request.user)
+            response_data = build_prediction_response(scores, labels, skin_type)
+            if response_data is None:
+                return Response({"prediction": NO_DIAGNOSIS_MESSAGE}, status=status.HTTP_200_OK)
 
             if not is_example:
-                Diagnosis.objects.create(
-                    user=request.user,
-                    image=image_file,
-                    result=response_data
-                )
+                save_diagnosis(request.user.id, stored_result(response_data, skin_type), image_file=image_file)
 
             return Response(response_data, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"error": f"An error occurred during prediction: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def submit_job(self, request, image_file, img_array, is_example):
+        # The Diagnosis row is written by persist_job when the job finishes, which
+        # may be before this returns, so the upload is stored before the job is queued.
+        image_field = Diagnosis._meta.get_field('image')
+        image_name = None
+        if not is_example:
+            with timed('image_write'):
+                image_name = image_field.storage.save(image_field.generate_filename(None, image_file.name), image_file)
+
+        meta = {
+            'user_id': request.user.id,
+            'skin_type': get_skin_type(request.user),
+            'is_example': is_example,
+            'image': image_name,
+            'model_version': registry.get_model_version(),
+        }
+        try:
+            job_id = get_job_queue().submit(img_array, meta)
+        except (QueueFullError, JobServerUnavailable) as e:
+            if image_name is not None:
+                release_image(image_field.storage, image_name)
+            if isinstance(e, QueueFullError):
+                return Response({"error": "The server is busy. Please try again shortly."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return Response({"error": "The inference service is unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return Response({
+            "job_id": job_id,
+            "status": "pending",
+            "status_url": reverse('predict-job', kwargs={'job_id': job_id}),
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class BatchPredictionView(APIView):
+    """
+    Diagnose several images (`images` form field) in one request.
+
+    Images are decoded in parallel and run through the model as one batch.
+    Diagnoses are created in a single transaction, or spooled for the
+    write-behind writer (then items carry no `diagnosis_id`). Each item in
+    `results` is either the usual `predictions`/`tips` payload, the "no
+    diagnosis" message, or an `error` for that image alone.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            labels = registry.get_labels()
+        except ModelNotReady:
+            return Response({"error": "Model or labels not loaded properly."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        with timed('upload'):
+            image_files = request.FILES.getlist('images')
+        is_example = request.POST.get('is_example', 'false').lower() == 'true'
+
+        # Files the upload handler refused never reach request.FILES.
+        rejections = getattr(request, 'upload_rejections', [])
+
+        if not image_files:
+            if rejections:
+                return Response({"error": rejections[0]['error']}, status=rejections[0]['status'])
+            return Response({"error": "No images provided."}, status=status.HTTP_400_BAD_REQUEST)
+        max_images = settings.INFERENCE['BATCH_UPLOAD_MAX_IMAGES']
+        if len(image_files) + len(rejections) > max_images:
+            return Response({"error": f"At most {max_images} images can be diagnosed at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+        files_by_index = {
+            getattr(image_file, 'upload_index', i): image_file for i, image_file in enumerate(image_files)
+        }
+        results = [{'index': index, 'filename': image_file.name} for index, image_file in files_by_index.items()]
+        results.extend({'index': r['index'], 'filename': r['filename'], 'error': r['error']} for r in rejections)
+        results.sort(key=lambda result: result['index'])
+
+        decoded = []
+        accepted = [result for result in results if 'error' not in result]
+        with timed('decode'):
+            arrays = load_image_arrays(image_files)
+        for result, (img_array, error) in zip(accepted, arrays):
+            if isinstance(error, ImageTooLarge):
+                result['error'] = str(error)
+            elif isinstance(error, UnidentifiedImageError):
+                result['error'] = "The uploaded file is not a supported image."
+            elif error is not None:
+                result['error'] = f"An error occurred during prediction: {error}"
+            else:
+                decoded.append((result, img_array))
+
+        try:
+            with timed('inference'):
+                all_scores = predict_scores_batch([img_array for _, img_array in decoded]) if decoded else []
+        except TimeoutError:
+            return Response({"error": "Prediction timed out. Please try again."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except JobServerUnavailable:
+            return Response({"error": "The inference service is unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except ModelNotReady:
+            return Response({"error": "Model or labels not loaded properly."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            return Response({"error": f"An error occurred during prediction: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        user_skin_type = get_skin_type(request.user)
+        with timed('postprocess'):
+            all_predictions = top_predictions(np.stack(all_scores), labels) if decoded else []
+        diagnoses = []
+        for (result, _), predictions in zip(decoded, all_predictions):
+            response_data = prediction_response(predictions, user_skin_type)
+            if response_data is None:
+                result['prediction'] = NO_DIAGNOSIS_MESSAGE
+                continue
+            result.update(response_data)
+            if not is_example:
+                diagnoses.append((result, Diagnosis(user_id=request.user.id, result=stored_result(response_data, user_skin_type))))
+
+        if diagnoses:
+            try:
+                self.save_diagnoses(diagnoses, files_by_index)
+            except Exception as e:
+                for result, _ in diagnoses:
+                    result['error'] = f"The diagnosis could not be saved: {str(e)}"
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def save_diagnoses(self, diagnoses, files_by_index):
+        if is_deferred():
+            with timed('spool'):
+                for result, diagnosis in diagnoses:
+                    diagnosis_writer.enqueue(diagnosis.user_id, diagnosis.result, upload=files_by_index[result['index']])
+            return
+        # Files stored before a failed insert are not deleted here: identical
+        # photos share one file, which another request may be about to use.
+        # gc_media removes the ones no row refers to.
+        with timed('image_write'):
+            for result, diagnosis in diagnoses:
+                image_file = files_by_index[result['index']]
+                diagnosis.image.save(image_file.name, image_file, save=False)
+        with timed('db_insert'), transaction.atomic():
+            created = Diagnosis.objects.bulk_create([diagnosis for _, diagnosis in diagnoses])
+            # bulk_create sends no post_save (see api/http_cache.py).
+            user_id = diagnoses[0][1].user_id
+            transaction.on_commit(lambda: bump_version(history_scope(user_id)))
+        for (result, _), diagnosis in zip(diagnoses, created):
+            result['diagnosis_id'] = diagnosis.pk
+
+
+class PredictionJobView(APIView):
+    """
+    Poll an asynchronous prediction job started with `POST /api/predict/` and `async=true`.
+    Its Diagnosis is stored when the job finishes, whether or not it is polled.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        try:
+            job = get_job_queue().get(str(job_id))
+        except JobServerUnavailable:
+            return Response({"error": "The inference service is unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        if job is None or job['meta'].get('user_id') != request.user.id:
+            return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if job['status'] == PENDING:
+            return Response({"job_id": str(job_id), "status": job['status']}, status=status.HTTP_202_ACCEPTED)
+        if job['status'] == FAILED:
+            return Response({"job_id": str(job_id), "status": job['status'], "error": f"An error occurred during prediction: {job['error']}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        try:
+            labels = registry.get_labels()
+        except ModelNotReady:
+            return Response({"error": "Model or labels not loaded properly."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        meta = job['meta']
+        response_data = build_prediction_response(job['scores'], labels, meta['skin_type'])
+        if response_data is None:
+            return Response({"job_id": str(job_id), "status": job['status'], "prediction": NO_DIAGNOSIS_MESSAGE}, status=status.HTTP_200_OK)
+        return Response({"job_id": str(job_id), "status": job['status'], **response_data}, status=status.HTTP_200_OK)
+
+
+class InferenceStatsView(APIView):
+    """
+    Admin endpoint exposing micro-batching, prediction cache, job pool and diagnosis writer metrics.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        stats = batcher.stats()
+        stats['cache'] = prediction_cache.stats()
+        try:
+            stats['jobs'] = get_job_queue().stats()
+        except JobServerUnavailable as e:
+            stats['jobs'] = {'error': str(e)}
+        stats['persistence'] = dict(diagnosis_writer.stats(), mode=settings.DIAGNOSIS_PERSISTENCE['MODE'])
+        return Response(stats, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    """
+    Admin endpoint with the per-stage latency histograms in the Prometheus text format (see api/metrics.py).
+    """
+    permission_classes = [IsAdminUser]
 
-class ExampleImageView(APIView):
     def get(self, request, *args, **kwargs):
-        examples_dir = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'examples')
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ReadinessView(APIView):
+    """
+    Readiness probe: 200 once the inference workers have loaded the model, 503
+    otherwise, including while the workers start or are all busy.
+    """
+    authentication_classes = []
+    permission_classes = []
+    status_timeout = 2
+
+    def get(self, request, *args, **kwargs):
+        try:
+            model_status = get_job_queue().status(timeout=self.status_timeout)
+        except TimeoutError:
+            model_status = {'state': LOADING}
+        except JobServerUnavailable as e:
+            model_status = {'state': 'unavailable', 'error': str(e)}
+        if model_status['state'] == READY:
+            return Response(model_status, status=status.HTTP_200_OK)
+        return Response(model_status, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class ExampleImageView(ConditionalGetMixin, APIView):
+    examples_dir = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'examples')
+
+    def get_version(self):
+        # Adding, removing or renaming a file changes the directory's mtime.
+        try:
+            mtime = os.stat(self.examples_dir).st_mtime_ns
+        except OSError:
+            return 'missing', None
+        return str(mtime), mtime // 10 ** 9
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.list_examples)
+
+    def list_examples(self):
         image_files = []
-        if os.path.exists(examples_dir):
-            for f in os.listdir(examples_dir):
+        if os.path.exists(self.examples_dir):
+            for f in os.listdir(self.examples_dir):
                 if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
                     image_files.append(f)
         return Response({'example_images': image_files}, status=status.HTTP_200_OK)
 
 
 # --- Review Views ---
-from rest_framework.pagination import PageNumberPagination
-
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 6
-    page_size_query_param = 'page_size'
-    max_page_size = 100
 
-class ReviewList(generics.ListAPIView):
-    queryset = Review.objects.all()
+class ReviewList(ConditionalGetMixin, generics.ListAPIView):
+    queryset = Review.objects.select_related('user')
     serializer_class = ReviewSerializer
+    pagination_class = ListPagination
+    cache_pages = True
+
+    def get_version(self):
+        return current_version(REVIEWS)
 
 class ReviewCreate(generics.CreateAPIView):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
 
-class DiagnosisHistoryView(generics.ListAPIView):
+class DiagnosisHistoryView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = DiagnosisSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = HistoryPagination
+    private = True
+
+    def get_version(self):
+        token, modified = current_version(history_scope(self.request.user.id))
+        # Results are expanded with the tips table, which can be edited in place.
+        tips_mtime = tips_catalog.file_mtime()
+        return f'{token}:{tips_mtime}', max(modified, tips_mtime // 10 ** 9)
 
     def get_queryset(self):
-        return Diagnosis.objects.filter(user=self.request.user)
+        return Diagnosis.objects.filter(user_id=self.request.user.id)
 
 class ProfileView(generics.RetrieveUpdateAPIView):
     """
@@ -382,36 +543,40 @@ class ChangePasswordView(generics.UpdateAPIView):
 
 class DiagnosisDetailView(generics.RetrieveDestroyAPIView):
     serializer_class = DiagnosisSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Diagnosis.objects.filter(user=self.request.user)
+        return Diagnosis.objects.filter(user_id=self.request.user.id)
 
 
 # --- Admin Panel ViewSets ---
 from rest_framework import viewsets
-from rest_framework.permissions import IsAdminUser
 
 class UserAdminViewSet(viewsets.ModelViewSet):
     """
     Admin viewset for managing users.
     """
-    queryset = User.objects.all().order_by('-date_joined')
+    queryset = User.objects.select_related('profile').order_by('-date_joined', '-id')
     serializer_class = UserAdminSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = ListPagination
+    cursor_ordering = ('-date_joined', '-id')
 
 class ReviewAdminViewSet(viewsets.ModelViewSet):
     """
     Admin viewset for managing reviews.
     """
-    queryset = Review.objects.all().order_by('-created_at')
+    queryset = Review.objects.select_related('user').order_by('-created_at', '-id')
     serializer_class = ReviewAdminSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = ListPagination
 
 class DiagnosisAdminViewSet(viewsets.ModelViewSet):
     """
     Admin viewset for managing diagnoses.
     """
-    queryset = Diagnosis.objects.all().order_by('-created_at')
+    queryset = Diagnosis.objects.select_related('user').order_by('-created_at', '-id')
     serializer_class = DiagnosisAdminSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = ListPagination
@@ -12,5 +12,16 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_project.settings')
+# Routes predict, history and reviews to the async views (see api/async_views.py).
+os.environ.setdefault('SERVER_INTERFACE', 'asgi')
 
 application = get_asgi_application()
+
+# Start the inference worker pool, which loads the model, before the first request
+# (uvicorn imports this module in each worker process).
+from django.conf import settings  # noqa: E402
+
+if settings.INFERENCE['PRELOAD']:
+    from api.jobs import start_job_queue  # noqa: E402
+
+    start_job_queue()
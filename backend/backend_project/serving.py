@@ -0,0 +1,213 @@
+"""
+Serving topology: how many Gunicorn workers, threads per worker, inference
+worker processes and inference threads to run on this machine.
+
+The model runs in inference worker processes (api/jobs.py): those of
+``run_inference_server`` when ``INFERENCE_JOBS_ADDRESS`` is set, as in
+config/systemd, or else a pool of ``INFERENCE_JOBS_WORKERS`` per web worker.
+The model runtime and NumPy's BLAS each start one thread per core by
+default, so N inference workers on N cores would run N * N threads competing
+for the same cores. The plans below divide the cores instead.
+
+``plan_inference`` is for ``run_inference_server``:
+
+* ``workers``: one per core, but no more than the memory budget holds
+  (``SERVING_INFERENCE_WORKER_MEMORY_MB`` each) after one web worker per core,
+* ``threads``: the cores left per worker, for its model runtime (intra-op
+  threads) and BLAS/OpenMP, so the product never exceeds the core count.
+
+``plan_topology`` is for Gunicorn:
+
+* ``workers``: one per core, but no more than the memory budget holds
+  (``SERVING_WORKER_MEMORY_MB`` each; with the inference server, what its
+  workers take is left out of the budget first),
+* ``inference_threads``: with a pool per web worker, the cores left per pool
+  worker, as above. With the inference server, web workers only pre- and
+  post-process, with one BLAS thread,
+* ``threads``: gthread request threads per worker. Requests wait on the
+  inference workers through the micro-batcher, so the other request threads
+  are there for uploads, decode and database waits,
+* ``affinity``: with ``SERVING_CPU_AFFINITY=1``, worker i is pinned to its
+  own cores (see gunicorn.conf.py), which keeps its caches warm.
+
+Each value can be forced through an environment variable (``SERVING_WORKERS``,
+``SERVING_THREADS``, ``SERVING_INFERENCE_THREADS``,
+``SERVING_INFERENCE_WORKERS``, ``SERVING_CORES``,
+``SERVING_MEMORY_BUDGET_MB``). This module is imported by gunicorn.conf.py
+before Django is set up, so it does not use Django settings.
+"""
+import os
+
+# Resident memory of one process with the Keras backend loaded, measured with bench_serving.
+DEFAULT_INFERENCE_WORKER_MEMORY_MB = 700
+# Resident memory of a web worker without the model (Django, NumPy, Pillow).
+DEFAULT_WORKER_MEMORY_MB = 200
+# Inference workers per web worker when there is no inference server (INFERENCE['JOBS']['WORKERS']).
+DEFAULT_POOL_WORKERS = 2
+# Share of the machine's memory the workers may use when no budget is given;
+# the rest is for Nginx and the database.
+DEFAULT_MEMORY_SHARE = 0.75
+MAX_THREADS_PER_WORKER = 8
+
+# Read by the inference runtimes and BLAS libraries when they start their thread pools.
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+    'TF_NUM_INTRAOP_THREADS', 'INFERENCE_INTRA_OP_THREADS',
+)
+
+
+def _env_int(name, default=None):
+    value = os.environ.get(name, '')
+    return int(value) if value.strip() else default
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def available_cores():
+    """Cores this process may run on: the CPU affinity mask, capped by a cgroup CPU quota."""
+    cores = sorted(os.sched_getaffinity(0))
+    quota = _read_first_line('/sys/fs/cgroup/cpu.max')
+    if quota and not quota.startswith('max'):
+        limit, period = quota.split()
+        cores = cores[:max(1, int(int(limit) / int(period)))]
+    return cores
+
+
+def available_memory_mb():
+    """The cgroup memory limit, or the machine's total memory."""
+    limit = _read_first_line('/sys/fs/cgroup/memory.max')
+    if limit and limit != 'max':
+        return int(limit) // (1024 * 1024)
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemTotal:'):
+                return int(line.split()[1]) // 1024
+    raise RuntimeError('Could not read the total memory from /proc/meminfo.')
+
+
+def thread_env(threads):
+    """Environment variables that size the model runtime and BLAS thread pools of a process."""
+    env = {name: str(threads) for name in THREAD_ENV_VARS}
+    # Batches are a single chain of layers; a second inter-op thread has nothing to run.
+    env['TF_NUM_INTEROP_THREADS'] = env['INFERENCE_INTER_OP_THREADS'] = '1'
+    return env
+
+
+def _memory_budget_mb():
+    return _env_int('SERVING_MEMORY_BUDGET_MB') or int(available_memory_mb() * DEFAULT_MEMORY_SHARE)
+
+
+def _cores():
+    cores = available_cores()
+    forced_cores = _env_int('SERVING_CORES')
+    return cores[:forced_cores] if forced_cores else cores
+
+
+class InferenceTopology:
+    def __init__(self, cores, memory_budget_mb, worker_memory_mb, workers, threads):
+        self.cores = cores
+        self.memory_budget_mb = memory_budget_mb
+        self.worker_memory_mb = worker_memory_mb
+        self.workers = workers
+        self.threads = threads
+
+    @property
+    def memory_mb(self):
+        return self.workers * self.worker_memory_mb
+
+    def thread_env(self):
+        return thread_env(self.threads)
+
+    def describe(self):
+        return (
+            f'{len(self.cores)} cores, {self.memory_budget_mb} MiB budget '
+            f'({self.worker_memory_mb} MiB per worker): {self.workers} inference workers x {self.threads} threads'
+        )
+
+
+def plan_inference(cores=None, memory_budget_mb=None, worker_memory_mb=None, workers=None, threads=None):
+    """The inference server's topology; arguments and ``SERVING_*`` variables override the derived values."""
+    if cores is None:
+        cores = _cores()
+    if memory_budget_mb is None:
+        memory_budget_mb = _memory_budget_mb()
+    if worker_memory_mb is None:
+        worker_memory_mb = _env_int('SERVING_INFERENCE_WORKER_MEMORY_MB', DEFAULT_INFERENCE_WORKER_MEMORY_MB)
+    if workers is None:
+        # What is left after one web worker per core (see plan_topology).
+        inference_budget_mb = memory_budget_mb - len(cores) * DEFAULT_WORKER_MEMORY_MB
+        workers = _env_int('SERVING_INFERENCE_WORKERS') or max(1, min(len(cores), inference_budget_mb // worker_memory_mb))
+    if threads is None:
+        threads = _env_int('SERVING_INFERENCE_THREADS') or max(1, len(cores) // workers)
+    return InferenceTopology(cores, memory_budget_mb, worker_memory_mb, workers, threads)
+
+
+class ServingTopology:
+    def __init__(self, cores, memory_budget_mb, worker_memory_mb, workers, threads, inference_threads, affinity):
+        self.cores = cores
+        self.memory_budget_mb = memory_budget_mb
+        self.worker_memory_mb = worker_memory_mb
+        self.workers = workers
+        self.threads = threads
+        self.inference_threads = inference_threads
+        # One list of core ids per worker slot, or None when workers are not pinned.
+        self.affinity = affinity
+
+    def thread_env(self):
+        """Environment variables that size the model runtime and BLAS thread pools of each worker."""
+        return thread_env(self.inference_threads)
+
+    def describe(self):
+        pinned = ' '.join(','.join(map(str, cores)) for cores in self.affinity) if self.affinity else 'off'
+        return (
+            f'{len(self.cores)} cores, {self.memory_budget_mb} MiB budget '
+            f'({self.worker_memory_mb} MiB per worker): {self.workers} workers x {self.threads} threads, '
+            f'{self.inference_threads} inference threads per worker, affinity {pinned}'
+        )
+
+
+def plan_topology(cores=None, memory_budget_mb=None, worker_memory_mb=None, workers=None, threads=None,
+                  inference_threads=None, affinity=None, inference_server=None, pool_workers=None):
+    """The Gunicorn topology for this machine; arguments and ``SERVING_*`` variables override the derived values."""
+    if cores is None:
+        cores = _cores()
+    if memory_budget_mb is None:
+        memory_budget_mb = _memory_budget_mb()
+    if inference_server is None:
+        inference_server = bool(os.environ.get('INFERENCE_JOBS_ADDRESS'))
+    if pool_workers is None:
+        pool_workers = 0 if inference_server else max(1, _env_int('INFERENCE_JOBS_WORKERS', DEFAULT_POOL_WORKERS))
+    web_budget_mb = memory_budget_mb
+    if inference_server:
+        web_budget_mb = max(0, memory_budget_mb - plan_inference(cores, memory_budget_mb).memory_mb)
+    if worker_memory_mb is None:
+        # A web worker without the server also holds its pool's inference workers.
+        default = DEFAULT_WORKER_MEMORY_MB + pool_workers * DEFAULT_INFERENCE_WORKER_MEMORY_MB
+        worker_memory_mb = _env_int('SERVING_WORKER_MEMORY_MB', default)
+    if workers is None:
+        workers = _env_int('SERVING_WORKERS') or max(1, min(len(cores), web_budget_mb // worker_memory_mb))
+    if inference_threads is None:
+        if inference_server:
+            # Only pre- and post-processing; the inference server is sized by plan_inference.
+            inference_threads = 1
+        else:
+            inference_threads = _env_int('SERVING_INFERENCE_THREADS') or max(1, len(cores) // (workers * pool_workers))
+    if threads is None:
+        # The batcher thread keeps the inference threads busy; two request threads per
+        # inference thread, plus two, cover requests waiting on uploads or the database.
+        threads = _env_int('SERVING_THREADS') or min(MAX_THREADS_PER_WORKER, 2 * inference_threads + 2)
+    if affinity is None:
+        affinity = _env_int('SERVING_CPU_AFFINITY', 0) == 1
+
+    slots = None
+    # A pinned web worker's pool workers inherit its cores.
+    worker_cores = inference_threads * max(1, pool_workers)
+    if affinity and workers * worker_cores <= len(cores):
+        slots = [cores[i * worker_cores:(i + 1) * worker_cores] for i in range(workers)]
+    return ServingTopology(cores, memory_budget_mb, worker_memory_mb, workers, threads, inference_threads, slots)
@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its total covers the rest of the stack.
+    'api.metrics.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -87,12 +89,58 @@ WSGI_APPLICATION = 'backend_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE=postgresql 이면 PostgreSQL, 그 외에는 단일 서버용 SQLite(WAL)를 사용합니다.
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'ai_skin_lab'),
+            'USER': os.environ.get('DATABASE_USER', 'ai_skin_lab'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            # Persistent connections, checked before reuse.
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DATABASE_POOL_MAX_SIZE'):
+        # psycopg connection pool per worker process (requires psycopg[pool]).
+        # Replaces persistent connections, which Django does not allow together with a pool.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', '1')),
+            'max_size': int(os.environ['DATABASE_POOL_MAX_SIZE']),
+            'timeout': 10,
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            # Keep connections (and their PRAGMAs and page cache) across requests.
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', '60')),
+            'OPTIONS': {
+                # WAL lets readers run while one writer commits. synchronous=NORMAL only fsyncs at
+                # checkpoints, which is safe in WAL mode. Writers wait up to 5 s for the lock
+                # instead of failing with "database is locked".
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=134217728;'
+                    'PRAGMA busy_timeout=5000;'
+                    'PRAGMA cache_size=-20000;'
+                ),
+                # Take the write lock at BEGIN, so a transaction cannot fail halfway
+                # when upgrading from a read lock to a write lock.
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 5,
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -134,6 +182,37 @@ STATIC_URL = '/django-static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 업로드는 해시를 계산하며 임시 파일로 바로 기록됩니다 (api/upload_handlers.py).
+# 임시 디렉터리를 MEDIA_ROOT와 같은 파일시스템에 두어 저장 시 복사 대신 이동하도록 합니다.
+FILE_UPLOAD_HANDLERS = ['api.upload_handlers.HashingImageUploadHandler']
+# Created by api/apps.py at startup.
+FILE_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'uploads_tmp')
+# nginx client_max_body_size와 동일
+UPLOAD_MAX_IMAGE_BYTES = 20 * 1024 * 1024
+# Unreferenced diagnosis images younger than this are kept: a prediction
+# may be about to insert the row that uses them (see api/storage.py).
+MEDIA_GRACE_SECONDS = 60 * 60
+
+# 진단 기록 목록에 쓰이는 축소 이미지 (see api/thumbnails.py).
+THUMBNAILS = {
+    # name: (max width, max height); the aspect ratio is kept.
+    'SIZES': {
+        'thumbnail': (160, 160),
+        'medium': (640, 640),
+    },
+    'FORMAT': 'WEBP',  # or 'JPEG'
+    'QUALITY': 80,
+    # Under MEDIA_ROOT.
+    'DIRECTORY': 'derivatives',
+}
+
+# 진단 결과와 함께 보여주는 스킨케어 팁 (see api/tips.py).
+TIPS = {
+    'PATH': os.path.join(BASE_DIR, 'api', 'data', 'skincare_tips.json'),
+    # How often to check the file's mtime; edits are picked up without a restart.
+    'RELOAD_CHECK_SECONDS': 2.0,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -157,6 +236,163 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
+# 토큰 클레임 기반 인증 (see api/authentication.py).
+AUTH_PRINCIPAL = {
+    'CACHE_ALIAS': 'auth',
+    # Tokens without the skin_type claim load the user once per this many seconds.
+    'TTL_SECONDS': 300,
+}
+
+# ETag/Last-Modified 조건부 요청 (see api/http_cache.py).
+HTTP_CACHE = {
+    'CACHE_ALIAS': 'http',
+    # Rendered review pages; a new review makes them misses right away.
+    'PAGE_TTL_SECONDS': 300,
+}
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Changed users for ClaimsJWTAuthentication (see api/authentication.py). Shared by all workers,
+    # so a profile change made through one worker is seen by the others. Sized so that culling
+    # is rare: a lost entry is safe, but costs a query for tokens issued before that user's last change.
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'auth'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # Version counters and cached review pages for conditional GET (see api/http_cache.py).
+    'http': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'http'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'predictions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'predictions'),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# AI inference settings
+INFERENCE = {
+    # One of 'keras', 'onnx', 'tflite', 'numpy' (see api/backends.py). ONNX and TFLite files are
+    # created with `python manage.py export_model --format onnx|tflite`.
+    'BACKEND': 'keras',
+    'MODEL_DIR': os.path.join(BASE_DIR, 'model'),
+    'LABELS_PATH': os.path.join(BASE_DIR, 'model', 'labels.txt'),
+    # Start the inference worker pool (which loads the model) when a web worker starts
+    # instead of on the first prediction. See api/jobs.py and gunicorn.conf.py. In
+    # run_inference_server, a 'numpy' model is also loaded once before the workers
+    # are forked, so they share one copy of the weights.
+    'PRELOAD': os.environ.get('INFERENCE_PRELOAD', '1') == '1',
+    # Threads per worker for the model runtime; 0 leaves it to the runtime (one per core).
+    # run_inference_server and gunicorn.conf.py set these from the serving topology
+    # (see backend_project/serving.py).
+    'INTRA_OP_THREADS': int(os.environ.get('INFERENCE_INTRA_OP_THREADS', '0')),
+    'INTER_OP_THREADS': int(os.environ.get('INFERENCE_INTER_OP_THREADS', '0')),
+    # Uploads that decode to more pixels than this are rejected with 413 (see api/preprocessing.py).
+    'MAX_IMAGE_PIXELS': 50 * 1000 * 1000,
+    # POST /api/predict/batch/: images per request, and threads decoding them in parallel.
+    'BATCH_UPLOAD_MAX_IMAGES': 10,
+    'PREPROCESS_WORKERS': 4,
+    # Dynamic micro-batching: concurrent predictions are flushed as one batch once
+    # BATCH_MAX_SIZE rows are queued or the oldest row has waited BATCH_MAX_WAIT_MS.
+    'BATCH_MAX_SIZE': 16,
+    'BATCH_MAX_WAIT_MS': 10,
+    # Requests beyond this many pending rows are rejected with 503.
+    'QUEUE_MAX_SIZE': 64,
+    'TIMEOUT_SECONDS': 30,
+    # Which labels are shown (see api/postprocessing.py): at most TOP_K, each above
+    # THRESHOLD_PERCENT, after temperature scaling of the scores (1.0 = off).
+    'POSTPROCESSING': {
+        'TOP_K': 3,
+        'THRESHOLD_PERCENT': 10.0,
+        'TEMPERATURE': 1.0,
+    },
+    # Scores cached by image content + model version (see api/prediction_cache.py).
+    'CACHE': {
+        'MAX_ENTRIES': 1024,
+        'TTL_SECONDS': 60 * 60,
+        # Django cache alias for a tier shared by all workers, e.g. 'predictions'. Empty disables it.
+        'SHARED_ALIAS': os.environ.get('INFERENCE_CACHE_SHARED_ALIAS', ''),
+    },
+    # Worker processes that hold the model and run every prediction, synchronous or
+    # `async=true` (see api/jobs.py). The batcher keeps up to WORKERS batches in flight.
+    'JOBS': {
+        # Pool size in each web worker without ADDRESS; run_inference_server sizes its own pool.
+        'WORKERS': int(os.environ.get('INFERENCE_JOBS_WORKERS', '2')),
+        # Unix socket of `python manage.py run_inference_server`. When empty, each web
+        # worker runs its own pool and job ids are only visible to that worker.
+        'ADDRESS': os.environ.get('INFERENCE_JOBS_ADDRESS', ''),
+        'MAX_PENDING': 256,
+        'RESULT_TTL_SECONDS': 600,
+    },
+}
+
+# Diagnosis 저장 방식 (see api/persistence.py).
+# 'deferred': 예측 응답 후 백그라운드 writer가 스풀 디렉터리에서 배치로 저장합니다.
+# 'sync': 요청 처리 중에 바로 저장합니다.
+DIAGNOSIS_PERSISTENCE = {
+    'MODE': os.environ.get('DIAGNOSIS_PERSISTENCE_MODE', 'deferred'),
+    # Must be on the same filesystem as FILE_UPLOAD_TEMP_DIR and MEDIA_ROOT so uploads are moved, not copied.
+    'SPOOL_DIR': os.path.join(BASE_DIR, 'spool', 'diagnoses'),
+    'BATCH_SIZE': 100,
+    # Upper bound (roughly) on how long a deferred diagnosis takes to show up in the history.
+    'FLUSH_INTERVAL_SECONDS': 1.0,
+}
+
+# ASGI 서빙 (see backend_project/asgi.py and api/async_views.py).
+ASYNC_SERVING = {
+    # asgi.py sets SERVER_INTERFACE=asgi: predict, history and reviews then use the async views.
+    'ENABLED': os.environ.get('SERVER_INTERFACE') == 'asgi',
+    # Threads for blocking work in async views (multipart parsing, image decode).
+    'EXECUTOR_WORKERS': int(os.environ.get('ASYNC_EXECUTOR_WORKERS', '4')),
+    # Blocking calls waiting for or running on those threads; more are rejected with 503.
+    'MAX_PENDING': 256,
+}
+
+# 단계별 처리 시간 히스토그램 (see api/metrics.py). /api/metrics/ 에서 Prometheus 형식으로 조회합니다.
+METRICS = {
+    # Add a Server-Timing header with the stage durations to every API response.
+    'SERVER_TIMING': True,
+    # Histogram bucket upper bounds, in seconds.
+    'BUCKETS': (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    # Shared by all worker processes so /api/metrics/ reports all of them. Empty keeps
+    # the histograms per process. Clear it when the server restarts.
+    'DIRECTORY': os.environ.get('METRICS_DIR', ''),
+    'FLUSH_INTERVAL_SECONDS': 5.0,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            # Printed once by the handler above, not again by the root logger's.
+            'propagate': False,
+        },
+    },
+}
+
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
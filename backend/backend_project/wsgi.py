@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_project.settings')
 
 application = get_wsgi_application()
+
+# The model is loaded by the inference worker pool (api/jobs.py), not here: under
+# `gunicorn --preload` this runs in the master. gunicorn.conf.py starts each
+# worker's pool instead; other servers start it on the first prediction.
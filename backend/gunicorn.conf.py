@@ -0,0 +1,61 @@
+"""
+Gunicorn settings, sized for this machine by backend_project/serving.py.
+
+    gunicorn -c gunicorn.conf.py backend_project.wsgi:application
+
+Command-line options still take precedence, e.g. ``--bind`` in
+config/systemd/gunicorn.service.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend_project.serving import plan_topology  # noqa: E402
+
+topology = plan_topology()
+
+# Web workers do not load the model. With INFERENCE_JOBS_ADDRESS it runs in
+# run_inference_server, which sizes itself (plan_inference), and these give the web
+# workers one BLAS thread. Without it each web worker runs its own inference pool,
+# whose spawned workers inherit these variables and size their thread pools from them.
+for _name, _value in topology.thread_env().items():
+    os.environ.setdefault(_name, _value)
+
+wsgi_app = 'backend_project.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', 'unix:/run/gunicorn/gunicorn.sock')
+workers = topology.workers
+worker_class = 'gthread'
+threads = topology.threads
+preload_app = True
+timeout = 300
+accesslog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    server.log.info('Serving topology: %s', topology.describe())
+
+
+def pre_fork(server, worker):
+    # The lowest CPU slot not held by a running worker, so a restarted worker takes over its predecessor's cores.
+    taken = {getattr(other, 'cpu_slot', None) for other in server.WORKERS.values()}
+    worker.cpu_slot = min(slot for slot in range(len(server.WORKERS) + 1) if slot not in taken)
+
+
+def post_worker_init(worker):
+    # The application is loaded (in the master with preload_app); start this worker's
+    # inference pool so its first prediction does not wait for the model.
+    from django.conf import settings
+
+    if settings.INFERENCE['PRELOAD']:
+        from api.jobs import start_job_queue
+
+        start_job_queue()
+
+
+def post_fork(server, worker):
+    if topology.affinity and worker.cpu_slot < len(topology.affinity):
+        cores = topology.affinity[worker.cpu_slot]
+        os.sched_setaffinity(0, cores)
+        server.log.info('Worker %s pinned to cores %s', worker.pid, ','.join(map(str, cores)))
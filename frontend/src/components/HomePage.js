@@ -17,7 +17,7 @@ function HomePage() {
   const fetchReviews = useCallback(async () => {
     try {
       const response = await axios.get('/reviews/');
-      setReviews(response.data);
+      setReviews(response.data.results);
     } catch (err) {
       setError('후기를 불러오는 데 실패했습니다.');
       console.error('Fetch reviews error:', err);
@@ -79,7 +79,7 @@ function MyPage() {
             {history.map((item) => (
               <Col md={6} lg={4} key={item.id} className="mb-4">
                 <Card>
-                  <Card.Img variant="top" src={item.image} />
+                  <Card.Img variant="top" src={item.medium || item.image} />
                   <Card.Body>
                     <Card.Title>진단 일시</Card.Title>
                     <Card.Text>{new Date(item.created_at).toLocaleString()}</Card.Text>
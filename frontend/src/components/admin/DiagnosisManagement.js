@@ -7,6 +7,7 @@ const DiagnosisManagement = () => {
   const [diagnoses, setDiagnoses] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+  const [nextPage, setNextPage] = useState(null);
   const [showModal, setShowModal] = useState(false);
   const [diagnosisToDelete, setDiagnosisToDelete] = useState(null);
 
@@ -14,7 +15,8 @@ const DiagnosisManagement = () => {
     setLoading(true);
     try {
       const response = await axios.get('/admin/diagnoses/');
-      setDiagnoses(response.data);
+      setDiagnoses(response.data.results);
+      setNextPage(response.data.next);
     } catch (err) {
       setError('진단 기록 목록을 불러오는 데 실패했습니다.');
       console.error('Fetch diagnoses error:', err);
@@ -23,6 +25,18 @@ const DiagnosisManagement = () => {
     }
   };
 
+  // Lists are cursor-paginated; 'next' is the URL of the following page.
+  const fetchMoreDiagnoses = async () => {
+    try {
+      const response = await axios.get(nextPage);
+      setDiagnoses((prev) => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (err) {
+      toast.error('목록을 더 불러오지 못했습니다.');
+      console.error('Fetch more diagnoses error:', err);
+    }
+  };
+
   useEffect(() => {
     fetchDiagnoses();
   }, []);
@@ -80,7 +94,7 @@ const DiagnosisManagement = () => {
               <td>{diagnosis.user.username}</td>
               <td>
 		<a href={diagnosis.image} target="_blank" rel="noopener noreferrer">
-                  <Image src={diagnosis.image} thumbnail width="100" />
+                  <Image src={diagnosis.thumbnail || diagnosis.image} thumbnail width="100" />
 		</a>
               </td>
               <td>
@@ -99,6 +113,11 @@ const DiagnosisManagement = () => {
           ))}
         </tbody>
       </Table>
+      {nextPage && (
+        <div className="text-center mb-4">
+          <Button variant="outline-primary" onClick={fetchMoreDiagnoses}>더 보기</Button>
+        </div>
+      )}
 
       <Modal show={showModal} onHide={closeDeleteModal}>
         <Modal.Header closeButton>
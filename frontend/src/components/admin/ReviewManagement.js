@@ -7,6 +7,7 @@ const ReviewManagement = () => {
   const [reviews, setReviews] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+  const [nextPage, setNextPage] = useState(null);
   const [showModal, setShowModal] = useState(false);
   const [reviewToDelete, setReviewToDelete] = useState(null);
 
@@ -14,7 +15,8 @@ const ReviewManagement = () => {
     setLoading(true);
     try {
       const response = await axios.get('/admin/reviews/');
-      setReviews(response.data);
+      setReviews(response.data.results);
+      setNextPage(response.data.next);
     } catch (err) {
       setError('리뷰 목록을 불러오는 데 실패했습니다.');
       console.error('Fetch reviews error:', err);
@@ -23,6 +25,18 @@ const ReviewManagement = () => {
     }
   };
 
+  // Lists are cursor-paginated; 'next' is the URL of the following page.
+  const fetchMoreReviews = async () => {
+    try {
+      const response = await axios.get(nextPage);
+      setReviews((prev) => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (err) {
+      toast.error('목록을 더 불러오지 못했습니다.');
+      console.error('Fetch more reviews error:', err);
+    }
+  };
+
   useEffect(() => {
     fetchReviews();
   }, []);
@@ -90,6 +104,11 @@ const ReviewManagement = () => {
           ))}
         </tbody>
       </Table>
+      {nextPage && (
+        <div className="text-center mb-4">
+          <Button variant="outline-primary" onClick={fetchMoreReviews}>더 보기</Button>
+        </div>
+      )}
 
       <Modal show={showModal} onHide={closeDeleteModal}>
         <Modal.Header closeButton>
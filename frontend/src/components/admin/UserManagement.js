@@ -7,6 +7,7 @@ const UserManagement = () => {
   const [users, setUsers] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+  const [nextPage, setNextPage] = useState(null);
   const [showModal, setShowModal] = useState(false);
   const [userToDelete, setUserToDelete] = useState(null);
 
@@ -14,7 +15,8 @@ const UserManagement = () => {
     setLoading(true);
     try {
       const response = await axios.get('/admin/users/');
-      setUsers(response.data);
+      setUsers(response.data.results);
+      setNextPage(response.data.next);
     } catch (err) {
       setError('사용자 목록을 불러오는 데 실패했습니다.');
       console.error('Fetch users error:', err);
@@ -23,6 +25,18 @@ const UserManagement = () => {
     }
   };
 
+  // Lists are cursor-paginated; 'next' is the URL of the following page.
+  const fetchMoreUsers = async () => {
+    try {
+      const response = await axios.get(nextPage);
+      setUsers((prev) => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (err) {
+      toast.error('목록을 더 불러오지 못했습니다.');
+      console.error('Fetch more users error:', err);
+    }
+  };
+
   useEffect(() => {
     fetchUsers();
   }, []);
@@ -90,6 +104,11 @@ const UserManagement = () => {
           ))}
         </tbody>
       </Table>
+      {nextPage && (
+        <div className="text-center mb-4">
+          <Button variant="outline-primary" onClick={fetchMoreUsers}>더 보기</Button>
+        </div>
+      )}
 
       <Modal show={showModal} onHide={closeDeleteModal}>
         <Modal.Header closeButton>